@@ -0,0 +1,192 @@
+# api/aio.py
+"""
+Async database access for the ASGI code path (api/async_views.py).
+
+On Postgres statements go through psycopg's AsyncConnection, opened with the
+parameters and type adapters of Django's own connection and with client-side
+binding like Django's cursors, so the same SQL / %s params run on both paths
+and rows come back exactly as the sync views see them:
+
+    rows = await aio.fetch("SELECT * FROM subjects WHERE enrollment_id = %s", [eid])
+    page, digest = await aio.fetch_all([(page_sql, params), (digest_sql, digest_params)])
+
+fetch_all() runs its statements concurrently, each on its own connection, so
+a request waits for its slowest query rather than the sum of them. stream()
+reads a large result in batches through a server-side cursor:
+
+    async for columns, rows in aio.stream("SELECT * FROM subjects", [], 2000):
+        ...
+Connections come from one psycopg_pool AsyncConnectionPool per event loop,
+sized like the sync pool (settings.DB_POOL_OPTIONS) and checked on checkout;
+its stats and checkout waits are reported by api/dbpool.py.
+
+Other backends (SQLite in dev) have no async driver: statements run one after
+another through Django's connection in the request's sync thread.
+"""
+import asyncio
+import itertools
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from . import dbpool, statements
+from .rawsql import dictfetchall, iter_batches
+from .timing import current_timer
+
+ALIAS = "default"
+
+# event loop -> AsyncConnectionPool
+_pools = weakref.WeakKeyDictionary()
+
+
+def is_postgres():
+    return connections[ALIAS].vendor == "postgresql"
+
+
+def connect_kwargs():
+    """
+    psycopg connect() arguments of the Django connection (test database
+    included), minus its sync cursor class.
+    """
+    params = connections[ALIAS].get_connection_params()
+    params.pop("cursor_factory", None)
+    return params
+
+
+def pools():
+    """
+    The async pools of this process (one per event loop that used one).
+    """
+    return list(_pools.values())
+
+
+async def get_pool():
+    import psycopg
+    from psycopg_pool import AsyncConnectionPool
+
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = AsyncConnectionPool(
+            kwargs={**connect_kwargs(), "autocommit": True, "cursor_factory": psycopg.AsyncClientCursor},
+            open=False,
+            check=AsyncConnectionPool.check_connection,
+            **{"name": "async", **getattr(settings, "DB_POOL_OPTIONS", {})},
+        )
+        _pools[loop] = pool
+    if pool.closed:
+        # concurrent first requests all wait here; open() is idempotent
+        await pool.open()
+    return pool
+
+
+@asynccontextmanager
+async def connection():
+    """
+    An autocommit AsyncConnection checked out of this event loop's pool.
+    """
+    pool = await get_pool()
+    start = time.perf_counter()
+    async with pool.connection() as conn:
+        dbpool.observe_wait("async", time.perf_counter() - start)
+        yield conn
+
+
+async def close_pool():
+    """
+    Close this event loop's pool (tests, shutdown).
+    """
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.close()
+
+
+async def _run(sql, params, prepared):
+    async with connection() as conn:
+        prepare = prepared and statements.enabled("postgresql")
+        async with (statements.acursor(conn) if prepare else conn.cursor()) as cur:
+            await cur.execute(sql, params)
+            columns = [c.name for c in cur.description] if cur.description else []
+            return [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+
+def _run_sync(sql, params):
+    # counted by the request timer's execute_wrapper in this thread
+    with connections[ALIAS].cursor() as cur:
+        cur.execute(sql, params)
+        return dictfetchall(cur)
+
+
+async def fetch_all(queries, prepared=False):
+    """
+    Run independent (sql, params) statements and return one list of row
+    dicts per statement, in order. `prepared`: as prepared statements
+    (api/statements.py), for fixed statement texts.
+    """
+    if not is_postgres():
+        run = sync_to_async(_run_sync)
+        return [await run(sql, params) for sql, params in queries]
+
+    start = time.perf_counter()
+    try:
+        return list(await asyncio.gather(*(_run(sql, params, prepared) for sql, params in queries)))
+    finally:
+        timer = current_timer()
+        if timer is not None:
+            timer.add_queries(len(queries), time.perf_counter() - start)
+
+
+async def fetch(sql, params=None):
+    return (await fetch_all([(sql, params or [])]))[0]
+
+
+_cursor_names = itertools.count(1)
+_server_cursor_class = None
+
+
+def _server_cursor(conn):
+    # client-side binding like Django's named cursors (ServerSideCursor)
+    global _server_cursor_class
+    if _server_cursor_class is None:
+        import psycopg
+        from psycopg.client_cursor import ClientCursorMixin
+
+        class AsyncServerSideCursor(ClientCursorMixin, psycopg.AsyncServerCursor):
+            pass
+
+        _server_cursor_class = AsyncServerSideCursor
+    return _server_cursor_class(conn, f"_aio_stream_{next(_cursor_names)}")
+
+
+async def stream(sql, params=None, batch_size=2000):
+    """
+    Async counterpart of rawsql.iter_batches(): yield (columns, rows) one
+    fetchmany() batch at a time. On Postgres the rows come from a server-side
+    cursor in a transaction on a pooled connection, held until the generator
+    is exhausted or closed; elsewhere iter_batches() is advanced in the
+    request's sync thread.
+    """
+    if not is_postgres():
+        batches = iter_batches(sql, params, batch_size=batch_size)
+        step = sync_to_async(next)
+        try:
+            while (batch := await step(batches, None)) is not None:
+                yield batch
+        finally:
+            await sync_to_async(batches.close)()
+        return
+
+    start = time.perf_counter()
+    async with connection() as conn, conn.transaction():
+        async with _server_cursor(conn) as cur:
+            await cur.execute(sql, params or [])
+            columns = [c.name for c in cur.description] if cur.description else []
+            timer = current_timer()
+            if timer is not None:
+                timer.add_queries(1, time.perf_counter() - start)
+            while rows := await cur.fetchmany(batch_size):
+                yield columns, rows
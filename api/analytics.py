@@ -0,0 +1,237 @@
+# api/analytics.py
+"""
+Cohort distributions of subject percentages.
+
+GET /api/analytics/cohort/ groups `subjects` rows (joined to `enrollments`
+for the cohort columns) by academic_year / grade / school / subject and
+reports, for the current and the predicted percentage of every group:
+
+    count, mean, p10, median, p90      (percentile_cont, linear interpolation)
+    histogram                          (`bins` equal-width bins over 0..100)
+    bands                              (counts of current_sub_grade / predicted_sub_grade)
+
+On Postgres this is one statement: a GROUP BY computing the percentiles,
+UNION ALL a GROUPING SETS aggregate counting the histogram bins
+(width_bucket) and grade bands, so only the group rows leave the database.
+Other backends (SQLite in dev) fetch the joined rows and compute the same
+numbers in Python.
+
+Reports are cached in the "api" cache under the table versions of
+`subjects` and `enrollments` (api/cache.py), so repeated dashboard loads
+never rescan the tables; `manage.py invalidate_api_cache --table subjects`
+after a reload starts over. API_ANALYTICS_TTL bounds how long a report
+lives otherwise (per-enrollment invalidations don't reach it).
+"""
+import hashlib
+import math
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+
+from . import cache as api_cache
+from .rawsql import dictfetchall
+
+SOURCE_TABLES = ("subjects", "enrollments")
+CACHE_RESOURCE = "analytics_cohort"
+
+# group / filter name -> column of the joined rows
+DIMENSIONS = {
+    "academic_year": "e.academic_year",
+    "grade": "e.grade",
+    "school": "e.school",
+    "subject": "s.subject",
+}
+# metric -> (percentage column, grade band column)
+METRICS = {
+    "current": ("current_sub_pct", "current_sub_grade"),
+    "predicted": ("predicted_sub_pct", "predicted_sub_grade"),
+}
+QUANTILES = (("p10", 0.1), ("median", 0.5), ("p90", 0.9))
+DEFAULT_BINS = 10
+MAX_BINS = 100
+
+_FROM_SQL = "FROM subjects s JOIN enrollments e ON e.enrollment_id = s.enrollment_id"
+
+
+# -------------------- shared helpers --------------------
+def bin_of(value, bins):
+    """
+    1-based histogram bin of a percentage: width_bucket(value, 0, 100, bins)
+    with values outside 0..100 folded into the first / last bin.
+    """
+    position = math.floor(Decimal(str(value)) * bins / 100) + 1
+    return min(max(position, 1), bins)
+
+
+def _bin_sql(column, bins):
+    return f"LEAST(GREATEST(width_bucket(s.{column}, 0, 100, {int(bins)}), 1), {int(bins)})"
+
+
+def percentile_cont(ordered, fraction):
+    """
+    Postgres' percentile_cont() over an already sorted list.
+    """
+    if not ordered:
+        return None
+    position = fraction * (len(ordered) - 1)
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _rounded(value):
+    return None if value is None else round(float(value), 2)
+
+
+def _where(filters):
+    conditions = [f"{DIMENSIONS[name]} = %s" for name in filters]
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), list(filters.values())
+
+
+def _empty_group(key, group_by, bins):
+    group = dict(zip(group_by, key))
+    group["students"] = 0
+    for metric in METRICS:
+        group[metric] = {
+            "count": 0, "mean": None, **{name: None for name, _ in QUANTILES},
+            "histogram": [0] * bins, "bands": {},
+        }
+    return group
+
+
+def _sort_key(key):
+    return tuple((value is None, value) for value in key)
+
+
+# -------------------- Postgres --------------------
+def _pg_sql(group_by, bins, where):
+    dims = [DIMENSIONS[name] for name in group_by]
+    select = "".join(f"{column} AS {name}, " for name, column in zip(group_by, dims))
+    prefix = "".join(f"{column}, " for column in dims)
+    stats = ", ".join(
+        f"count(s.{pct}) AS {metric}_count, avg(s.{pct}) AS {metric}_mean, "
+        f"percentile_cont(ARRAY[{', '.join(str(f) for _, f in QUANTILES)}]) "
+        f"WITHIN GROUP (ORDER BY s.{pct}::float8) AS {metric}_quantiles"
+        for metric, (pct, _) in METRICS.items()
+    )
+    # one grouping set per counted column; GROUPING() tells them apart
+    counted = []
+    for metric, (pct, band) in METRICS.items():
+        counted.append((f"{metric}_bands", f"s.{band}"))
+        counted.append((f"{metric}_histogram", _bin_sql(pct, bins)))
+    grouping = f"GROUPING({', '.join(expr for _, expr in counted)})"
+    kinds = " ".join(
+        f"WHEN {(1 << len(counted)) - 1 - (1 << (len(counted) - 1 - i))} THEN '{kind}'"
+        for i, (kind, _) in enumerate(counted)
+    )
+    values = ", ".join(f"({expr})::text" for _, expr in counted)
+    sets = ", ".join(f"({prefix}{expr})" for _, expr in counted)
+    nulls = ", ".join(["NULL"] * (3 * len(METRICS)))
+    return (
+        f"SELECT {select}NULL AS counted, NULL AS value, count(*) AS n, {stats} "
+        f"{_FROM_SQL}{where} GROUP BY {', '.join(dims) or '()'} "
+        f"UNION ALL "
+        f"SELECT {select}CASE {grouping} {kinds} END, COALESCE({values}), count(*), {nulls} "
+        f"{_FROM_SQL}{where} GROUP BY GROUPING SETS ({sets})"
+    )
+
+
+def _pg_report(filters, group_by, bins):
+    where, params = _where(filters)
+    with connection.cursor() as cur:
+        cur.execute(_pg_sql(group_by, bins, where), params + params)
+        rows = dictfetchall(cur)
+
+    groups = {}
+    for row in rows:
+        key = tuple(row[name] for name in group_by)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _empty_group(key, group_by, bins)
+        if row["counted"] is None:
+            group["students"] = row["n"]
+            for metric in METRICS:
+                quantiles = row[f"{metric}_quantiles"] or [None] * len(QUANTILES)
+                group[metric].update(count=row[f"{metric}_count"], mean=_rounded(row[f"{metric}_mean"]))
+                group[metric].update({name: _rounded(q) for (name, _), q in zip(QUANTILES, quantiles)})
+        elif row["value"] is not None:
+            metric, kind = row["counted"].rsplit("_", 1)
+            if kind == "histogram":
+                group[metric]["histogram"][int(row["value"]) - 1] = row["n"]
+            else:
+                group[metric]["bands"][row["value"]] = row["n"]
+    return [groups[key] for key in sorted(groups, key=_sort_key)]
+
+
+# -------------------- fallback --------------------
+def _python_report(filters, group_by, bins):
+    where, params = _where(filters)
+    columns = [f"{DIMENSIONS[name]} AS {name}" for name in group_by]
+    for pct, band in METRICS.values():
+        columns += [f"s.{pct} AS {pct}", f"s.{band} AS {band}"]
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT {', '.join(columns)} {_FROM_SQL}{where}", params)
+        rows = dictfetchall(cur)
+
+    members = {}
+    for row in rows:
+        members.setdefault(tuple(row[name] for name in group_by), []).append(row)
+
+    report = []
+    for key in sorted(members, key=_sort_key):
+        group = _empty_group(key, group_by, bins)
+        group["students"] = len(members[key])
+        for metric, (pct, band) in METRICS.items():
+            values = [row[pct] for row in members[key] if row[pct] is not None]
+            out = group[metric]
+            out["count"] = len(values)
+            if values:
+                out["mean"] = _rounded(sum(Decimal(str(v)) for v in values) / len(values))
+                ordered = sorted(float(v) for v in values)
+                out.update({name: _rounded(percentile_cont(ordered, f)) for name, f in QUANTILES})
+            for value in values:
+                out["histogram"][bin_of(value, bins) - 1] += 1
+            for row in members[key]:
+                if row[band] is not None:
+                    out["bands"][row[band]] = out["bands"].get(row[band], 0) + 1
+        report.append(group)
+    return report
+
+
+# -------------------- entry point --------------------
+def compute(filters, group_by, bins=DEFAULT_BINS):
+    """
+    Uncached cohort report: one dict per group, ordered by the group columns.
+    """
+    if connection.vendor == "postgresql":
+        report = _pg_report(filters, group_by, bins)
+    else:
+        report = _python_report(filters, group_by, bins)
+    for group in report:
+        for metric in METRICS:
+            group[metric]["bands"] = dict(sorted(group[metric]["bands"].items()))
+    return report
+
+
+def data_version():
+    return "|".join(api_cache.current_version(table, None) for table in SOURCE_TABLES)
+
+
+def cohort_report(filters, group_by, bins=DEFAULT_BINS):
+    """
+    compute(), cached per (arguments, source table versions).
+    """
+    arguments = repr((sorted(filters.items()), list(group_by), bins))
+    digest = hashlib.md5(f"{data_version()}|{arguments}".encode("utf-8")).hexdigest()
+    key = f"{api_cache.PREFIX}:{CACHE_RESOURCE}:{digest}"
+    cache = api_cache.response_cache()
+
+    report = cache.get(key)
+    if report is not None:
+        api_cache.record(CACHE_RESOURCE, "hit")
+        return report
+    api_cache.record(CACHE_RESOURCE, "miss")
+    report = compute(filters, group_by, bins)
+    cache.set(key, report, timeout=getattr(settings, "API_ANALYTICS_TTL", 3600))
+    return report
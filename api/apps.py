@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_save
+        from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+        from . import blacklist
+
+        post_save.connect(blacklist.blacklisted, sender=BlacklistedToken, dispatch_uid="api.blacklist")
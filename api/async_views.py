@@ -0,0 +1,258 @@
+# api/async_views.py
+"""
+Async read paths of the raw-SQL viewsets and the health check, mounted in
+front of the sync routes when the API runs on ASGI workers (ASYNC_API=true,
+see entrypoint.sh).
+
+Each view builds the same SQL as its sync counterpart (the query methods of
+RawReadOnlyViewSet: search_query(), paginator.prepare(), retrieve_plan(),
+enrollment_query()) and runs it through api/aio.py, so a worker keeps
+serving other requests while one waits on the database. ETags are the
+cache versions (api_cache.version_etag()), so a 304 runs no query at all.
+Bodies are rendered by DRF's JSONRenderer, byte-for-byte what the sync views
+return, and share their response-cache entries (api/cache.py).
+
+/export/ streams its batches from an async server-side cursor
+(aio.stream()): a sync StreamingHttpResponse would be read to the end before
+ASGI sends its first byte.
+
+Otherwise only plain JSON GETs are handled here; other methods,
+?format=csv/ndjson and the browsable API are passed to the sync viewset.
+"""
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import path, re_path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import aio
+from . import cache as api_cache
+from . import projection as api_projection
+from .conditional import etag_matches, etag_salt
+from .search import trgm_available
+from .timing import current_timer, query_budget
+from .views import RawReadOnlyViewSet, export_chunk
+
+RENDERER = JSONRenderer()
+
+
+def json_response(data, status=200, etag=None):
+    timer = current_timer()
+    if timer is not None:
+        timer.render_started = perf_counter()
+    response = HttpResponse(RENDERER.render(data), status=status, content_type=RENDERER.media_type)
+    response["Vary"] = "Accept"
+    if etag:
+        response["ETag"] = etag
+    return response
+
+
+def not_modified(etag):
+    return HttpResponse(status=304, headers={"ETag": etag})
+
+
+def wants_json(request):
+    fmt = request.GET.get("format")
+    if fmt is not None:
+        return fmt == "json"
+    return "text/html" not in request.headers.get("Accept", "")
+
+
+@query_budget(1)
+async def health(request):
+    rows = await aio.fetch("SELECT 1 AS ok")
+    return json_response({"status": "ok", "db": bool(rows and rows[0]["ok"] == 1)})
+
+
+async def fetch_data(query, finish, prepared=False):
+    """
+    Run `query` and return finish(rows), None for a 404. The ETag is known
+    before (api_cache.version_etag()), so a 304 never gets here.
+    """
+    (rows,) = await aio.fetch_all([query], prepared=prepared)
+    return finish(rows)
+
+
+def data_response(data, etag):
+    if data is None:
+        return json_response({"detail": "Not found"}, status=404)
+    return json_response(data, etag=etag)
+
+
+async def cached(viewset, request, enrollment_id, query):
+    """
+    api_cache.cached_response() for the async views. The cache backends are
+    local (memory / a file on this host), so they are read inline.
+    """
+    table = viewset.table_name
+    etag = api_cache.version_etag(request, table, enrollment_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    key = api_cache.response_key(table, enrollment_id, etag_salt(request))
+    cache = api_cache.response_cache()
+    data = cache.get(key)
+    if data is not None:
+        api_cache.record(table, "hit")
+        return json_response(data, etag=etag)
+
+    api_cache.record(table, "miss")
+    sql, params, finish = query
+    # fixed per-key statement texts (unless projected), as in the sync views
+    data = await fetch_data(
+        (sql, params), lambda rows: viewset.project(finish(rows)), prepared=viewset.projection is None
+    )
+    if data is not None:
+        cache.set(key, data, timeout=getattr(settings, "API_CACHE_TTL", 300))
+    return data_response(data, etag)
+
+
+async def list_rows(viewset, request):
+    q = request.query_params.get("q")
+    if q and aio.is_postgres():
+        # memoised per process; later calls don't touch the database
+        await sync_to_async(trgm_available)()
+    if q:
+        sql, params = viewset.search_query(request, q)
+
+        def finish(rows):
+            return {"next": None, "previous": None, "results": viewset.output_rows(rows)}
+    else:
+        where_sql, params = viewset.get_list_filter(request)
+        paginator = viewset.get_paginator(group_keys=viewset.list_group_keys)
+        sql, params = paginator.prepare(request, viewset.table_name, where_sql, params, viewset.select_list())
+
+        def finish(rows):
+            return paginator.get_paginated_response(viewset.output_rows(paginator.finish(rows))).data
+
+    etag = api_cache.version_etag(request, viewset.table_name)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return data_response(await fetch_data((sql, params), finish), etag)
+
+
+async def retrieve(viewset, request, pk=None):
+    try:
+        enrollment_id, query = viewset.retrieve_plan(pk)
+    except ValueError as e:
+        return json_response({"detail": str(e)}, status=400)
+    return await cached(viewset, request, enrollment_id, query)
+
+
+async def list_by_enrollment(viewset, request, enrollment_id=None):
+    if not enrollment_id:
+        return json_response({"detail": "No enrollment_id provided"}, status=400)
+    return await cached(viewset, request, enrollment_id, viewset.enrollment_query(enrollment_id))
+
+
+async def export(viewset, request):
+    renderers = [cls() for cls in type(viewset).export.kwargs["renderer_classes"]]
+    renderer, _ = DefaultContentNegotiation().select_renderer(request, renderers)
+    if request.query_params.get("q") and aio.is_postgres():
+        await sync_to_async(trgm_available)()
+    sql, params = viewset.export_query(request)
+
+    async def stream():
+        first = True
+        async for columns, rows in aio.stream(sql, params, batch_size=viewset.export_batch_size):
+            yield export_chunk(renderer.format, columns, rows, first)
+            first = False
+
+    return viewset.export_response(renderer, stream())
+
+
+ACTIONS = {"list": list_rows, "retrieve": retrieve, "list_by_enrollment": list_by_enrollment, "export": export}
+
+
+def raw_view(viewset_cls, action):
+    """
+    Async view for one read action of a RawReadOnlyViewSet (GET is open on
+    every raw viewset, see ReadOnlyOrAdmin).
+    """
+    sync_view = viewset_cls.as_view({"get": action})
+    handler = ACTIONS[action]
+
+    @csrf_exempt
+    async def view(request, **kwargs):
+        # export picks CSV / NDJSON itself
+        if request.method != "GET" or (action != "export" and not wants_json(request)):
+            return await sync_to_async(sync_view)(request, **kwargs)
+        viewset = viewset_cls()
+        viewset.request = Request(request)
+        # etag_salt() / cache keys match the sync views' JSON variant
+        viewset.request.accepted_renderer = RENDERER
+        try:
+            if viewset.table_installed is not None:
+                await sync_to_async(viewset.check_table_installed)()
+            if api_projection.requested(viewset.request):
+                # ?fields= whitelist: a catalog query the first time per table
+                await sync_to_async(api_projection.table_columns)(viewset.table_name)
+            return await handler(viewset, viewset.request, **kwargs)
+        except APIException as exc:
+            return json_response({"detail": exc.detail}, status=exc.status_code)
+
+    # read by ServerTimingMiddleware for the view name and query budget
+    view.cls = viewset_cls
+    view.actions = {"get": action}
+    return view
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise that can sit in an async middleware chain: the file lookup is
+    an in-memory dict, so under ASGI only static hits leave the event loop
+    (every other request would otherwise hold a thread for its whole life).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+def urlpatterns(router):
+    """
+    Async routes for the raw viewsets registered on `router`, to be listed
+    before the router's own (batch-get/ stays sync).
+    """
+    patterns = [path("health/", health, name="api-health-async")]
+    for prefix, viewset, basename in router.registry:
+        if not issubclass(viewset, RawReadOnlyViewSet):
+            continue
+        if hasattr(viewset, "list_by_enrollment"):
+            patterns.append(path(
+                f"{prefix}/by-enrollment/<path:enrollment_id>/",
+                raw_view(viewset, "list_by_enrollment"),
+                name=f"{basename}-by-enrollment-async",
+            ))
+        patterns.append(re_path(rf"^{prefix}/$", raw_view(viewset, "list"), name=f"{basename}-list-async"))
+        patterns.append(re_path(rf"^{prefix}/export/$", raw_view(viewset, "export"), name=f"{basename}-export-async"))
+        patterns.append(re_path(
+            rf"^{prefix}/(?P<pk>(?!(?:export|batch-get)/$).+)/$",
+            raw_view(viewset, "retrieve"),
+            name=f"{basename}-detail-async",
+        ))
+    return patterns
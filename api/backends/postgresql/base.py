@@ -0,0 +1,21 @@
+# api/backends/postgresql/base.py
+"""
+Django's Postgres backend, timing checkouts from its connection pool for
+the pool metrics (api/dbpool.py). Selected by settings when DB_POOL is on.
+"""
+from time import perf_counter
+
+from django.db.backends.postgresql import base
+
+from ... import dbpool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        start = perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            dbpool.observe_wait("sync", perf_counter() - start)
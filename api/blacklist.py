@@ -0,0 +1,232 @@
+# api/blacklist.py
+"""
+In-process membership filter for the simplejwt token blacklist.
+
+simplejwt checks every refresh / sliding token against
+token_blacklist_blacklistedtoken with one query per check. Each worker
+instead keeps the blacklisted jtis in memory as
+
+    bloom     Bloom filter over the jtis present at the last full build
+    recent    exact set of the jtis blacklisted since then
+
+A jti in `recent` is blacklisted; one the Bloom filter rejects is not; a Bloom
+hit (TOKEN_BLACKLIST_FALSE_POSITIVE of the clean tokens) is confirmed with
+one query. Normal token checks therefore run no query at all.
+
+The filter is refreshed incrementally: rows past the highest id seen, plus
+those blacklisted within LOOKBACK seconds (ids are handed out before commit,
+so a slow transaction can commit an id below the watermark). Refreshes
+happen when the table's cache version changes (every blacklisting bumps it
+on commit, shared by the workers through the "api_versions" cache) or after
+TOKEN_BLACKLIST_REFRESH seconds. After REBUILD_AFTER seconds, or once
+`recent` outgrows RECENT_LIMIT, the Bloom filter is rebuilt from the table.
+
+The version itself is kept in memory and re-read at most every
+TOKEN_BLACKLIST_VERSION_CHECK seconds, so a check normally touches neither
+the database nor the cache. A "not blacklisted" answer from a filter last
+refreshed more than TOKEN_BLACKLIST_MAX_STALENESS seconds ago refreshes it
+first: a token blacklisted by another worker (whose version bump this one
+hasn't read, or can't see, e.g. on another host) is accepted for at most
+that long.
+"""
+import datetime
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from . import cache as api_cache
+from .models import TokenBlacklistBlacklistedtoken, TokenBlacklistOutstandingtoken
+
+TABLE = TokenBlacklistBlacklistedtoken._meta.db_table
+OUTSTANDING_TABLE = TokenBlacklistOutstandingtoken._meta.db_table
+
+LOOKBACK = 60
+REBUILD_AFTER = 3600
+RECENT_LIMIT = 10000
+MIN_CAPACITY = 1024
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings, sized for `capacity` entries at
+    `error_rate` false positives (double hashing over one blake2b digest).
+    """
+
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class BlacklistIndex:
+    """
+    bloom + recent + the id watermark they were read up to.
+    """
+
+    def __init__(self, rows, error_rate):
+        rows = list(rows)
+        # room to double before the next rebuild keeps the error rate near target
+        self.bloom = BloomFilter(max(MIN_CAPACITY, 2 * len(rows)), error_rate)
+        for _, jti in rows:
+            self.bloom.add(jti)
+        self.recent = set()
+        self.watermark = max((row_id for row_id, _ in rows), default=0)
+        self.built_at = time.monotonic()
+
+    def add(self, rows):
+        for row_id, jti in rows:
+            if jti not in self.bloom:
+                self.recent.add(jti)
+            self.watermark = max(self.watermark, row_id)
+
+    def check(self, jti):
+        """
+        True / False, or None when the Bloom filter can't tell.
+        """
+        if jti in self.recent:
+            return True
+        return None if jti in self.bloom else False
+
+
+_SELECT_SQL = f"SELECT b.id, o.jti FROM {TABLE} b JOIN {OUTSTANDING_TABLE} o ON o.id = b.token_id"
+
+
+def _rows(sql, params=()):
+    with connection.cursor() as cur:
+        cur.execute(sql, params)
+        return [(row_id, jti) for row_id, jti in cur.fetchall() if jti is not None]
+
+
+def _error_rate():
+    return getattr(settings, "TOKEN_BLACKLIST_FALSE_POSITIVE", 0.001)
+
+
+# "index": (index, version it was refreshed at, monotonic refresh time, wall-clock refresh time)
+# "version": (cache version, monotonic time it was read)
+_state = {}
+_lock = threading.Lock()
+
+
+def _current_version():
+    interval = getattr(settings, "TOKEN_BLACKLIST_VERSION_CHECK", 1)
+    entry = _state.get("version")
+    now = time.monotonic()
+    if entry is None or now - entry[1] >= interval:
+        entry = (api_cache.current_version(TABLE, None), now)
+        _state["version"] = entry
+    return entry[0]
+
+
+def _refresh(version):
+    entry = _state.get("index")
+    started = timezone.now()
+    index = None
+    if entry is not None and time.monotonic() - entry[0].built_at < REBUILD_AFTER:
+        index = entry[0]
+        since = entry[3] - datetime.timedelta(seconds=LOOKBACK)
+        index.add(_rows(f"{_SELECT_SQL} WHERE b.id > %s OR b.blacklisted_at >= %s", [index.watermark, since]))
+        if len(index.recent) > RECENT_LIMIT:
+            index = None
+    if index is None:
+        index = BlacklistIndex(_rows(_SELECT_SQL), _error_rate())
+    _state["index"] = (index, version, time.monotonic(), started)
+    return index
+
+
+def get_index(max_age=None):
+    """
+    The current BlacklistIndex, refreshed first if it is stale or was
+    refreshed more than `max_age` seconds ago.
+    """
+    version = _current_version()
+    ttl = getattr(settings, "TOKEN_BLACKLIST_REFRESH", 30)
+    if max_age is not None:
+        ttl = min(ttl, max_age)
+    entry = _state.get("index")
+    if entry is not None and entry[1] == version and time.monotonic() - entry[2] < ttl:
+        return entry[0]
+    with _lock:
+        entry = _state.get("index")
+        if entry is None or entry[1] != version or time.monotonic() - entry[2] >= ttl:
+            return _refresh(version)
+    return entry[0]
+
+
+def reset():
+    """
+    Drop the worker-local index (tests).
+    """
+    _state.clear()
+
+
+def is_blacklisted(jti):
+    answer = get_index().check(jti)
+    if answer is False:
+        # bound how long a blacklisting this worker hasn't heard of can go unseen
+        answer = get_index(getattr(settings, "TOKEN_BLACKLIST_MAX_STALENESS", 5)).check(jti)
+    if answer is None:
+        with connection.cursor() as cur:
+            cur.execute(f"{_SELECT_SQL} WHERE o.jti = %s LIMIT 1", [jti])
+            answer = cur.fetchone() is not None
+    return answer
+
+
+def blacklisted(sender, instance, created, **kwargs):
+    # post_save of simplejwt's BlacklistedToken (connected in ApiConfig.ready)
+    if created:
+        transaction.on_commit(_bump, using=kwargs.get("using"))
+
+
+def _bump():
+    api_cache.bump_version(TABLE)
+    # this worker sees its own blacklistings right away
+    _state.pop("version", None)
+
+
+# -------------------- simplejwt hooks --------------------
+class CheckedBlacklistMixin:
+    def check_blacklist(self):
+        if is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError("Token is blacklisted")
+
+
+class RefreshToken(CheckedBlacklistMixin, tokens.RefreshToken):
+    pass
+
+
+class SlidingToken(CheckedBlacklistMixin, tokens.SlidingToken):
+    pass
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+
+class TokenRefreshSlidingSerializer(jwt_serializers.TokenRefreshSlidingSerializer):
+    token_class = SlidingToken
+
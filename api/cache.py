@@ -0,0 +1,223 @@
+# api/cache.py
+"""
+Per-enrollment response cache for the raw viewsets.
+
+Responses are stored in the "api" cache alias (local memory by default, which
+Django evicts LRU once MAX_ENTRIES is reached) under keys that embed three
+version counters:
+
+    global version  -> bumped to drop everything
+    table version   -> bumped when an ETL reload replaces a table
+    enrollment ver. -> bumped when one student's rows change
+
+Bumping a counter makes every older key unreachable; stale entries then age
+out through TTL / LRU. The same counters are the ETags of the raw viewsets'
+responses (version_etag()), so a conditional GET is answered without
+reading any row, and a 200 doesn't pay for a second, hashing query. The
+counters live in the "api_versions" alias, a CounterFileCache by default,
+so that gunicorn workers and `manage.py invalidate_api_cache` on the same
+host share them. Hit/miss stats are counted in worker memory: they are
+read far less often than they are written, and a lost count costs nothing.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from rest_framework.response import Response
+
+from .conditional import etag_matches, etag_salt, not_modified, quote_digest
+
+PREFIX = "lms"
+
+
+def _digest(value):
+    # enrollment ids / paths may contain characters memcached-style keys reject
+    return hashlib.md5(str(value).encode("utf-8")).hexdigest()
+
+
+def response_cache():
+    return caches[getattr(settings, "API_CACHE_ALIAS", "api")]
+
+
+def version_cache():
+    return caches[getattr(settings, "API_CACHE_VERSION_ALIAS", "api_versions")]
+
+
+def _version_keys(table, enrollment_id):
+    return [
+        f"{PREFIX}:ver",
+        f"{PREFIX}:ver:{table}",
+        f"{PREFIX}:ver:{table}:{_digest(enrollment_id)}",
+    ]
+
+
+class CounterFileCache(FileBasedCache):
+    """
+    FileBasedCache for the version counters. It never culls: a counter
+    dropped to make room would restart at 0 and bring responses cached
+    under an old version back. incr() / add() hold an exclusive lock on a
+    file in the cache directory, so bumps from several processes can't
+    overwrite each other (reads need no lock: entries are replaced by
+    rename).
+    """
+    LOCK_FILE = "counters.lock"
+
+    def _cull(self):
+        pass
+
+    @contextmanager
+    def _locked(self):
+        self._createdir()
+        with open(os.path.join(self._dir, self.LOCK_FILE), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def incr(self, key, delta=1, version=None):
+        with self._locked():
+            return super().incr(key, delta, version)
+
+    def add(self, key, value, timeout=None, version=None):
+        with self._locked():
+            return super().add(key, value, timeout, version)
+
+
+def _rows_key(table):
+    # advanced by every per-enrollment bump of `table`
+    return f"{PREFIX}:ver:{table}:rows"
+
+
+def _incr(cache, key, delta=1):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # key missing: add() is atomic, fall back to incr if another worker won
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def bump_version(table=None, enrollment_id=None):
+    """
+    Invalidate cached responses.
+      bump_version()                      -> everything
+      bump_version("assessments_fa")      -> one table
+      bump_version("assessments_fa", eid) -> one enrollment of one table
+    """
+    keys = _version_keys(table, enrollment_id)
+    if table is None:
+        key = keys[0]
+    elif enrollment_id is None:
+        key = keys[1]
+    else:
+        # pages spanning enrollments (lists, searches) change too
+        _incr(version_cache(), _rows_key(table))
+        key = keys[2]
+    return _incr(version_cache(), key)
+
+
+def current_version(table, enrollment_id):
+    """
+    Combined version string for (table, enrollment_id), e.g. "3.1.0".
+    """
+    keys = _version_keys(table, enrollment_id)
+    found = version_cache().get_many(keys)
+    return ".".join(str(found.get(k, 0)) for k in keys)
+
+
+def rows_version(table):
+    """
+    Combined version of any rows of `table`: like current_version(), but
+    with a counter every per-enrollment bump of the table advances.
+    """
+    keys = _version_keys(table, None)[:2] + [_rows_key(table)]
+    found = version_cache().get_many(keys)
+    return ".".join(str(found.get(k, 0)) for k in keys)
+
+
+def version_etag(request, table, enrollment_id=None):
+    """
+    ETag of a response read from `table` (one enrollment's rows, or any rows
+    with enrollment_id=None) at the current versions. It also rolls over
+    every API_CACHE_TTL seconds: writes that skip bump_version() go unseen
+    for at most as long as cached responses do.
+    """
+    version = rows_version(table) if enrollment_id is None else current_version(table, enrollment_id)
+    ttl = getattr(settings, "API_CACHE_TTL", 300)
+    period = int(time.time() // ttl) if ttl > 0 else 0
+    return quote_digest(f"{version}:{period}", etag_salt(request))
+
+
+# (resource, "hit" | "miss") -> count, of this process
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def record(resource, outcome):
+    with _stats_lock:
+        _stats[(resource, outcome)] += 1
+
+
+def stats(resources):
+    """
+    {resource: {"hits": n, "misses": n, "hit_rate": r}} of this process for
+    the given resources.
+    """
+    with _stats_lock:
+        found = dict(_stats)
+    out = {}
+    for r in resources:
+        hits = found.get((r, "hit"), 0)
+        misses = found.get((r, "miss"), 0)
+        total = hits + misses
+        out[r] = {"hits": hits, "misses": misses, "hit_rate": round(hits / total, 4) if total else None}
+    return out
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def response_key(table, enrollment_id, variant):
+    """
+    Cache key of one response variant (see etag_salt()) at the current versions.
+    """
+    version = current_version(table, enrollment_id)
+    return f"{PREFIX}:resp:{table}:{_digest(enrollment_id)}:{version}:{_digest(variant)}"
+
+
+def cached_response(request, table, enrollment_id, build):
+    """
+    Return a cached Response for (table, enrollment_id, request path) or call
+    build() and cache its data if it is a 200.
+
+    The ETag is version_etag(), so a matching If-None-Match is answered with
+    304 before the cache or the database is read.
+    """
+    etag = version_etag(request, table, enrollment_id)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    key = response_key(table, enrollment_id, etag_salt(request))
+    cache = response_cache()
+
+    data = cache.get(key)
+    if data is not None:
+        record(table, "hit")
+        return Response(data, headers={"ETag": etag})
+
+    record(table, "miss")
+    response = build()
+    if response.status_code == 200:
+        response["ETag"] = etag
+        cache.set(key, response.data, timeout=getattr(settings, "API_CACHE_TTL", 300))
+    return response
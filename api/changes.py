@@ -0,0 +1,384 @@
+# api/changes.py
+"""
+Opt-in change capture for the unmanaged tables, and the feed behind
+GET /api/changes/?since=<token>.
+
+None of the ETL tables carry an updated_at, so `manage.py change_log
+--install` adds triggers that append the composite keys of changed rows to
+`change_log`:
+
+    id          identity, in insertion order
+    table_name  captured table
+    key         JSON array of the KEYS columns' values (NULL for 'T')
+    op          I / U / D, or T when the whole table was replaced (TRUNCATE,
+                `manage.py ingest`): the consumer should re-download it
+    txid        writing transaction (pg_current_xact_id(); 0 on SQLite)
+    changed_at  transaction start
+
+On Postgres the triggers are statement-level with transition tables, so a
+bulk ETL statement costs one INSERT ... SELECT DISTINCT of its keys rather
+than one insert per row; an UPDATE logs the old and the new keys. SQLite (dev)
+gets row-level triggers.
+
+The feed is ordered by (txid, id) and only ever serves transactions older
+than the oldest one still running (the snapshot's xmin). Any change that
+commits later sorts after that horizon, so a token, "<txid>-<id>" of the last
+entry seen, never skips a late commit; a long-running transaction only
+delays the feed. Entries are at-least-once: consumers re-read the listed keys.
+
+    ?since=now        the current head: take it, then do the full download
+    ?since=<token>    the next page after <token> (no ?since: from the start)
+
+`manage.py change_log --prune-days N` deletes old entries and remembers how
+far it got; older tokens get 410 Gone and must re-download.
+"""
+import datetime
+import uuid
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .rawsql import as_list, dictfetchall
+
+TABLE = "change_log"
+PRUNED_TABLE = "change_log_pruned"
+# one row naming this installation: positions of an earlier one mean nothing here
+EPOCH_TABLE = "change_log_epoch"
+FUNCTION = "change_log_capture"
+
+# captured table -> key columns (the raw viewsets' key_columns; enrollments'
+# primary key; AssessmentWeightsViewSet's composite lookup)
+KEYS = {
+    "enrollments": ("enrollment_id",),
+    "subjects": ("enrollment_id", "subject"),
+    "assessments_eol": ("enrollment_id", "subject"),
+    "assessments_fa": ("enrollment_id", "subject", "evaluation_criteria"),
+    "assessments_sa": ("enrollment_id", "subject", "evaluation_criteria"),
+    "assessments_non_academic": ("enrollment_id", "subject", "task_name"),
+    "assessment_weights": ("academic_year", "grade", "term", "assessment_type"),
+    "student_summary": ("enrollment_id",),
+}
+OPS = ("insert", "update", "delete", "truncate")
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+START = (0, 0)
+
+
+class Expired(ValueError):
+    """
+    The token is older than what the log still holds.
+    """
+
+
+# -------------------- tokens --------------------
+def make_token(position):
+    return f"{position[0]}-{position[1]}"
+
+
+def parse_token(token):
+    txid, sep, entry = (token or "").partition("-")
+    if not sep or not txid.isdigit() or not entry.isdigit():
+        raise ValueError(f"Malformed change token {token!r}")
+    return int(txid), int(entry)
+
+
+# -------------------- DDL --------------------
+def _pg_ddl():
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+            id bigint GENERATED ALWAYS AS IDENTITY,
+            table_name text NOT NULL,
+            key jsonb,
+            op char(1) NOT NULL,
+            txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+            changed_at timestamptz NOT NULL DEFAULT now()
+        )""",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_position_idx ON {TABLE} (txid, id)",
+        f"CREATE TABLE IF NOT EXISTS {PRUNED_TABLE} (txid xid8 NOT NULL, id bigint NOT NULL)",
+        f"CREATE TABLE IF NOT EXISTS {EPOCH_TABLE} (epoch text NOT NULL)",
+        f"""CREATE OR REPLACE FUNCTION {FUNCTION}() RETURNS trigger LANGUAGE plpgsql AS $$
+        DECLARE
+            key_sql text;
+        BEGIN
+            IF TG_OP = 'TRUNCATE' THEN
+                INSERT INTO {TABLE} (table_name, key, op) VALUES (TG_TABLE_NAME, NULL, 'T');
+                RETURN NULL;
+            END IF;
+            -- TG_ARGV: the key columns
+            SELECT 'jsonb_build_array(' || string_agg(format('%I', col), ', ') || ')'
+              INTO key_sql FROM unnest(TG_ARGV) AS col;
+            IF TG_OP = 'INSERT' THEN
+                EXECUTE format('INSERT INTO {TABLE} (table_name, key, op) SELECT DISTINCT %L, %s, ''I'' FROM new_rows',
+                               TG_TABLE_NAME, key_sql);
+            ELSIF TG_OP = 'DELETE' THEN
+                EXECUTE format('INSERT INTO {TABLE} (table_name, key, op) SELECT DISTINCT %L, %s, ''D'' FROM old_rows',
+                               TG_TABLE_NAME, key_sql);
+            ELSE
+                EXECUTE format('INSERT INTO {TABLE} (table_name, key, op) SELECT %L, k, ''U'' '
+                               'FROM (SELECT %s AS k FROM old_rows UNION SELECT %s FROM new_rows) changed',
+                               TG_TABLE_NAME, key_sql, key_sql);
+            END IF;
+            RETURN NULL;
+        END
+        $$""",
+    ]
+
+
+def _sqlite_ddl():
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+            id integer PRIMARY KEY AUTOINCREMENT,
+            table_name text NOT NULL,
+            key text,
+            op text NOT NULL,
+            txid integer NOT NULL DEFAULT 0,
+            changed_at text NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        )""",
+        f"CREATE TABLE IF NOT EXISTS {PRUNED_TABLE} (txid integer NOT NULL, id integer NOT NULL)",
+        f"CREATE TABLE IF NOT EXISTS {EPOCH_TABLE} (epoch text NOT NULL)",
+    ]
+
+
+def _trigger_name(table, op):
+    return f"change_log_{table}_{op}"
+
+
+def _pg_triggers(table, keys):
+    qn = connection.ops.quote_name
+    args = ", ".join("'" + column.replace("'", "''") + "'" for column in keys)
+    transitions = {
+        "insert": "REFERENCING NEW TABLE AS new_rows ",
+        "update": "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows ",
+        "delete": "REFERENCING OLD TABLE AS old_rows ",
+        "truncate": "",
+    }
+    return [
+        f"CREATE TRIGGER {_trigger_name(table, op)} AFTER {op.upper()} ON {qn(table)} "
+        f"{transitions[op]}FOR EACH STATEMENT EXECUTE FUNCTION {FUNCTION}({args})"
+        for op in OPS
+    ]
+
+
+def _sqlite_triggers(table, keys):
+    qn = connection.ops.quote_name
+
+    def key(row):
+        return "json_array(" + ", ".join(f"{row}.{qn(column)}" for column in keys) + ")"
+
+    insert = f"INSERT INTO {TABLE} (table_name, key, op)"
+    bodies = {
+        "insert": f"{insert} VALUES ('{table}', {key('NEW')}, 'I');",
+        "update": f"{insert} SELECT '{table}', k, 'U' FROM (SELECT {key('OLD')} AS k UNION SELECT {key('NEW')});",
+        "delete": f"{insert} VALUES ('{table}', {key('OLD')}, 'D');",
+    }
+    return [
+        f"CREATE TRIGGER {_trigger_name(table, op)} AFTER {op.upper()} ON {qn(table)} FOR EACH ROW BEGIN {body} END"
+        for op, body in bodies.items()
+    ]
+
+
+def installed():
+    return TABLE in connection.introspection.table_names()
+
+
+def captured_tables(cur):
+    if connection.vendor == "postgresql":
+        cur.execute(
+            "SELECT DISTINCT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid "
+            "WHERE t.tgname LIKE 'change\\_log\\_%' AND NOT t.tgisinternal"
+        )
+    else:
+        cur.execute("SELECT DISTINCT tbl_name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log_%'")
+    return sorted(row[0] for row in cur.fetchall())
+
+
+def install(tables=None):
+    """
+    Create the log and (re)create the triggers of `tables` (default: every
+    table in KEYS that exists). Returns the captured tables.
+    """
+    tables = list(tables or KEYS)
+    unknown = [table for table in tables if table not in KEYS]
+    if unknown:
+        raise ValueError(f"No key columns for {', '.join(unknown)}. Known: {', '.join(KEYS)}")
+    existing = set(connection.introspection.table_names())
+    postgres = connection.vendor == "postgresql"
+    with transaction.atomic(), connection.cursor() as cur:
+        for stmt in _pg_ddl() if postgres else _sqlite_ddl():
+            cur.execute(stmt)
+        cur.execute(f"SELECT count(*) FROM {EPOCH_TABLE}")
+        if not cur.fetchone()[0]:
+            cur.execute(f"INSERT INTO {EPOCH_TABLE} (epoch) VALUES (%s)", [uuid.uuid4().hex])
+        for table in tables:
+            if table not in existing:
+                continue
+            for op in OPS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {_trigger_name(table, op)}"
+                            + (f" ON {connection.ops.quote_name(table)}" if postgres else ""))
+            for stmt in (_pg_triggers if postgres else _sqlite_triggers)(table, KEYS[table]):
+                cur.execute(stmt)
+        return captured_tables(cur)
+
+
+def uninstall():
+    """
+    Drop every capture trigger, the trigger function and the log.
+    """
+    postgres = connection.vendor == "postgresql"
+    with transaction.atomic(), connection.cursor() as cur:
+        for table in captured_tables(cur):
+            for op in OPS:
+                cur.execute(f"DROP TRIGGER IF EXISTS {_trigger_name(table, op)}"
+                            + (f" ON {connection.ops.quote_name(table)}" if postgres else ""))
+        if postgres:
+            cur.execute(f"DROP FUNCTION IF EXISTS {FUNCTION}()")
+        cur.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        cur.execute(f"DROP TABLE IF EXISTS {PRUNED_TABLE}")
+        cur.execute(f"DROP TABLE IF EXISTS {EPOCH_TABLE}")
+
+
+def epoch(cur):
+    """
+    Id of this installation of the log (None when not installed): tokens are
+    only comparable within one epoch.
+    """
+    if EPOCH_TABLE not in connection.introspection.table_names(cur):
+        return None
+    cur.execute(f"SELECT epoch FROM {EPOCH_TABLE}")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def record_reload(cur, table):
+    """
+    Log that `table` was replaced as a whole (`manage.py ingest` swaps tables
+    without firing their triggers), if it is captured.
+    """
+    if table in captured_tables(cur):
+        cur.execute(f"INSERT INTO {TABLE} (table_name, key, op) VALUES (%s, NULL, 'T')", [table])
+
+
+# -------------------- feed --------------------
+def _position_sql():
+    # (placeholder, param adapter) of a txid: xid8 takes its text form
+    if connection.vendor == "postgresql":
+        return "%s::xid8", str
+    return "%s", int
+
+
+def _horizon(cur):
+    """
+    (head position, pruned position or None) in one statement. Everything
+    at or before the head is final.
+    """
+    if connection.vendor == "postgresql":
+        cur.execute(
+            f"SELECT pg_snapshot_xmin(pg_current_snapshot())::text, "
+            f"(SELECT txid::text || '-' || id FROM {PRUNED_TABLE} LIMIT 1)"
+        )
+        xmin, pruned = cur.fetchone()
+        head = (int(xmin), 0)
+    else:
+        cur.execute(
+            f"SELECT (SELECT coalesce(max(id), 0) FROM {TABLE}), "
+            f"(SELECT txid || '-' || id FROM {PRUNED_TABLE} LIMIT 1)"
+        )
+        last, pruned = cur.fetchone()
+        head = (0, last)
+    return head, (parse_token(pruned) if pruned else None)
+
+
+def head():
+    """
+    Token of the current end of the log.
+    """
+    with connection.cursor() as cur:
+        return make_token(_horizon(cur)[0])
+
+
+def page(since=START, tables=None, limit=DEFAULT_LIMIT):
+    """
+    {"next": token, "has_more": bool, "results": [...]}: the entries after
+    position `since`, oldest first. Raises Expired when entries after `since`
+    may have been pruned.
+    """
+    position, txid = _position_sql()
+    with connection.cursor() as cur:
+        head_position, pruned = _horizon(cur)
+        if pruned is not None and since < pruned:
+            raise Expired(f"Changes up to {make_token(pruned)} were pruned; download everything again")
+
+        sql = (
+            f"SELECT id, table_name, key, op, CAST(txid AS text) AS txid, changed_at FROM {TABLE} "
+            f"WHERE (txid, id) > ({position}, %s) AND (txid, id) <= ({position}, %s)"
+        )
+        params = [txid(since[0]), since[1], txid(head_position[0]), head_position[1]]
+        if tables:
+            sql += f" AND table_name IN ({', '.join(['%s'] * len(tables))})"
+            params += list(tables)
+        sql += " ORDER BY txid, id LIMIT %s"
+        cur.execute(sql, params + [limit + 1])
+        rows = dictfetchall(cur)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        next_position = (int(rows[-1]["txid"]), rows[-1]["id"])
+    else:
+        # nothing else is final yet: resume from the head
+        next_position = max(since, head_position)
+
+    results = []
+    for row in rows:
+        values = as_list(row["key"]) if row["key"] is not None else None
+        results.append({
+            "table": row["table_name"],
+            "op": row["op"],
+            "key": dict(zip(KEYS.get(row["table_name"], ()), values)) if values is not None else None,
+            # the raw viewsets' "~" composite id
+            "pk": "~".join(str(v) for v in values) if values is not None else None,
+            "changed_at": row["changed_at"],
+        })
+    return {"next": make_token(next_position), "has_more": has_more, "results": results}
+
+
+# -------------------- retention --------------------
+def prune(days):
+    """
+    Delete entries older than `days` days (and already final); tokens before
+    the newest deleted entry then get Expired. Returns the number deleted.
+    """
+    cutoff = timezone.now() - datetime.timedelta(days=days)
+    if connection.vendor != "postgresql":
+        # the text changed_at default: UTC, milliseconds
+        cutoff = cutoff.astimezone(datetime.timezone.utc).replace(tzinfo=None).isoformat(" ", "milliseconds")
+    position, txid = _position_sql()
+    with transaction.atomic(), connection.cursor() as cur:
+        head_position, _ = _horizon(cur)
+        cur.execute(
+            f"SELECT CAST(txid AS text), id FROM {TABLE} "
+            f"WHERE changed_at <= %s AND (txid, id) <= ({position}, %s) ORDER BY txid DESC, id DESC LIMIT 1",
+            [cutoff, txid(head_position[0]), head_position[1]],
+        )
+        newest = cur.fetchone()
+        if newest is None:
+            return 0
+        newest = [txid(int(newest[0])), newest[1]]
+        cur.execute(f"DELETE FROM {TABLE} WHERE (txid, id) <= ({position}, %s)", newest)
+        deleted = cur.rowcount
+        cur.execute(f"DELETE FROM {PRUNED_TABLE}")
+        cur.execute(f"INSERT INTO {PRUNED_TABLE} (txid, id) VALUES ({position}, %s)", newest)
+    return deleted
+
+
+def stats():
+    """
+    {"tables": captured tables, "entries": n, "head": token} for --status.
+    """
+    with connection.cursor() as cur:
+        tables = captured_tables(cur)
+        cur.execute(f"SELECT count(*) FROM {TABLE}")
+        entries = cur.fetchone()[0]
+        head_position, _ = _horizon(cur)
+    return {"tables": tables, "entries": entries, "head": make_token(head_position)}
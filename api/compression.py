@@ -0,0 +1,271 @@
+# api/compression.py
+"""
+Content-negotiated response compression.
+
+CompressionMiddleware encodes response bodies with the best codec the client
+accepts (Accept-Encoding, q-values honoured) out of
+
+    zstd   (the `zstandard` package)
+    br     (the `brotli` package)
+    gzip   (always; zlib is in the standard library)
+
+The codecs whose package isn't installed are simply not offered, so gzip works
+everywhere. Bodies under API_COMPRESSION_MIN_SIZE bytes, non-text content
+types, responses that already carry a Content-Encoding (WhiteNoise's
+precompressed static files) and views that opt out are passed through:
+
+    @no_compression
+    @api_view(["GET"])
+    def health(request): ...
+
+    class SomeViewSet(...):
+        compress_response = False
+
+Streaming responses (the /export/ NDJSON/CSV streams) are compressed chunk by
+chunk, with a flush after every chunk so clients still receive rows as they
+are produced. As with Django's GZipMiddleware, a strong ETag is weakened on a
+compressed response; If-None-Match comparison is weak anyway (see
+api/conditional.py).
+
+The cost is reported through api/timing.py: a `compress` Server-Timing metric
+(wall time, with codec, ratio and CPU time in its description) and
+`compress_*` fields in the request's log line. Streams finish after the
+headers are sent, so theirs get a log line of their own when the last chunk
+is out.
+"""
+import gzip
+import json
+import logging
+import re
+import zlib
+from time import perf_counter, thread_time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import FileResponse
+from django.utils.cache import patch_vary_headers
+
+from .timing import current_timer
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+logger = logging.getLogger("api.timing")
+
+DEFAULT_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+
+_COMPRESSIBLE_RE = re.compile(
+    r"^(?:text/|application/(?:json|x-ndjson|javascript|xml|vnd\.oai\.openapi)|application/[^;]*\+(?:json|xml))",
+    re.I,
+)
+
+
+# -------------------- codecs --------------------
+def _gzip_compress(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _gzip_stream(level):
+    obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    return (lambda chunk: obj.compress(chunk) + obj.flush(zlib.Z_SYNC_FLUSH)), obj.flush
+
+
+def _br_compress(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _br_stream(level):
+    obj = brotli.Compressor(quality=level)
+    return (lambda chunk: obj.process(chunk) + obj.flush()), obj.finish
+
+
+def _zstd_compress(data, level):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _zstd_stream(level):
+    obj = zstandard.ZstdCompressor(level=level).compressobj()
+    return (lambda chunk: obj.compress(chunk) + obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)), obj.flush
+
+
+# name -> (compress(data, level) -> bytes, stream(level) -> (push(chunk) -> bytes, finish() -> bytes))
+CODECS = {"gzip": (_gzip_compress, _gzip_stream)}
+if brotli is not None:
+    CODECS["br"] = (_br_compress, _br_stream)
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_stream)
+
+# server preference between equally weighted encodings
+PREFERENCE = [name for name in ("zstd", "br", "gzip") if name in CODECS]
+
+
+def negotiate(accept_encoding, available=None):
+    """
+    The encoding of `available` (server preference order) the client ranks
+    highest in its Accept-Encoding header, or None.
+    """
+    weights = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+
+    best, best_weight = None, 0.0
+    for name in available if available is not None else PREFERENCE:
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def level(name):
+    return getattr(settings, "API_COMPRESSION_LEVELS", {}).get(name, DEFAULT_LEVELS[name])
+
+
+def no_compression(view):
+    """
+    Decorator: never compress this view's responses.
+    """
+    view.compress_response = False
+    return view
+
+
+# -------------------- middleware --------------------
+class CompressionMiddleware:
+    """
+    Compress response bodies; see the module docstring.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        compress = getattr(view_func, "compress_response", None)
+        if compress is None:
+            compress = getattr(getattr(view_func, "cls", None), "compress_response", True)
+        request.compress_response = compress
+        return None
+
+    def process_response(self, request, response):
+        if not getattr(settings, "API_COMPRESSION", True) or not getattr(request, "compress_response", True):
+            return response
+        if not self.compressible(response):
+            return response
+        # the representation depends on Accept-Encoding even when sent as-is
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            self.compress_stream(request, response, encoding)
+        else:
+            if len(response.content) < getattr(settings, "API_COMPRESSION_MIN_SIZE", 1024):
+                return response
+            if not self.compress_content(response, encoding):
+                return response
+
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response["Content-Encoding"] = encoding
+        return response
+
+    @staticmethod
+    def compressible(response):
+        if response.has_header("Content-Encoding") or isinstance(response, FileResponse):
+            return False
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        return bool(_COMPRESSIBLE_RE.match(response.get("Content-Type", "")))
+
+    @staticmethod
+    def compress_content(response, encoding):
+        raw = response.content
+        start, cpu = perf_counter(), thread_time()
+        compressed = CODECS[encoding][0](raw, level(encoding))
+        wall, cpu = perf_counter() - start, thread_time() - cpu
+        timer = current_timer()
+        if timer is not None:
+            timer.compressed(encoding, len(raw), len(compressed), wall, cpu)
+        if len(compressed) >= len(raw):
+            return False
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        return True
+
+    @staticmethod
+    def compress_stream(request, response, encoding):
+        push, finish = CODECS[encoding][1](level(encoding))
+        stats = {"in": 0, "out": 0, "cpu": 0.0}
+
+        def encode(chunk, last=False):
+            cpu = thread_time()
+            out = finish() if last else push(chunk)
+            stats["cpu"] += thread_time() - cpu
+            stats["in"] += len(chunk)
+            stats["out"] += len(out)
+            return out
+
+        def report():
+            ratio = stats["in"] / stats["out"] if stats["out"] else None
+            logger.info(json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "streamed": True,
+                "compress_encoding": encoding,
+                "compress_bytes_in": stats["in"],
+                "compress_bytes_out": stats["out"],
+                "compress_ratio": round(ratio, 2) if ratio else None,
+                "compress_cpu_ms": round(stats["cpu"] * 1000, 1),
+            }))
+
+        # captured now: streaming_content is replaced below
+        source = response.streaming_content
+        if response.is_async:
+            async def stream():
+                async for chunk in source:
+                    if chunk:
+                        yield encode(chunk)
+                yield encode(b"", last=True)
+                report()
+        else:
+            def stream():
+                for chunk in source:
+                    if chunk:
+                        yield encode(chunk)
+                yield encode(b"", last=True)
+                report()
+
+        response.streaming_content = stream()
+        del response["Content-Length"]
@@ -0,0 +1,66 @@
+# api/conditional.py
+"""
+Strong ETags + If-None-Match handling for the read endpoints.
+
+The raw viewsets tag responses with the cache versions of what they read
+(api/cache.py version_etag()), known before any query runs, so a matching
+If-None-Match is a 304 without touching the database and a 200 costs no
+more than the response itself. Everything else (the ORM viewsets, whose
+writes don't bump versions, and the analytics reports) hashes the response
+data after it is built: that still saves rendering and the transfer. The
+request path and the negotiated format are mixed in, so two
+representations of the same rows never share an ETag.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+
+
+def etag_salt(request):
+    renderer = getattr(request, "accepted_renderer", None)
+    return f"{request.get_full_path()}|{getattr(renderer, 'format', '')}"
+
+
+def quote_digest(digest, salt):
+    return '"%s"' % hashlib.md5(f"{digest}|{salt}".encode("utf-8")).hexdigest()
+
+
+def data_etag(data, salt):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, default=str)
+    return quote_digest(hashlib.md5(payload.encode("utf-8")).hexdigest(), salt)
+
+
+def etag_matches(request, etag):
+    header = request.headers.get("If-None-Match")
+    if not header or not etag:
+        return False
+    tags = parse_etags(header)
+    # weak comparison is what If-None-Match uses
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def not_modified(etag):
+    return Response(status=304, headers={"ETag": etag})
+
+
+def conditional_response(request, etag, build):
+    """
+    Common flow: 304 when the known `etag` matches, otherwise build() and tag
+    the result. With etag=None (no version to tag with) the ETag is taken from the
+    built data and 304 is still returned on a match.
+    """
+    if etag and etag_matches(request, etag):
+        return not_modified(etag)
+
+    response = build()
+    if response.status_code != 200:
+        return response
+    if etag is None:
+        etag = data_etag(response.data, etag_salt(request))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+    response["ETag"] = etag
+    return response
@@ -0,0 +1,98 @@
+# api/dbpool.py
+"""
+Connection-pool metrics for the admin endpoint (GET /api/db/pool/).
+
+Postgres connections come from psycopg_pool pools sized by
+settings.DB_POOL_OPTIONS (DB_POOL_* env):
+
+    sync   Django's native pool (DATABASES OPTIONS "pool"), one per worker process
+    async  api/aio.py, one per event loop of an ASGI worker
+
+Each pool reports psycopg_pool's own counters plus a histogram of checkout
+waits recorded here: the "api.backends.postgresql" engine times Django's
+getconn(), api/aio.py times pool.connection(). All numbers are per worker
+process (the endpoint answers for the worker that serves it).
+"""
+import os
+import threading
+from bisect import bisect_left
+
+from django.db import connection
+
+# upper bounds of the wait-time buckets, in ms (the last bucket is open-ended)
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class WaitHistogram:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self):
+        with self.lock:
+            counts, total_ms, max_ms = list(self.counts), self.total_ms, self.max_ms
+        n = sum(counts)
+        labels = [f"<={b}" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        return {
+            "count": n,
+            "mean_ms": round(total_ms / n, 2) if n else None,
+            "max_ms": round(max_ms, 2),
+            "buckets_ms": dict(zip(labels, counts)),
+        }
+
+
+_histograms = {"sync": WaitHistogram(), "async": WaitHistogram()}
+
+
+def observe_wait(kind, seconds):
+    _histograms[kind].observe(seconds)
+
+
+def reset():
+    for kind in _histograms:
+        _histograms[kind] = WaitHistogram()
+
+
+def pool_stats(pool):
+    """
+    In use / waiting / size of one psycopg_pool pool plus its counters.
+    """
+    stats = pool.get_stats()
+    size = stats.pop("pool_size", 0)
+    available = stats.pop("pool_available", 0)
+    return {
+        "name": pool.name,
+        "min_size": stats.pop("pool_min", pool.min_size),
+        "max_size": stats.pop("pool_max", pool.max_size),
+        "size": size,
+        "available": available,
+        "in_use": size - available,
+        "waiting": stats.pop("requests_waiting", 0),
+        "counters": stats,
+    }
+
+
+def snapshot():
+    from . import aio
+
+    sync_pool = connection.pool if connection.vendor == "postgresql" else None
+    return {
+        "pid": os.getpid(),
+        "sync": {
+            "pool": pool_stats(sync_pool) if sync_pool is not None else None,
+            "wait": _histograms["sync"].snapshot(),
+        },
+        "async": {
+            "pools": [pool_stats(p) for p in aio.pools()],
+            "wait": _histograms["async"].snapshot(),
+        },
+    }
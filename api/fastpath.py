@@ -0,0 +1,188 @@
+# api/fastpath.py
+"""
+Serializer-bypass list path for the ORM viewsets (FastReadMixin in
+api/views.py).
+
+A ModelSerializer page costs, per row: building a model instance, then for
+every field get_attribute() + to_representation(), with DecimalField copying
+a decimal context for each value. For plain column fields all of that can be
+decided once per request instead:
+
+    plan = fastpath.cached_plan(EnrollmentSerializer)  # None: use the serializer
+    rows = fastpath.to_rows(queryset.values_list(*plan.sources), plan)
+
+Plans are memoised per serializer class, ?fields= selection and active time
+zone, so a request doesn't even build the serializer's fields.
+
+values_list() hands back tuples; each column gets a converter built from its
+serializer field: str / int for char and integer fields (the inspected
+models don't always match the column types, e.g. assessment_weights.grade),
+Decimal -> the same quantized string, datetime -> the same ISO 8601 text in
+the same time zone. JSON and pk-valued relations are passed through. The
+resulting dicts contain only JSON-native values, so the renderer's C encoder
+never falls back to a Python default(). The output is byte-for-byte what the
+serializer renders (see FastReadTests).
+
+Serializers with anything else (method fields, nested serializers, dotted
+sources, a custom to_representation) get no plan and keep the normal path.
+"""
+import decimal
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework import fields as drf_fields
+from rest_framework import relations, serializers
+from rest_framework.settings import api_settings
+
+# what these fields' to_representation() amounts to
+BUILTIN_CONVERTERS = (
+    (drf_fields.CharField, str),
+    (drf_fields.IntegerField, int),
+    (drf_fields.FloatField, float),
+)
+UNSUPPORTED_FIELDS = (
+    serializers.BaseSerializer,
+    drf_fields.SerializerMethodField,
+    drf_fields.HiddenField,
+    drf_fields.FileField,  # URLs depend on the request
+    relations.ManyRelatedField,
+)
+
+# (serializer class, fields, time zone) -> Plan or None
+_plans = {}
+_lock = threading.Lock()
+
+
+class Plan:
+    """
+    Output names, values_list() sources and per-column converters of one
+    serializer.
+    """
+
+    def __init__(self, columns):
+        self.names = [name for name, _, _ in columns]
+        self.sources = [source for _, source, _ in columns]
+        self.converters = [(i, convert) for i, (_, _, convert) in enumerate(columns) if convert is not None]
+
+
+def _decimal_converter(field):
+    if field.decimal_places is None or field.localize or field.normalize_output:
+        return field.to_representation
+    coerce = getattr(field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING)
+    # what DecimalField.quantize() builds on every call
+    exponent = decimal.Decimal(".1") ** field.decimal_places
+    context = decimal.getcontext().copy()
+    if field.max_digits is not None:
+        context.prec = field.max_digits
+    rounding = field.rounding
+
+    def convert(value):
+        if not isinstance(value, decimal.Decimal):
+            value = decimal.Decimal(str(value).strip())
+        quantized = value.quantize(exponent, rounding=rounding, context=context)
+        return f"{quantized:f}" if coerce else quantized
+    return convert
+
+
+def _datetime_converter(field):
+    output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+    tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or tz is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.tzinfo is None:
+            return field.to_representation(value)
+        text = value.astimezone(tz).isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    return convert
+
+
+def _column(field, model):
+    """
+    (values_list source, converter or None), or None when the field can't be
+    read from a plain column.
+    """
+    if isinstance(field, UNSUPPORTED_FIELDS) or not field.source or "." in field.source or field.source == "*":
+        return None
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if not model_field.concrete or model_field.many_to_many:
+        return None
+
+    if isinstance(field, relations.RelatedField):
+        # the serializer renders obj.<fk>.pk, i.e. the <fk>_id column
+        if not isinstance(field, relations.PrimaryKeyRelatedField) or field.pk_field is not None:
+            return None
+        return model_field.attname, None
+    if isinstance(field, drf_fields.JSONField):
+        return model_field.attname, (field.to_representation if field.binary else None)
+    if isinstance(field, drf_fields.DecimalField):
+        return model_field.attname, _decimal_converter(field)
+    if isinstance(field, drf_fields.DateTimeField):
+        return model_field.attname, _datetime_converter(field)
+    if type(field).to_representation is drf_fields.ReadOnlyField.to_representation:
+        return model_field.attname, None
+    for field_class, convert in BUILTIN_CONVERTERS:
+        if type(field).to_representation is field_class.to_representation:
+            return model_field.attname, convert
+    return model_field.attname, field.to_representation
+
+
+def plan(serializer):
+    """
+    Plan for rendering `serializer`'s fields from values_list() tuples, or
+    None if it has to go through the serializer.
+    """
+    if not isinstance(serializer, serializers.ModelSerializer):
+        return None
+    if type(serializer).to_representation is not serializers.Serializer.to_representation:
+        return None
+    model = serializer.Meta.model
+    columns = []
+    for field in serializer._readable_fields:
+        column = _column(field, model)
+        if column is None:
+            return None
+        columns.append((field.field_name, *column))
+    return Plan(columns)
+
+
+def cached_plan(serializer_class, fields=None):
+    """
+    plan() of `serializer_class` (restricted to `fields`, see
+    DynamicFieldsModelSerializer), memoised per process.
+    """
+    key = (serializer_class, tuple(fields) if fields is not None else None, timezone.get_current_timezone_name())
+    try:
+        return _plans[key]
+    except KeyError:
+        pass
+    serializer = serializer_class(fields=fields) if fields is not None else serializer_class()
+    result = plan(serializer)
+    with _lock:
+        _plans[key] = result
+    return result
+
+
+def to_rows(tuples, plan):
+    """
+    values_list() tuples -> the dicts the serializer would produce (None
+    stays None, as in Serializer.to_representation()).
+    """
+    names, converters = plan.names, plan.converters
+    if not converters:
+        return [dict(zip(names, values)) for values in tuples]
+    rows = []
+    for values in tuples:
+        values = list(values)
+        for i, convert in converters:
+            value = values[i]
+            if value is not None:
+                values[i] = convert(value)
+        rows.append(dict(zip(names, values)))
+    return rows
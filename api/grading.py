@@ -0,0 +1,166 @@
+# api/grading.py
+"""
+In-process grade-boundary index: percentage -> MYP level / DP grade.
+
+Each worker keeps the boundary tables in memory as sorted arrays per key
+
+    MYP: grade                 -> boundary_level   (myp_grade_boundaries)
+    DP:  (subject, level)      -> grade            (dp_grade_boundaries)
+
+and answers a lookup with one bisect over the band starts. A band runs
+from its min_score up to the next band's min_score (exclusive): the tables
+store whole-number bounds such as 0-14 / 15-29, so a score of 14.5 belongs
+to the lower band rather than to neither. The last band ends at its
+max_score; a score below the first band or above the last maps to None.
+
+The index is rebuilt when the table's response-cache version changes
+(`manage.py invalidate_api_cache --table myp_grade_boundaries`, shared by
+every worker through the "api_versions" cache) or after
+GRADE_BOUNDARY_INDEX_TTL seconds, whichever comes first; lookups themselves
+never touch the database.
+"""
+import math
+import threading
+import time
+from bisect import bisect_right
+
+from django.conf import settings
+from django.db import connection
+
+from . import cache as api_cache
+
+MYP_TABLE = "myp_grade_boundaries"
+DP_TABLE = "dp_grade_boundaries"
+TABLES = (MYP_TABLE, DP_TABLE)
+
+
+def _text_key(value):
+    return str(value).strip().casefold()
+
+
+def myp_key(grade):
+    """
+    MYP grades are integers in the table; accept 7, "7" or "7.0".
+    """
+    try:
+        return int(float(grade))
+    except (TypeError, ValueError):
+        return None
+
+
+def dp_key(subject, level):
+    return (_text_key(subject), _text_key(level))
+
+
+class BoundaryIndex:
+    """
+    key -> bands sorted by min_score, held as parallel arrays for bisect.
+    """
+
+    def __init__(self, bands):
+        # bands: iterable of (key, min_score, max_score, value)
+        grouped = {}
+        for key, low, high, value in bands:
+            if key is None or low is None or high is None:
+                continue
+            grouped.setdefault(key, []).append((float(low), float(high), value))
+        self.mins, self.maxs, self.values = {}, {}, {}
+        for key, rows in grouped.items():
+            rows.sort(key=lambda r: r[0])
+            self.mins[key] = [r[0] for r in rows]
+            self.maxs[key] = [r[1] for r in rows]
+            self.values[key] = [r[2] for r in rows]
+
+    def __len__(self):
+        return sum(len(v) for v in self.values.values())
+
+    def lookup(self, key, score):
+        mins = self.mins.get(key)
+        if mins is None or score is None:
+            return None
+        # mins[i] <= score < mins[i + 1]
+        i = bisect_right(mins, score) - 1
+        if i < 0 or (i == len(mins) - 1 and score > self.maxs[key][i]):
+            return None
+        return self.values[key][i]
+
+
+def _load(sql, make_key):
+    with connection.cursor() as cur:
+        cur.execute(sql)
+        return BoundaryIndex((make_key(*row[:-3]), row[-3], row[-2], row[-1]) for row in cur.fetchall())
+
+
+_LOADERS = {
+    MYP_TABLE: lambda: _load(
+        f"SELECT grade, min_score, max_score, boundary_level FROM {MYP_TABLE}", myp_key
+    ),
+    DP_TABLE: lambda: _load(
+        f"SELECT subject, level, min_score, max_score, grade FROM {DP_TABLE}", dp_key
+    ),
+}
+
+# table -> (index, version it was built at, monotonic build time)
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index(table):
+    """
+    The current BoundaryIndex of `table`, rebuilt first if it is stale.
+    """
+    version = api_cache.current_version(table, None)
+    ttl = getattr(settings, "GRADE_BOUNDARY_INDEX_TTL", 300)
+    entry = _indexes.get(table)
+    if entry is not None and entry[1] == version and time.monotonic() - entry[2] < ttl:
+        return entry[0]
+    with _lock:
+        entry = _indexes.get(table)
+        if entry is None or entry[1] != version or time.monotonic() - entry[2] >= ttl:
+            entry = (_LOADERS[table](), version, time.monotonic())
+            _indexes[table] = entry
+    return entry[0]
+
+
+def reset():
+    """
+    Drop every worker-local index (tests, after a bulk reload in-process).
+    """
+    _indexes.clear()
+
+
+def _score(value):
+    if value is None or isinstance(value, bool):
+        raise ValueError("score must be a number")
+    score = float(value)
+    if not math.isfinite(score):
+        raise ValueError("score must be a number")
+    return score
+
+
+def lookup_many(items):
+    """
+    Grade a list of tuples in one pass:
+      [grade, score]            -> MYP boundary_level
+      [subject, level, score]   -> DP grade
+    Returns the results in input order (None where no band matches).
+    Raises ValueError naming the first malformed item.
+    """
+    myp = dp = None
+    out = []
+    for n, item in enumerate(items):
+        if not isinstance(item, (list, tuple)) or len(item) not in (2, 3):
+            raise ValueError(f"item {n}: expected [grade, score] or [subject, level, score]")
+        try:
+            score = _score(item[-1])
+        except (TypeError, ValueError):
+            raise ValueError(f"item {n}: score must be a number")
+        if len(item) == 2:
+            if myp is None:
+                myp = get_index(MYP_TABLE)
+            out.append(myp.lookup(myp_key(item[0]), score))
+        else:
+            if dp is None:
+                dp = get_index(DP_TABLE)
+            out.append(dp.lookup(dp_key(item[0], item[1]), score))
+    return out
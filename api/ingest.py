@@ -0,0 +1,499 @@
+# api/ingest.py
+"""
+Bulk reloads of the ETL tables (enrollments, subjects, assessments_*).
+
+    python manage.py ingest subjects subjects.csv
+    curl -X POST -H "Content-Type: text/csv" --data-binary @subjects.csv .../api/ingest/subjects/
+
+A reload replaces the whole table, and readers never see a half-loaded one:
+
+    1. CREATE UNLOGGED TABLE _ingest_<table>_<id> (LIKE <table> INCLUDING ALL
+       EXCLUDING INDEXES) -- same columns, defaults and CHECK constraints
+    2. COPY ... FROM STDIN straight from the upload: CSV is passed through
+       untouched in 1 MB writes, NDJSON (and CSV carrying JSON arrays for the
+       FA array columns) is decoded here and sent with write_row()
+    3. validate against the model in api/models.py: columns, NULLs in
+       non-null fields, Decimal / integer ranges (one scan of the staging
+       table, see violations())
+    4. SET LOGGED, rebuild the table's indexes, constraints, triggers and
+       grants on the staging table, ANALYZE
+    5. swap: LOCK the table, DROP it, rename the staging table (and its
+       indexes / constraints) into place
+
+Everything runs in one transaction, so a bad file leaves nothing behind and
+readers keep the old rows until the swap commits; they only wait for the
+swap itself (milliseconds, bounded by INGEST_LOCK_TIMEOUT_MS and retried).
+Afterwards the table's response-cache version is bumped and, if the table is
+captured (api/changes.py), a "T" entry tells change-feed consumers to
+re-download it; run `manage.py refresh_student_summary` after reloading
+enrollments / subjects.
+
+Columns the file doesn't mention are loaded as NULL; empty CSV fields are
+NULL too (as in CSV written by the /export/ action). Tables with objects
+outside them depending on them (foreign keys, views) can't be swapped and are
+refused before anything is loaded.
+
+Other backends (SQLite in dev) insert in batches into the staging table and
+swap by DELETE + INSERT ... SELECT in the same transaction.
+"""
+import codecs
+import csv
+import json
+import re
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DataError, IntegrityError, OperationalError, connection, models, transaction
+
+from . import cache as api_cache
+from . import changes
+
+TABLES = (
+    "enrollments", "subjects",
+    "assessments_eol", "assessments_fa", "assessments_sa", "assessments_non_academic",
+)
+FORMATS = ("csv", "ndjson")
+STAGING_PREFIX = "_ingest_"
+# array columns (api.views.AssessmentFAViewSet.FA_ARRAY_COLUMNS): their model
+# fields describe one element, so the range checks don't apply
+ARRAY_COLUMNS = {
+    "assessments_fa": ("month", "task_name", "teachers", "student_score", "max_score_old"),
+}
+
+# bytes per raw COPY write / rows per INSERT batch (non-COPY path)
+CHUNK_SIZE = 1 << 20
+BATCH_SIZE = 5000
+SWAP_ATTEMPTS = 3
+
+INT32 = 2 ** 31
+
+_INDEX_RE = re.compile(r"^CREATE (UNIQUE )?INDEX \S+ ON (?:ONLY )?\S+ (USING .*)$", re.S)
+_TRIGGER_ON_RE = re.compile(r" ON (?:ONLY )?\S+ ")
+
+
+class IngestError(ValueError):
+    """
+    The upload can't replace the table (unknown table / columns, a row the
+    column types reject, a failed model check).
+    """
+
+
+def model_for(table):
+    if table not in TABLES:
+        raise IngestError(f"Unknown table {table!r}. Known: {', '.join(TABLES)}")
+    for model in apps.get_app_config("api").get_models():
+        if model._meta.db_table == table:
+            return model
+    raise IngestError(f"No model for {table!r} in api/models.py")
+
+
+def format_for(name):
+    """
+    Input format from a file name or content type, or None.
+    """
+    name = (name or "").lower().split(";")[0].strip()
+    if name.endswith("csv"):
+        return "csv"
+    if name.endswith(("ndjson", "jsonl")):
+        return "ndjson"
+    return None
+
+
+# -------------------- reading --------------------
+def _lines(source):
+    return iter(source.readline, b"")
+
+
+def read_csv_header(source):
+    """
+    (column names, raw line) of the first line of a CSV upload (a UTF-8 BOM
+    is dropped).
+    """
+    line = source.readline()
+    if not line:
+        raise IngestError("Empty upload: expected a CSV header line")
+    header = next(csv.reader([line.decode("utf-8-sig")]))
+    return [name.strip() for name in header], line
+
+
+def csv_rows(source, width):
+    reader = csv.reader(codecs.iterdecode(_lines(source), "utf-8"))
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != width:
+            # line_num counts from the first data line (the header is read already)
+            raise IngestError(f"CSV line {reader.line_num + 1}: {len(row)} fields, the header has {width}")
+        yield row
+
+
+def ndjson_rows(source, columns):
+    known = set(columns)
+    for number, line in enumerate(_lines(source), start=1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError as e:
+            raise IngestError(f"NDJSON line {number}: {e}")
+        if not isinstance(obj, dict):
+            raise IngestError(f"NDJSON line {number}: expected an object")
+        unknown = obj.keys() - known
+        if unknown:
+            raise IngestError(f"NDJSON line {number}: unknown column(s) {', '.join(sorted(unknown))}")
+        yield [obj.get(column) for column in columns]
+
+
+def _csv_value(value):
+    return value if value != "" else None
+
+
+def _array_literal(items):
+    # psycopg's list adaptation costs more than the rest of the row together
+    return "{" + ",".join(
+        "NULL" if item is None else '"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"'
+        for item in items
+    ) + "}"
+
+
+def _csv_array(value):
+    # /export/ writes array columns as JSON; "{a,b}" literals pass through
+    if not value:
+        return None
+    if not value.startswith("["):
+        return value
+    if "\\" not in value and "{" not in value and "[" not in value[1:]:
+        # flat JSON without escapes already is array syntax: "quoted", 1.5, null
+        return "{" + value[1:-1] + "}"
+    return _array_literal(json.loads(value))
+
+
+def _ndjson_array(value):
+    return _array_literal(value) if isinstance(value, list) else value
+
+
+def _json_text(value):
+    # strings are taken as JSON text already (what CSV / SQLite exports carry)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def _converters(fmt, columns, kinds, postgres):
+    """
+    Per-column value conversion: CSV text -> COPY / INSERT value (empty ->
+    NULL), JSON arrays -> array literals for Postgres array columns, other
+    NDJSON lists and objects -> JSON text.
+    """
+    out = []
+    for column in columns:
+        kind = kinds.get(column)
+        if kind == "array" and postgres:
+            out.append(_csv_array if fmt == "csv" else _ndjson_array)
+        elif fmt == "csv":
+            out.append(_csv_value)
+        elif kind == "json" or not postgres:
+            out.append(_json_text)
+        else:
+            out.append(None)
+    return out
+
+
+def _converted(rows, converters):
+    pairs = [(i, convert) for i, convert in enumerate(converters) if convert is not None]
+    for row in rows:
+        for i, convert in pairs:
+            row[i] = convert(row[i])
+        yield row
+
+
+# -------------------- validation --------------------
+def _checks(model, columns, vendor):
+    """
+    (message, SQL condition) pairs a staging row must not match.
+    """
+    present = set(columns)
+    arrays = ARRAY_COLUMNS.get(model._meta.db_table, ())
+    checks = []
+    for field in model._meta.concrete_fields:
+        column = field.column
+        if column not in present:
+            continue
+        quoted = connection.ops.quote_name(column)
+        if not field.null:
+            checks.append((f"NULL {column}", f"{quoted} IS NULL"))
+        if column in arrays:
+            continue
+        if isinstance(field, models.DecimalField) and field.max_digits is not None:
+            limit = 10 ** (field.max_digits - (field.decimal_places or 0))
+            checks.append((
+                f"{column} out of range (max_digits={field.max_digits}, decimal_places={field.decimal_places})",
+                f"abs({quoted}) >= {limit}",
+            ))
+        elif isinstance(field, models.IntegerField) and not isinstance(field, (models.BigIntegerField, models.AutoField)):
+            checks.append((f"{column} out of integer range", f"({quoted} < {-INT32} OR {quoted} >= {INT32})"))
+        if vendor == "sqlite" and isinstance(field, (models.DecimalField, models.IntegerField, models.FloatField)):
+            # SQLite keeps text it can't convert to a number
+            checks.append((f"non-numeric {column}", f"typeof({quoted}) NOT IN ('integer', 'real', 'null')"))
+    return checks
+
+
+def violations(cur, staging, model, columns):
+    """
+    (row count, ["<n> row(s) with <problem>", ...]) of the staging table.
+    """
+    checks = _checks(model, columns, connection.vendor)
+    counts = "".join(f", sum(CASE WHEN {condition} THEN 1 ELSE 0 END)" for _, condition in checks)
+    cur.execute(f"SELECT count(*){counts} FROM {connection.ops.quote_name(staging)}")
+    total, *found = cur.fetchone()
+    problems = [f"{n} row(s) with {message}" for (message, _), n in zip(checks, found) if n]
+    return total, problems
+
+
+# -------------------- Postgres --------------------
+def _pg_columns(cur, table):
+    """
+    {column: "array" | "json" | None} of an existing table, or None.
+    """
+    cur.execute(
+        "SELECT a.attname, CASE WHEN t.typcategory = 'A' THEN 'array' "
+        "WHEN t.typname IN ('json', 'jsonb') THEN 'json' END "
+        "FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid "
+        "WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped "
+        "ORDER BY a.attnum",
+        [connection.ops.quote_name(table)],
+    )
+    rows = cur.fetchall()
+    return dict(rows) if rows else None
+
+
+def _pg_dependents(cur, table):
+    """
+    Objects outside `table` that depend on it (foreign keys, views): a
+    dropped and renamed table would leave them pointing at the old one.
+    """
+    cur.execute(
+        "SELECT DISTINCT pg_describe_object(classid, objid, objsubid) FROM pg_depend "
+        "WHERE refclassid = 'pg_class'::regclass AND refobjid = to_regclass(%s) AND deptype = 'n'",
+        [connection.ops.quote_name(table)],
+    )
+    return sorted(row[0] for row in cur.fetchall())
+
+
+def _pg_copy_structure(cur, table, staging):
+    """
+    Rebuild `table`'s indexes (with their primary key / unique constraints),
+    triggers and grants on `staging`. Returns the renames that give them back
+    their names once `staging` has taken the table's place.
+    """
+    qn = connection.ops.quote_name
+    regclass = qn(table)
+    renames = []
+    cur.execute(
+        "SELECT i.relname, pg_get_indexdef(x.indexrelid), c.conname, c.contype "
+        "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+        "LEFT JOIN pg_constraint c ON c.conindid = x.indexrelid AND c.conrelid = x.indrelid AND c.contype IN ('p', 'u') "
+        "WHERE x.indrelid = to_regclass(%s) ORDER BY i.relname",
+        [regclass],
+    )
+    for n, (name, definition, constraint, kind) in enumerate(cur.fetchall()):
+        match = _INDEX_RE.match(definition)
+        if match is None:
+            raise IngestError(f"Can't rebuild index {name} of {table}: {definition}")
+        temporary = f"{staging}_{n}"
+        cur.execute(f"CREATE {match.group(1) or ''}INDEX {qn(temporary)} ON {qn(staging)} {match.group(2)}")
+        if constraint:
+            keyword = "PRIMARY KEY" if kind == "p" else "UNIQUE"
+            cur.execute(f"ALTER TABLE {qn(staging)} ADD CONSTRAINT {qn(temporary)} {keyword} USING INDEX {qn(temporary)}")
+            renames.append(f"ALTER TABLE {qn(table)} RENAME CONSTRAINT {qn(temporary)} TO {qn(constraint)}")
+        else:
+            renames.append(f"ALTER INDEX {qn(temporary)} RENAME TO {qn(name)}")
+
+    cur.execute("SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = to_regclass(%s) AND NOT tgisinternal", [regclass])
+    for (definition,) in cur.fetchall():
+        cur.execute(_TRIGGER_ON_RE.sub(f" ON {qn(staging)} ", definition, count=1))
+
+    cur.execute(
+        "SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(r.rolname) END, a.privilege_type "
+        "FROM pg_class c CROSS JOIN aclexplode(c.relacl) a LEFT JOIN pg_roles r ON r.oid = a.grantee "
+        "WHERE c.oid = to_regclass(%s) AND a.grantee <> c.relowner",
+        [regclass],
+    )
+    for grantee, privilege in cur.fetchall():
+        cur.execute(f"GRANT {privilege} ON {qn(staging)} TO {grantee}")
+    return renames
+
+
+def _pg_load(cur, staging, columns, rows=None, source=None, header=None):
+    """
+    COPY into `staging`: `rows` with write_row(), or the rest of a CSV
+    `source` passed through as is (after its `header` line, so that COPY's
+    line numbers are the file's).
+    """
+    qn = connection.ops.quote_name
+    target = f"{qn(staging)} ({', '.join(qn(c) for c in columns)})"
+    if source is not None:
+        with cur.copy(f"COPY {target} FROM STDIN (FORMAT csv, HEADER true)") as copy:
+            copy.write(header)
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                copy.write(chunk)
+    else:
+        with cur.copy(f"COPY {target} FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def _pg_swap(cur, table, staging, renames):
+    qn = connection.ops.quote_name
+    timeout = getattr(settings, "INGEST_LOCK_TIMEOUT_MS", 5000)
+    for attempt in range(1, SWAP_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                cur.execute("SELECT set_config('lock_timeout', %s, true)", [f"{int(timeout)}ms"])
+                # queues behind running readers; new readers queue behind us
+                cur.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+                cur.execute(f"DROP TABLE {qn(table)}")
+                cur.execute(f"ALTER TABLE {qn(staging)} RENAME TO {qn(table)}")
+                for stmt in renames:
+                    cur.execute(stmt)
+            return
+        except OperationalError:
+            # lock_timeout: let the long reader finish and try again
+            if attempt == SWAP_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+
+# -------------------- fallback --------------------
+def _generic_columns(cur, table):
+    # json and array columns are plain text here (see seed_synthetic)
+    if table not in {t.name for t in connection.introspection.get_table_list(cur)}:
+        return None
+    return {info.name: None for info in connection.introspection.get_table_description(cur, table)}
+
+
+def _generic_load(cur, staging, columns, rows):
+    qn = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {qn(staging)} ({', '.join(qn(c) for c in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            cur.executemany(sql, batch)
+            batch = []
+    if batch:
+        cur.executemany(sql, batch)
+
+
+def _generic_swap(cur, table, staging, columns):
+    qn = connection.ops.quote_name
+    listed = ", ".join(qn(c) for c in columns)
+    cur.execute(f"DELETE FROM {qn(table)}")
+    cur.execute(f"INSERT INTO {qn(table)} ({listed}) SELECT {listed} FROM {qn(staging)}")
+    cur.execute(f"DROP TABLE {qn(staging)}")
+
+
+# -------------------- entry point --------------------
+def _driver_errors():
+    database = connection.Database
+    return (DataError, IntegrityError, database.DataError, database.IntegrityError)
+
+
+def _describe(error):
+    diag = getattr(error, "diag", None) or getattr(error.__cause__, "diag", None)
+    if diag is not None and diag.message_primary:
+        return f"{diag.message_primary} ({diag.context.strip()})" if diag.context else diag.message_primary
+    return str(error)
+
+
+def ingest(table, source, fmt, allow_empty=False):
+    """
+    Replace `table` with the rows of `source` (a binary file-like object
+    holding CSV with a header line, or NDJSON). Returns {"table", "rows",
+    "load_ms", "index_ms", "swap_ms"}; raises IngestError on bad input, with
+    the table untouched.
+    """
+    model = model_for(table)
+    if fmt not in FORMATS:
+        raise IngestError(f"Unknown format {fmt!r}. Known: {', '.join(FORMATS)}")
+    postgres = connection.vendor == "postgresql"
+    qn = connection.ops.quote_name
+    staging = f"{STAGING_PREFIX}{table}_{uuid.uuid4().hex[:8]}"
+    timings = {}
+
+    with transaction.atomic(), connection.cursor() as cur:
+        kinds = _pg_columns(cur, table) if postgres else _generic_columns(cur, table)
+        if kinds is None:
+            raise IngestError(f"Table {table} does not exist")
+        expected = [field.column for field in model._meta.concrete_fields]
+        missing = [column for column in expected if column not in kinds]
+        if missing:
+            raise IngestError(f"{table} lacks the model's column(s) {', '.join(missing)}")
+        if postgres:
+            dependents = _pg_dependents(cur, table)
+            if dependents:
+                raise IngestError(f"Can't swap {table}, other objects depend on it: {'; '.join(dependents)}")
+
+        if fmt == "csv":
+            columns, header = read_csv_header(source)
+            unknown = [c for c in columns if c not in expected]
+            if unknown or len(set(columns)) != len(columns):
+                raise IngestError(f"Bad CSV header: unknown or repeated column(s) {', '.join(unknown) or columns}")
+            rows = csv_rows(source, len(columns))
+        else:
+            columns = expected
+            rows = ndjson_rows(source, columns)
+        required = [f.column for f in model._meta.concrete_fields if not f.null and f.column not in columns]
+        if required:
+            raise IngestError(f"Missing non-null column(s) {', '.join(required)}")
+
+        started = time.perf_counter()
+        try:
+            if postgres:
+                cur.execute(f"CREATE UNLOGGED TABLE {qn(staging)} (LIKE {qn(table)} INCLUDING ALL EXCLUDING INDEXES)")
+                if fmt == "csv" and not any(kinds[c] == "array" for c in columns):
+                    _pg_load(cur, staging, columns, source=source, header=header)
+                else:
+                    _pg_load(cur, staging, columns, rows=_converted(rows, _converters(fmt, columns, kinds, True)))
+            else:
+                cur.execute(f"CREATE TABLE {qn(staging)} AS SELECT * FROM {qn(table)} WHERE 1 = 0")
+                _generic_load(cur, staging, columns, _converted(rows, _converters(fmt, columns, kinds, False)))
+        except _driver_errors() as e:
+            raise IngestError(f"{table}: {_describe(e)}")
+
+        total, problems = violations(cur, staging, model, columns)
+        if problems:
+            raise IngestError(f"{table}: {'; '.join(problems)}")
+        if not total and not allow_empty:
+            raise IngestError(f"No rows: refusing to empty {table}")
+        timings["load_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        started = time.perf_counter()
+        if postgres:
+            cur.execute(f"ALTER TABLE {qn(staging)} SET LOGGED")
+            try:
+                renames = _pg_copy_structure(cur, table, staging)
+            except _driver_errors() as e:
+                raise IngestError(f"{table}, rebuilding its indexes: {_describe(e)}")
+            cur.execute(f"ANALYZE {qn(staging)}")
+        timings["index_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        started = time.perf_counter()
+        if postgres:
+            _pg_swap(cur, table, staging, renames)
+        else:
+            _generic_swap(cur, table, staging, columns)
+        changes.record_reload(cur, table)
+        timings["swap_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+    api_cache.bump_version(table)
+    return {"table": table, "rows": total, **timings}
@@ -0,0 +1,259 @@
+# api/management/commands/advise_indexes.py
+"""
+Suggest (and optionally create) btree indexes for the access patterns the API
+actually issues against the unmanaged tables.
+
+Input is the query shapes recorded by api.querylog.QueryShapeMiddleware
+(run the app with QUERY_RECORDER_DIR set for a while first). Without a
+recording the command falls back to the shapes the views are known to use:
+`enrollment_id = %s` + key-ordered paging on every raw table, and the filters
+and primary-key paging of the ORM viewsets.
+
+For every shape the candidate index is
+
+    equality columns, then range columns, then ORDER BY columns
+
+Candidates that are a prefix of a longer candidate are folded into it, and
+candidates already served by an existing btree index (leading columns, read
+from the pg_index catalog through Django's introspection) are dropped. The
+rest are printed as CREATE INDEX CONCURRENTLY statements with the planner's
+cost for a representative query before and, when the hypopg extension is
+installed, after a hypothetical index. `--apply` runs the statements.
+
+Text search shapes (ILIKE / %) are left to `manage.py create_search_indexes`.
+"""
+import hashlib
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api import views
+from api.pagination import KeysetPagination
+from api.querylog import Shape, load_recorded_shapes
+from api.views import RawReadOnlyViewSet
+
+# filters the ORM viewsets are queried with that aren't declared as filterset_fields
+EXTRA_SHAPES = [
+    Shape("enrollments", ("academic_year", "grade", "school"), (), (), ()),
+]
+
+PG_MAX_IDENTIFIER = 63
+
+
+def static_shapes():
+    """
+    Shapes derived from the viewsets themselves, used when nothing was recorded.
+    """
+    shapes = Counter()
+    for viewset in RawReadOnlyViewSet.__subclasses__():
+        if not viewset.table_name or not viewset.key_columns:
+            continue
+        keys = tuple(viewset.key_columns)
+        # list pages: keyset range on the key, ordered by it
+        shapes[Shape(viewset.table_name, (), keys, keys, ())] += 1
+        # by-enrollment / retrieve: equality on the leading key column(s)
+        shapes[Shape(viewset.table_name, keys, (), (), ())] += 1
+        if "enrollment_id" in keys:
+            shapes[Shape(viewset.table_name, ("enrollment_id",), (), (), ())] += 1
+
+    for name in dir(views):
+        viewset = getattr(views, name)
+        fields = getattr(viewset, "filterset_fields", None)
+        queryset = getattr(viewset, "queryset", None)
+        if not isinstance(viewset, type) or not fields or queryset is None:
+            continue
+        table = queryset.model._meta.db_table
+        shapes[Shape(table, tuple(fields), (), (), ())] += 1
+
+    for name in dir(views):
+        viewset = getattr(views, name)
+        paginator = getattr(viewset, "pagination_class", None)
+        queryset = getattr(viewset, "queryset", None)
+        if not isinstance(viewset, type) or queryset is None:
+            continue
+        if not (isinstance(paginator, type) and issubclass(paginator, KeysetPagination)):
+            continue
+        # ORM list pages: keyset range on the primary key, ordered by it
+        pk = (queryset.model._meta.pk.column,)
+        shapes[Shape(queryset.model._meta.db_table, (), pk, pk, ())] += 1
+
+    for shape in EXTRA_SHAPES:
+        shapes[shape] += 1
+    return shapes
+
+
+def candidate_columns(shape):
+    cols = []
+    for col in shape.eq + shape.range + shape.order:
+        if col not in cols:
+            cols.append(col)
+    return tuple(cols)
+
+
+def index_name(table, columns):
+    name = f"{table}_{'_'.join(columns)}_idx"
+    if len(name) > PG_MAX_IDENTIFIER:
+        digest = hashlib.md5(name.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:PG_MAX_IDENTIFIER - 13]}_{digest}_idx"
+    return name
+
+
+def create_statement(table, columns):
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, columns)} "
+        f"ON {table} ({', '.join(columns)})"
+    )
+
+
+class Command(BaseCommand):
+    help = "Suggest/create indexes for the query shapes recorded by QueryShapeMiddleware"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Recorder directory (default: settings.QUERY_RECORDER_DIR)")
+        parser.add_argument("--db-alias", default=DEFAULT_DB_ALIAS, help="DB alias to use (default: default)")
+        parser.add_argument("--min-count", type=int, default=1, help="Ignore shapes seen fewer times than this")
+        parser.add_argument("--static", action="store_true", help="Ignore recordings; use the views' known shapes")
+        parser.add_argument("--apply", action="store_true", help="Run the CREATE INDEX CONCURRENTLY statements")
+
+    def handle(self, *args, **options):
+        conn = connections[options["db_alias"]]
+        if options["apply"] and conn.vendor != "postgresql":
+            raise CommandError(f"--apply needs Postgres (this connection is {conn.vendor})")
+
+        directory = options["dir"] or getattr(settings, "QUERY_RECORDER_DIR", None)
+        shapes = Counter()
+        if directory and not options["static"]:
+            shapes = load_recorded_shapes(directory)
+        if not shapes:
+            if not options["static"]:
+                self.stdout.write(self.style.WARNING(
+                    "No recorded query shapes (set QUERY_RECORDER_DIR and exercise the API); "
+                    "using the views' known access patterns."
+                ))
+            shapes = static_shapes()
+
+        advice = self.advise(conn, shapes, options["min_count"])
+        if not advice:
+            self.stdout.write(self.style.SUCCESS("Every recorded shape is already served by an index."))
+            return
+
+        hypothetical = self.hypopg_available(conn)
+        for item in advice:
+            before, after = self.estimate(conn, item["table"], item["columns"], hypothetical)
+            benefit = "n/a"
+            if before is not None and after is not None:
+                benefit = f"cost {before:.1f} -> {after:.1f}"
+            elif before is not None:
+                benefit = f"cost {before:.1f} -> ? (install hypopg for an estimate)"
+            self.stdout.write(f"-- {item['table']}({', '.join(item['columns'])}): seen {item['count']}x, {benefit}")
+            self.stdout.write(item["statement"] + ";")
+
+        if options["apply"]:
+            for item in advice:
+                # CONCURRENTLY can't run inside a transaction; management commands run in autocommit
+                with conn.cursor() as cur:
+                    cur.execute(item["statement"])
+            self.stdout.write(self.style.SUCCESS(f"Created {len(advice)} indexes."))
+
+    # -------------------- analysis --------------------
+    def advise(self, conn, shapes, min_count=1):
+        """
+        [{"table", "columns", "count", "statement"}] for shapes no index serves,
+        most frequent first.
+        """
+        with conn.cursor() as cur:
+            tables = set(conn.introspection.table_names(cur))
+        candidates = Counter()
+        for shape, count in shapes.items():
+            if count < min_count or shape.table not in tables:
+                continue  # CTE / subquery aliases, other schemas
+            if shape.pattern and not (shape.eq or shape.range):
+                continue  # text search: create_search_indexes
+            cols = self.existing_prefix(conn, shape.table, candidate_columns(shape))
+            if cols:
+                candidates[(shape.table, cols)] += count
+
+        # (a) is served by an index on (a, b): fold prefixes into the longest candidate
+        folded = Counter()
+        for (table, cols), count in sorted(candidates.items(), key=lambda kv: -len(kv[0][1])):
+            wider = next((c for t, c in folded if t == table and c[: len(cols)] == cols), None)
+            folded[(table, wider or cols)] += count
+
+        advice = []
+        for (table, cols), count in folded.most_common():
+            if self.covered(conn, table, cols):
+                continue
+            advice.append({"table": table, "columns": cols, "count": count, "statement": create_statement(table, cols)})
+        return advice
+
+    def existing_prefix(self, conn, table, columns):
+        """
+        Leading run of `columns` that exist on `table` (an index is only useful up
+        to the first column it can't contain).
+        """
+        with conn.cursor() as cur:
+            present = {c.name for c in conn.introspection.get_table_description(cur, table)}
+        out = []
+        for col in columns:
+            if col not in present:
+                break
+            out.append(col)
+        return tuple(out)
+
+    def covered(self, conn, table, columns):
+        with conn.cursor() as cur:
+            constraints = conn.introspection.get_constraints(cur, table)
+        for info in constraints.values():
+            if not info.get("index") and not info.get("primary_key") and not info.get("unique"):
+                continue
+            if info.get("type") not in (None, "btree", "idx"):
+                continue  # gin / gist / hash can't serve ordered or range access
+            if tuple(info["columns"][: len(columns)]) == tuple(columns):
+                return True
+        return False
+
+    # -------------------- estimates --------------------
+    def hypopg_available(self, conn):
+        if conn.vendor != "postgresql":
+            return False
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'hypopg'")
+            return cur.fetchone() is not None
+
+    def estimate(self, conn, table, columns, hypothetical):
+        """
+        (cost before, cost after or None) of `SELECT * ... WHERE <cols> = <sample row>
+        ORDER BY <cols> LIMIT 100`. (None, None) off Postgres or on an empty table.
+        """
+        if conn.vendor != "postgresql":
+            return None, None
+        col_list = ", ".join(columns)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {col_list} FROM {table} LIMIT 1")
+            sample = cur.fetchone()
+            if sample is None:
+                return None, None
+            # equality on every column but the last, range on the last: the
+            # common "enrollment_id = x ORDER BY subject" / keyset page pattern
+            conditions = [f"{c} = %s" for c in columns[:-1]] + [f"{columns[-1]} >= %s"]
+            sql = f"SELECT * FROM {table} WHERE {' AND '.join(conditions)} ORDER BY {col_list} LIMIT 100"
+            before = self._plan_cost(cur, sql, sample)
+            after = None
+            if hypothetical:
+                cur.execute("SELECT * FROM hypopg_create_index(%s)", [create_statement(table, columns).replace(" CONCURRENTLY IF NOT EXISTS", "")])
+                try:
+                    after = self._plan_cost(cur, sql, sample)
+                finally:
+                    cur.execute("SELECT hypopg_reset()")
+        return before, after
+
+    @staticmethod
+    def _plan_cost(cur, sql, params):
+        cur.execute(f"EXPLAIN (FORMAT JSON) {sql}", list(params))
+        plan = cur.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return float(plan[0]["Plan"]["Total Cost"])
@@ -0,0 +1,240 @@
+# api/management/commands/bench_api.py
+"""
+Benchmark every route in api/urls.py through the Django test client.
+
+    python manage.py seed_synthetic --students 600 --years 2
+    python manage.py bench_api --iterations 50 --output bench.json
+
+For each route (router list/detail/search/export/batch-get actions plus the
+explicit paths) the runner issues --warmup untimed requests, then
+--iterations timed ones, and reports p50/p95/p99 latency, mean queries per
+request and response bytes as JSON, so two builds can be diffed. Detail and
+per-enrollment URLs use ids sampled from the database; routes whose table is
+empty are reported as skipped.
+
+Requests go through the full middleware stack (response cache included);
+--cold bumps the cache version before every request to measure misses.
+Streaming responses (export) are consumed fully, so their time and bytes
+include the whole body.
+"""
+import json
+import logging
+import re
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from api import cache as api_cache
+from api import urls as api_urls
+from api.views import AssessmentWeightsViewSet, RawReadOnlyViewSet
+
+API_PREFIX = "/api/"
+
+# detail ids of composite-key ORM viewsets, in their parse_pk() order
+DETAIL_KEYS = {
+    AssessmentWeightsViewSet: ("academic_year", "grade", "term", "assessment_type"),
+}
+
+BATCH_SIZE = 50
+# tuples per POST /grading/lookup/
+GRADING_ITEMS = 2000
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def _quote_id(parts):
+    return "~".join(quote(str(p), safe="") for p in parts)
+
+
+class Command(BaseCommand):
+    help = "Benchmark every API route and print p50/p95/p99, queries and bytes as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=20, help="Timed requests per route (default: 20)")
+        parser.add_argument("--warmup", type=int, default=2, help="Untimed requests per route (default: 2)")
+        parser.add_argument("--only", help="Only routes whose name contains this")
+        parser.add_argument("--cold", action="store_true", help="Invalidate the response cache before every request")
+        parser.add_argument("--admin", action="store_true", help="Log in as a (created) superuser")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ("*",) and not h.startswith(".")), "localhost")
+        self.client = Client(HTTP_HOST=host, raise_request_exception=False)
+        if options["admin"]:
+            user, _ = get_user_model().objects.get_or_create(
+                username="bench_api", defaults={"is_staff": True, "is_superuser": True}
+            )
+            self.client.force_login(user)
+
+        report = {
+            "meta": {
+                "vendor": connection.vendor,
+                "iterations": options["iterations"],
+                "warmup": options["warmup"],
+                "cold": options["cold"],
+                "tables": self.table_counts(),
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            },
+            "routes": {},
+        }
+        # per-request log lines (api.timing, 5xx tracebacks) would swamp the output
+        quiet = [logging.getLogger(name) for name in ("api.timing", "django.request")]
+        levels = [logger.level for logger in quiet]
+        for logger in quiet:
+            logger.setLevel(logging.CRITICAL)
+        try:
+            for name, method, url, body in self.routes():
+                if options["only"] and options["only"] not in name:
+                    continue
+                if url is None:
+                    report["routes"][name] = {"skipped": "no sample row"}
+                    continue
+                report["routes"][name] = self.bench(method, url, body, options)
+                self.stderr.write(f"{name}: p50 {report['routes'][name]['p50_ms']} ms")
+        finally:
+            for logger, level in zip(quiet, levels):
+                logger.setLevel(level)
+
+        output = json.dumps(report, indent=2, default=str)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(output + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    # -------------------- routes --------------------
+    def table_counts(self):
+        tables = sorted({vs.table_name for vs in RawReadOnlyViewSet.__subclasses__() if vs.table_name} | {"enrollments"})
+        counts = {}
+        with connection.cursor() as cur:
+            for table in tables:
+                try:
+                    cur.execute(f"SELECT count(*) FROM {table}")
+                    counts[table] = cur.fetchone()[0]
+                except Exception:
+                    counts[table] = None
+        return counts
+
+    def sample_rows(self, table, columns, limit=BATCH_SIZE):
+        try:
+            with connection.cursor() as cur:
+                cur.execute(f"SELECT DISTINCT {', '.join(columns)} FROM {table} ORDER BY 1 LIMIT {limit}")
+                return cur.fetchall()
+        except Exception:
+            return []
+
+    def sample_ids(self, viewset):
+        if issubclass(viewset, RawReadOnlyViewSet):
+            return [_quote_id(r) for r in self.sample_rows(viewset.table_name, viewset.key_columns)]
+        model = viewset.queryset.model
+        if viewset in DETAIL_KEYS:
+            columns = [model._meta.get_field(f).column for f in DETAIL_KEYS[viewset]]
+            return [_quote_id(r) for r in self.sample_rows(model._meta.db_table, columns)]
+        field = model._meta.pk if viewset.lookup_field == "pk" else model._meta.get_field(viewset.lookup_field)
+        return [quote(str(r[0]), safe="") for r in self.sample_rows(model._meta.db_table, [field.column])]
+
+    def routes(self):
+        """
+        (name, method, url or None, json body or None) for every route.
+        """
+        enrollment = self.sample_rows("enrollments", ["enrollment_id"], limit=1)
+        samples = {"enrollment_id": quote(enrollment[0][0], safe="") if enrollment else None}
+
+        for pattern in api_urls.urlpatterns:
+            route = str(pattern.pattern)
+            if not getattr(pattern, "name", None):
+                continue  # the router include
+            params = re.findall(r"<(?:\w+:)?(\w+)>", route)
+            if any(samples.get(p) is None for p in params):
+                yield pattern.name, "GET", None, None
+                continue
+            url = re.sub(r"<(?:\w+:)?(\w+)>", lambda m: samples[m.group(1)], route)
+            if pattern.name == "grading-lookup":
+                yield pattern.name, "POST", API_PREFIX + url, {"items": self.grading_items()}
+                continue
+            yield pattern.name, "GET", API_PREFIX + url, None
+
+        for prefix, viewset, basename in api_urls.router.registry:
+            base = f"{API_PREFIX}{prefix}/"
+            ids = self.sample_ids(viewset)
+            yield f"{basename}-list", "GET", base, None
+            yield f"{basename}-detail", "GET", (f"{base}{ids[0]}/" if ids else None), None
+            if hasattr(viewset, "batch_get"):
+                yield f"{basename}-batch-get", "POST", (f"{base}batch-get/" if ids else None), {"ids": ids}
+            if issubclass(viewset, RawReadOnlyViewSet):
+                yield f"{basename}-export", "GET", f"{base}export/?format=ndjson", None
+                if viewset.search_fields and ids:
+                    # a prefix of a real value of the last search field, so the search has hits
+                    field = viewset.search_fields[-1]
+                    parts = ids[0].split("~")
+                    value = parts[viewset.key_columns.index(field)] if field in viewset.key_columns else parts[-1]
+                    term = re.sub(r"\W", "", value)[:4] or "a"
+                    yield f"{basename}-search", "GET", f"{base}?q={quote(term)}", None
+
+    def grading_items(self):
+        """
+        MYP and DP tuples over the boundary keys actually in the database.
+        """
+        myp = [r[0] for r in self.sample_rows("myp_grade_boundaries", ["grade"])]
+        dp = self.sample_rows("dp_grade_boundaries", ["subject", "level"])
+        keys = [[g] for g in myp] + [list(k) for k in dp]
+        if not keys:
+            return []
+        return [keys[i % len(keys)] + [(i * 37) % 10001 / 100] for i in range(GRADING_ITEMS)]
+
+    # -------------------- timing --------------------
+    def request(self, method, url, body):
+        if method == "POST":
+            return self.client.post(url, data=json.dumps(body), content_type="application/json")
+        return self.client.get(url)
+
+    def bench(self, method, url, body, options):
+        for _ in range(options["warmup"]):
+            self.consume(self.request(method, url, body))
+
+        timings, queries, sizes, statuses = [], [], [], set()
+        for _ in range(max(options["iterations"], 1)):
+            if options["cold"]:
+                api_cache.bump_version()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = self.request(method, url, body)
+                size = self.consume(response)
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+            sizes.append(size)
+            statuses.add(response.status_code)
+
+        timings.sort()
+        return {
+            "method": method,
+            "url": url,
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(timings, 50), 2),
+            "p95_ms": round(percentile(timings, 95), 2),
+            "p99_ms": round(percentile(timings, 99), 2),
+            "mean_ms": round(sum(timings) / len(timings), 2),
+            "queries": round(sum(queries) / len(queries), 2),
+            "bytes": max(sizes),
+        }
+
+    @staticmethod
+    def consume(response):
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.content)
@@ -0,0 +1,59 @@
+# api/management/commands/change_log.py
+"""
+Install / inspect / prune the change capture behind GET /api/changes/
+(see api/changes.py):
+    python manage.py change_log --install
+    python manage.py change_log --install --table subjects --table enrollments
+    python manage.py change_log --status
+    python manage.py change_log --prune-days 30
+    python manage.py change_log --uninstall
+
+Re-run --install after recreating a table (e.g. `seed_synthetic --reset`);
+`manage.py ingest` keeps the triggers of the tables it reloads.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import changes
+
+
+class Command(BaseCommand):
+    help = "Install, inspect or prune the trigger-maintained change log"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--install", action="store_true", help="Create the log and the capture triggers")
+        parser.add_argument("--table", action="append", default=[], choices=list(changes.KEYS),
+                            help="Only capture these tables with --install (repeatable)")
+        parser.add_argument("--uninstall", action="store_true", help="Drop the triggers and the log")
+        parser.add_argument("--status", action="store_true", help="Print captured tables and log size as JSON")
+        parser.add_argument("--prune-days", type=int, help="Delete entries older than N days")
+
+    def handle(self, *args, **options):
+        if not (options["install"] or options["uninstall"] or options["status"] or options["prune_days"] is not None):
+            raise CommandError("Pass --install, --uninstall, --status or --prune-days N")
+        if options["install"] and options["uninstall"]:
+            raise CommandError("--install and --uninstall are mutually exclusive")
+
+        if options["uninstall"]:
+            changes.uninstall()
+            self.stdout.write(self.style.SUCCESS("Dropped the change log and its triggers."))
+            return
+
+        if options["install"]:
+            try:
+                tables = changes.install(options["table"])
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(f"Capturing changes of {', '.join(tables) or 'no tables'}."))
+        elif not changes.installed():
+            raise CommandError("The change log is not installed; run with --install first")
+
+        if options["prune_days"] is not None:
+            if options["prune_days"] < 0:
+                raise CommandError("--prune-days must be >= 0")
+            deleted = changes.prune(options["prune_days"])
+            self.stdout.write(f"Pruned {deleted} entries older than {options['prune_days']} days.")
+
+        if options["status"]:
+            self.stdout.write(json.dumps(changes.stats(), indent=2))
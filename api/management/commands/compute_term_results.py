@@ -0,0 +1,77 @@
+# api/management/commands/compute_term_results.py
+"""
+Compute weighted term / overall percentages per cohort into term_results
+(see api/terms.py).
+
+    python manage.py compute_term_results                                  # every cohort
+    python manage.py compute_term_results --academic-year 2024-25 --grade 9
+    python manage.py compute_term_results --grade 9 --dry-run
+"""
+import gc
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+
+from api import cache as api_cache
+from api import terms
+
+
+@contextmanager
+def _gc_paused():
+    # building ~1M small dicts next to the task lists would otherwise trigger
+    # repeated full collections that find nothing to free. gc.disable() is
+    # process-wide: fine for this command, not for a serving worker.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Command(BaseCommand):
+    help = "Compute weighted term percentages for whole cohorts and store them in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--academic-year", help="Only this academic year")
+        parser.add_argument("--grade", help="Only this grade")
+        parser.add_argument("--dry-run", action="store_true", help="Compute and report without writing")
+
+    def handle(self, *args, **options):
+        cohorts = [
+            (year, grade) for year, grade in terms.cohorts()
+            if options["academic_year"] in (None, year) and options["grade"] in (None, str(grade))
+        ]
+        if not cohorts:
+            self.stdout.write(self.style.WARNING("No matching cohorts in enrollments."))
+            return
+
+        total, skipped = 0, 0
+        for year, grade in cohorts:
+            if terms.weight_grade(grade) is None:
+                # assessment_weights.grade is an integer: nothing to weigh with
+                self.stdout.write(self.style.WARNING(f"{year} grade {grade!r}: not a numeric grade, skipped"))
+                skipped += 1
+                continue
+            start = time.perf_counter()
+            with _gc_paused():
+                results, weights = terms.compute_cohort(year, grade)
+            computed = time.perf_counter() - start
+            if not weights:
+                self.stdout.write(self.style.WARNING(f"{year} grade {grade}: no assessment_weights rows"))
+            if not options["dry_run"]:
+                terms.write_results(year, grade, results)
+            total += len(results)
+            self.stdout.write(
+                f"{year} grade {grade}: {len(results)} rows, "
+                f"computed in {computed:.2f}s, total {time.perf_counter() - start:.2f}s"
+            )
+
+        if not options["dry_run"]:
+            api_cache.bump_version(terms.RESULTS_TABLE)
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Computed' if options['dry_run'] else 'Wrote'} {total} rows for {len(cohorts) - skipped} cohort(s)"
+            + (f", skipped {skipped}." if skipped else ".")
+        ))
@@ -0,0 +1,45 @@
+# api/management/commands/create_search_indexes.py
+"""
+Create the pg_trgm GIN indexes backing `?q=` on the raw viewsets.
+
+Every RawReadOnlyViewSet subclass declares `search_fields`; this command
+installs pg_trgm (if allowed) and builds one gin_trgm_ops index per field with
+CREATE INDEX CONCURRENTLY, so it can run against the live database.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, DEFAULT_DB_ALIAS
+
+from api import search
+from api.views import RawReadOnlyViewSet
+
+
+class Command(BaseCommand):
+    help = "Create pg_trgm GIN indexes for the raw viewsets' search_fields"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--db-alias", default=DEFAULT_DB_ALIAS, help="DB alias to use (default: default)")
+        parser.add_argument("--dry-run", action="store_true", help="Print the statements without running them")
+
+    def handle(self, *args, **options):
+        conn = connections[options["db_alias"]]
+        dry_run = options["dry_run"]
+        if conn.vendor != "postgresql" and not dry_run:
+            raise CommandError(f"Trigram indexes need Postgres (this connection is {conn.vendor}); use --dry-run to print them")
+
+        statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+        for viewset in RawReadOnlyViewSet.__subclasses__():
+            if viewset.table_name and viewset.search_fields:
+                statements.extend(search.index_statements(viewset.table_name, viewset.search_fields))
+
+        for stmt in statements:
+            self.stdout.write(stmt + ";")
+            if dry_run:
+                continue
+            # CONCURRENTLY can't run inside a transaction; management commands run in autocommit
+            with conn.cursor() as cur:
+                cur.execute(stmt)
+
+        if not dry_run:
+            # the new extension may have been installed by this run
+            search._trgm_available.pop(conn.alias, None)
+            self.stdout.write(self.style.SUCCESS(f"Created/verified {len(statements) - 1} search indexes."))
@@ -0,0 +1,47 @@
+# api/management/commands/ingest.py
+"""
+Replace an ETL table with the rows of a CSV or NDJSON file (see api/ingest.py).
+
+    python manage.py ingest subjects subjects.csv
+    python manage.py ingest assessments_fa fa.ndjson
+    gunzip -c enrollments.csv.gz | python manage.py ingest enrollments - --format csv
+
+The file is COPYed into a staging table, checked against api/models.py and
+swapped in atomically; readers see either the old rows or all of the new ones.
+"""
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import ingest
+
+
+class Command(BaseCommand):
+    help = "Bulk-load a CSV / NDJSON file into a table through a staging table and an atomic swap"
+
+    def add_arguments(self, parser):
+        parser.add_argument("table", choices=ingest.TABLES, help="Table to replace")
+        parser.add_argument("path", help="CSV (with a header line) or NDJSON file; - for stdin")
+        parser.add_argument("--format", choices=ingest.FORMATS, default=None,
+                            help="Input format (default: from the file extension)")
+        parser.add_argument("--allow-empty", action="store_true", help="Allow a file without rows to empty the table")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ingest.format_for(path)
+        if fmt is None:
+            raise CommandError("Can't tell the format from the file name; pass --format csv|ndjson")
+
+        source = sys.stdin.buffer if path == "-" else open(path, "rb")
+        try:
+            result = ingest.ingest(options["table"], source, fmt, allow_empty=options["allow_empty"])
+        except ingest.IngestError as e:
+            raise CommandError(str(e))
+        finally:
+            if source is not sys.stdin.buffer:
+                source.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['table']}: {result['rows']} rows "
+            f"(load {result['load_ms']} ms, indexes {result['index_ms']} ms, swap {result['swap_ms']} ms)"
+        ))
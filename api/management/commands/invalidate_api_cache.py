@@ -0,0 +1,57 @@
+# api/management/commands/invalidate_api_cache.py
+"""
+Bump the response-cache version counters (see api/cache.py).
+
+Run this from the ETL after reloading tables:
+    python manage.py invalidate_api_cache --table assessments_fa
+    python manage.py invalidate_api_cache --table subjects --enrollment E123
+    python manage.py invalidate_api_cache --table dp_grade_boundaries
+    python manage.py invalidate_api_cache --all
+
+Hit/miss counters are per worker: GET /api/cache/stats/.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from api import cache as api_cache
+from api import grading
+from api.views import RawReadOnlyViewSet
+
+
+def known_tables():
+    # the grade-boundary tables also drive the workers' in-process index
+    return sorted({vs.table_name for vs in RawReadOnlyViewSet.__subclasses__() if vs.table_name} | set(grading.TABLES))
+
+
+class Command(BaseCommand):
+    help = "Invalidate cached API responses for a table, one enrollment, or everything"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", action="append", default=[], help="Table to invalidate (repeatable)")
+        parser.add_argument("--enrollment", action="append", default=[],
+                            help="Only invalidate these enrollment ids of --table (repeatable)")
+        parser.add_argument("--all", action="store_true", help="Invalidate every cached response")
+
+    def handle(self, *args, **options):
+        tables = options["table"]
+        enrollments = options["enrollment"]
+
+        if options["all"]:
+            version = api_cache.bump_version()
+            self.stdout.write(self.style.SUCCESS(f"Invalidated all cached responses (global version {version})"))
+            return
+
+        if not tables:
+            raise CommandError("Pass --table <name> (optionally with --enrollment) or --all")
+        unknown = set(tables) - set(known_tables())
+        if unknown:
+            raise CommandError(f"Unknown table(s): {', '.join(sorted(unknown))}. Known: {', '.join(known_tables())}")
+
+        for table in tables:
+            if enrollments:
+                for enrollment_id in enrollments:
+                    version = api_cache.bump_version(table, enrollment_id)
+                    self.stdout.write(f"{table} / {enrollment_id}: version {version}")
+            else:
+                version = api_cache.bump_version(table)
+                self.stdout.write(f"{table}: version {version}")
+        self.stdout.write(self.style.SUCCESS("Done."))
@@ -0,0 +1,30 @@
+# api/management/commands/refresh_student_summary.py
+"""
+Rebuild the student_summary table (see api/summary.py).
+
+Run this from the ETL after loading enrollments / subjects:
+    python manage.py refresh_student_summary                     # changed enrollments only
+    python manage.py refresh_student_summary --enrollment E123   # just these
+    python manage.py refresh_student_summary --full              # everything
+
+Finding the changed enrollments reads both source tables in full unless the
+change log captures them (`manage.py change_log --install`).
+"""
+from django.core.management.base import BaseCommand
+
+from api import summary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the changed rows of the per-student summary table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--enrollment", action="append", default=None,
+                            help="Rebuild only these enrollment ids (repeatable)")
+        parser.add_argument("--full", action="store_true", help="Rebuild every enrollment")
+
+    def handle(self, *args, **options):
+        result = summary.refresh(enrollment_ids=options["enrollment"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{summary.TABLE}: rebuilt {result['rebuilt']}, deleted {result['deleted']} ({result['mode']})"
+        ))
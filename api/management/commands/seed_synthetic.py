@@ -0,0 +1,391 @@
+# api/management/commands/seed_synthetic.py
+"""
+Create the unmanaged tables in a local database (SQLite or a local Postgres)
+and fill them with synthetic but realistic data, for development and for
+`manage.py bench_api`.
+
+    python manage.py seed_synthetic --students 1000 --years 2
+
+Every student gets one enrollment per academic year, six subjects, and FA /
+SA / EOL / non-academic rows per subject. FA rows carry the per-task array
+columns (month, task_name, teachers, student_score, max_score_old) and
+reproduce what the ETL leaves behind: one key split over several rows,
+rows repeated verbatim, tasks repeated inside arrays, blank scores and stale
+count_* columns -- everything _group_fa_rows() cleans up.
+
+Each enrollment comes to ~80 rows, so 10k, 100k and 1M rows are about
+--students 60 / 600 / 6000 with --years 2. On SQLite the array columns are
+stored as JSON text.
+
+Refuses to run against a non-local database unless --force is given.
+"""
+import json
+import random
+from decimal import Decimal
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Postgres array columns of assessments_fa (api.views.AssessmentFAViewSet.FA_ARRAY_COLUMNS)
+FA_ARRAY_TYPES = {
+    "month": "text[]",
+    "task_name": "text[]",
+    "teachers": "text[]",
+    "student_score": "text[]",
+    "max_score_old": "numeric[]",
+}
+
+SCHOOLS = ["North Campus", "South Campus", "International Wing"]
+SUBJECTS = [
+    "Mathematics", "English", "Sciences", "Individuals and Societies",
+    "Language Acquisition", "Design", "Arts", "Physical and Health Education",
+]
+FA_CRITERIA = ["SDL", "WT", "FA"]
+SA_TYPES = ["HYE", "Project", "December Test", "Mock"]
+EOL_TYPES = ["EOL T1", "EOL T2"]
+NON_ACADEMIC = {"Sports": ["Athletics", "Swimming"], "Clubs": ["Debate", "Robotics"], "Service": ["Community Hours"]}
+TEACHERS = ["A. Rao", "B. Iyer", "C. Menon", "D. Khan", "E. Das", "F. Nair", "G. Pillai", "H. Shah"]
+FIRST_NAMES = ["Aarav", "Diya", "Ishaan", "Meera", "Kabir", "Anaya", "Vihaan", "Sara", "Arjun", "Tara"]
+LAST_NAMES = ["Sharma", "Reddy", "Kumar", "Patel", "Singh", "Joseph", "Verma", "Gupta"]
+TERMS = ["T1", "T2", "T3"]
+FIRST_YEAR = 2022
+
+
+def _local(conn):
+    if conn.vendor == "sqlite":
+        return True
+    host = conn.settings_dict.get("HOST") or ""
+    return host in ("", "localhost", "127.0.0.1", "::1") or host.startswith("/")
+
+
+def _seeded_models():
+    return [m for m in apps.get_app_config("api").get_models() if not m._meta.managed]
+
+
+class Command(BaseCommand):
+    help = "Create the unmanaged tables locally and fill them with synthetic data"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--students", type=int, default=100, help="Students per academic year (default: 100)")
+        parser.add_argument("--years", type=int, default=1, help="Academic years, starting 2022-23 (default: 1)")
+        parser.add_argument("--seed", type=int, default=42, help="Random seed (default: 42)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per INSERT batch (default: 5000)")
+        parser.add_argument("--reset", action="store_true", help="Drop and recreate the tables first")
+        parser.add_argument("--db-alias", default=DEFAULT_DB_ALIAS, help="DB alias to use (default: default)")
+        parser.add_argument("--force", action="store_true", help="Allow a non-local database")
+
+    def handle(self, *args, **options):
+        conn = connections[options["db_alias"]]
+        if not _local(conn) and not options["force"]:
+            raise CommandError(
+                f"Refusing to seed {conn.settings_dict.get('HOST')!r}: not a local database (use --force)"
+            )
+        self.conn = conn
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+
+        models = _seeded_models()
+        self.create_tables(models, reset=options["reset"])
+        by_table = {m._meta.db_table: m for m in models}
+
+        counts = {}
+        for table, rows in self.generate(options["students"], options["years"]):
+            counts[table] = self.insert(by_table[table], rows)
+            self.stdout.write(f"{table}: {counts[table]} rows")
+        self.stdout.write(self.style.SUCCESS(f"Seeded {sum(counts.values())} rows into {len(counts)} tables."))
+
+    # -------------------- DDL --------------------
+    def column_type(self, model, field):
+        if self.conn.vendor == "postgresql" and model._meta.db_table == "assessments_fa":
+            if field.column in FA_ARRAY_TYPES:
+                return FA_ARRAY_TYPES[field.column]
+        if field.get_internal_type() in ("AutoField", "BigAutoField"):
+            return "integer"
+        if field.get_internal_type() == "JSONField":
+            return "jsonb" if self.conn.vendor == "postgresql" else "text"
+        return field.db_type(self.conn)
+
+    def create_tables(self, models, reset=False):
+        qn = self.conn.ops.quote_name
+        with self.conn.cursor() as cur:
+            for model in models:
+                table = model._meta.db_table
+                if reset:
+                    cur.execute(f"DROP TABLE IF EXISTS {qn(table)}")
+                # no PRIMARY KEY: several "pk" columns hold duplicates in the real data
+                columns = ", ".join(
+                    f"{qn(f.column)} {self.column_type(model, f)}" for f in model._meta.concrete_fields
+                )
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {qn(table)} ({columns})")
+
+    # -------------------- inserts --------------------
+    def adapt(self, model, field, value):
+        if value is None:
+            return None
+        if isinstance(value, list):
+            if self.conn.vendor == "postgresql" and model._meta.db_table == "assessments_fa":
+                return value
+            return json.dumps(value, default=str)
+        if field.get_internal_type() == "JSONField":
+            return json.dumps(value)
+        return value
+
+    def insert(self, model, rows):
+        fields = model._meta.concrete_fields
+        qn = self.conn.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(model._meta.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+            f"VALUES ({', '.join(['%s'] * len(fields))})"
+        )
+        total = 0
+        batch = []
+        for row in rows:
+            batch.append([self.adapt(model, f, row.get(f.column)) for f in fields])
+            if len(batch) >= self.batch_size:
+                total += self.flush(sql, batch)
+                batch = []
+        if batch:
+            total += self.flush(sql, batch)
+        return total
+
+    def flush(self, sql, batch):
+        with transaction.atomic(using=self.conn.alias), self.conn.cursor() as cur:
+            cur.executemany(sql, batch)
+        return len(batch)
+
+    # -------------------- data --------------------
+    def generate(self, students, years):
+        enrollments = [
+            (student, FIRST_YEAR + y)
+            for y in range(years)
+            for student in range(students)
+        ]
+        yield "enrollments", (self.enrollment(s, year) for s, year in enrollments)
+        yield "subjects", (row for s, year in enrollments for row in self.subjects(s, year))
+        yield "assessments_fa", (row for s, year in enrollments for row in self.fa(s, year))
+        yield "assessments_sa", (row for s, year in enrollments for row in self.sa(s, year))
+        yield "assessments_eol", (row for s, year in enrollments for row in self.eol(s, year))
+        yield "assessments_non_academic", (row for s, year in enrollments for row in self.non_academic(s, year))
+        yield "assessment_weights", self.weights(years)
+        yield "myp_grade_boundaries", self.myp_boundaries()
+        yield "dp_grade_boundaries", self.dp_boundaries()
+
+    @staticmethod
+    def enrollment_id(student, year):
+        return f"S{student:06d}-{year}"
+
+    @staticmethod
+    def academic_year(year):
+        return f"{year}-{(year + 1) % 100:02d}"
+
+    @staticmethod
+    def grade(student, year):
+        return str(6 + (student + year - FIRST_YEAR) % 5)
+
+    def subjects_for(self, student):
+        # stable per student across years
+        return random.Random(student).sample(SUBJECTS, 6)
+
+    def pct(self):
+        return Decimal(self.rng.randint(3500, 9800)) / 100
+
+    def enrollment(self, student, year):
+        rng = self.rng
+        subjects = self.subjects_for(student)
+        current = self.pct()
+        return {
+            "enrollment_id": self.enrollment_id(student, year),
+            "user_email": f"student{student:06d}@example.edu",
+            "user_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "academic_year": self.academic_year(year),
+            "grade": self.grade(student, year),
+            "school": SCHOOLS[student % len(SCHOOLS)],
+            "current_pct_overall": current,
+            "predictive_pct_overall": min(current + rng.randint(-5, 8), Decimal(100)),
+            "descriptive_overall": "Consistent progress across terms.",
+            "prescriptive_overall": "Focus on timed written practice.",
+            "engagement_analysis_overall": "Engaged",
+            "engagement_analysis": {"attendance": rng.randint(70, 100), "submissions": rng.randint(60, 100)},
+            "strongest_subject": subjects[0],
+            "weakest_subject": subjects[-1],
+            "subjects_taken": ", ".join(subjects),
+            "current": "yes" if year == FIRST_YEAR else "no",
+            "current_grade_overall": str(rng.randint(3, 7)),
+            "predicted_grade_overall": str(rng.randint(3, 7)),
+            "total_grade_overall": str(rng.randint(20, 42)),
+        }
+
+    def subjects(self, student, year):
+        rng = self.rng
+        for subject in self.subjects_for(student):
+            current = self.pct()
+            yield {
+                "enrollment_id": self.enrollment_id(student, year),
+                "subject": subject,
+                "grade": self.grade(student, year),
+                "current_sub_pct": current,
+                "predicted_sub_pct": self.pct(),
+                "current_sub_ib": Decimal(rng.randint(10, 70)) / 10,
+                "predicted_sub_ib": Decimal(rng.randint(10, 70)) / 10,
+                "descriptive_sub": f"{subject}: steady.",
+                "prescriptive_sub": "Revise criterion B tasks.",
+                "engagement_analysis_sub": "Engaged",
+                "current_sub": "yes",
+                "dates": f"{year}-09-01,{year + 1}-03-31",
+                "engagement_analysis": {"homework": rng.randint(50, 100)},
+                "current_sub_grade": str(rng.randint(3, 7)),
+                "predicted_sub_grade": str(rng.randint(3, 7)),
+            }
+
+    def tasks(self, year, n):
+        rng = self.rng
+        months = [f"{year + (m > 12)}-{(m - 1) % 12 + 1:02d}" for m in (rng.randint(8, 17) for _ in range(n))]
+        names = [f"Task {rng.randint(1, 12)}" for _ in range(n)]
+        teachers = [rng.choice(TEACHERS) for _ in range(n)]
+        maxima = [Decimal(rng.choice([8, 10, 20, 25])) for _ in range(n)]
+        scores = []
+        for mx in maxima:
+            roll = rng.random()
+            if roll < 0.05:
+                scores.append(None)
+            elif roll < 0.1:
+                scores.append("")
+            else:
+                scores.append(str(Decimal(rng.randint(0, int(mx) * 2)) / 2))
+        return months, names, teachers, scores, maxima
+
+    def fa(self, student, year):
+        rng = self.rng
+        eid = self.enrollment_id(student, year)
+        for subject in self.subjects_for(student):
+            for criteria in FA_CRITERIA:
+                base = {
+                    "enrollment_id": eid,
+                    "subject": subject,
+                    "grade": self.grade(student, year),
+                    "assessment_type": "FA",
+                    "evaluation_criteria": criteria,
+                    # stale counts, recomputed by the grouping
+                    f"count_{'fawriting' if criteria == 'FA' else criteria.lower()}_t1": rng.randint(0, 9),
+                    "current_percentage": self.pct(),
+                    "predicted_percentage": self.pct(),
+                    "descriptive_analysis": f"{criteria} work in {subject}.",
+                    "prescriptive_analysis": "Keep a reflection journal.",
+                }
+                # the ETL splits one key over 1-3 rows ...
+                rows = []
+                for _ in range(rng.randint(1, 3)):
+                    months, names, teachers, scores, maxima = self.tasks(year, rng.randint(1, 6))
+                    if months and rng.random() < 0.3:
+                        # ... repeats tasks inside an array ...
+                        i = rng.randrange(len(months))
+                        for col in (months, names, teachers, scores, maxima):
+                            col.append(col[i])
+                    rows.append({
+                        **base,
+                        "month": months,
+                        "task_name": names,
+                        "teachers": teachers,
+                        "student_score": scores,
+                        "max_score_old": maxima,
+                    })
+                # ... and sometimes emits the same row twice
+                if rng.random() < 0.2:
+                    rows.append(dict(rows[0]))
+                yield from rows
+
+    def sa(self, student, year):
+        rng = self.rng
+        eid = self.enrollment_id(student, year)
+        for subject in self.subjects_for(student):
+            for kind in rng.sample(SA_TYPES, 3):
+                mx = Decimal(rng.choice([40, 50, 80, 100]))
+                yield {
+                    "enrollment_id": eid,
+                    "subject": subject,
+                    "grade": self.grade(student, year),
+                    "assessment_type": "SA",
+                    "month": f"{year + 1}-0{rng.randint(1, 3)}",
+                    "evaluation_criteria": kind,
+                    "task_name": f"{kind} paper",
+                    "teachers": rng.choice(TEACHERS),
+                    "student_score": str(rng.randint(0, int(mx))),
+                    "max_score_old": mx,
+                    "count_sa": 1,
+                    "current_percentage": self.pct(),
+                    "predicted_percentage": self.pct(),
+                    "descriptive_analysis": f"{kind}: secure on core skills.",
+                    "prescriptive_analysis": "Practise extended responses.",
+                }
+
+    def eol(self, student, year):
+        rng = self.rng
+        eid = self.enrollment_id(student, year)
+        for subject in self.subjects_for(student):
+            for kind in EOL_TYPES:
+                yield {
+                    "enrollment_id": eid,
+                    "subject": subject,
+                    "grade": self.grade(student, year),
+                    "assessment_type": kind,
+                    "topic": f"{subject} unit {rng.randint(1, 6)}",
+                    "teachers": rng.choice(TEACHERS),
+                    "obtained_marks": str(rng.randint(5, 50)),
+                    "total_marks": Decimal(50),
+                    "cnt": str(rng.randint(1, 4)),
+                    "average": self.pct(),
+                }
+
+    def non_academic(self, student, year):
+        rng = self.rng
+        eid = self.enrollment_id(student, year)
+        for subject, tasks in NON_ACADEMIC.items():
+            for task in tasks:
+                yield {
+                    "enrollment_id": eid,
+                    "subject": subject,
+                    "grade": self.grade(student, year),
+                    "assessment_type": "Non-Academic",
+                    "task_name": task,
+                    "student_score": str(rng.randint(0, 10)),
+                    "max_score_old": "10",
+                    "total_percentage": self.pct(),
+                    "descriptive_analysis": f"{task}: active participant.",
+                    "prescriptive_analysis": "",
+                }
+
+    def weights(self, years):
+        for y in range(years):
+            for grade in range(6, 11):
+                for term in TERMS:
+                    for kind, weight in (("FA", 40), ("SA", 60)):
+                        yield {
+                            "academic_year": self.academic_year(FIRST_YEAR + y),
+                            "grade": grade,
+                            "term": term,
+                            "assessment_type": kind,
+                            "weight": Decimal(weight),
+                        }
+
+    def myp_boundaries(self):
+        for grade in range(6, 11):
+            for level in range(1, 8):
+                yield {
+                    "grade": grade,
+                    "boundary_level": level,
+                    "min_score": Decimal((level - 1) * 14 + 1 if level > 1 else 0),
+                    "max_score": Decimal(level * 14 if level < 7 else 100),
+                }
+
+    def dp_boundaries(self):
+        for subject in SUBJECTS:
+            for level in ("SL", "HL"):
+                for grade in range(1, 8):
+                    yield {
+                        "subject": subject,
+                        "level": level,
+                        "grade": grade,
+                        "min_score": Decimal((grade - 1) * 14 + 1 if grade > 1 else 0),
+                        "max_score": Decimal(grade * 14 if grade < 7 else 100),
+                    }
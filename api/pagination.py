@@ -0,0 +1,562 @@
+# api/pagination.py
+"""
+Keyset (cursor) pagination for the raw-SQL viewsets (RawKeysetPagination)
+and the ORM viewsets (KeysetPagination).
+
+RawReadOnlyViewSet subclasses declare `key_columns` (the same columns their
+parse_pk_parts() filters on). Pages are fetched with a row-value comparison
+on those columns, e.g.
+
+    WHERE (enrollment_id, subject) > (%s, %s) ORDER BY enrollment_id, subject LIMIT n + 1
+
+so every page costs one index range scan no matter how deep the client goes.
+The cursor handed back to clients is an opaque base64 token; its values are
+checked against the key columns' model fields before they reach the SQL.
+
+Key columns may hold NULLs, which a row-value comparison never matches.
+Pages are ordered NULLS LAST (Postgres' btree order, so the index still
+serves the ORDER BY), and a cursor seeks with one index-friendly branch per
+way a row can follow it, e.g. for two nullable columns
+
+    (a, b) > (%s, %s)                  -- both set, past the cursor
+    a = %s AND b IS NULL               -- same a, NULL b
+    a IS NULL                          -- NULL a
+
+combined with UNION ALL and each limited to n + 1 rows. A unique key (the
+table's primary key) and the physical row id need no NULL branches; the
+models' "primary keys" of the raw tables are nullable in the real data.
+
+ORM list pages report a `count` without scanning the table: the planner's
+estimate (pg_class.reltuples, or EXPLAIN's row estimate for a filtered
+queryset) with `"count_estimated": true`. Small results, backends without
+estimates and `?count=exact` get a real COUNT(*).
+"""
+import base64
+import json
+import re
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import BooleanField, F
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .rawsql import dictfetchall
+
+# extra column selected alongside the row so pages can split duplicate keys
+TIEBREAK_ALIAS = "_keyset_tb"
+# key columns of group mode's page of keys
+KEY_ALIAS = "_keyset_k{}"
+_TID_RE = re.compile(r"^\(\d+,\d+\)$")
+
+
+def _tiebreak_sql():
+    """
+    Physical row id used to break ties between rows sharing the same key.
+    The raw tables have no surrogate id, so use ctid (Postgres) / rowid (SQLite).
+    """
+    if connection.vendor == "postgresql":
+        return "ctid", "%s::tid", "ctid::text"
+    return "rowid", "%s", "rowid"
+
+
+def valid_tiebreak(value):
+    """
+    Whether `value` (from a cursor) can be a _tiebreak_sql() row id.
+    """
+    if connection.vendor == "postgresql":
+        return isinstance(value, str) and _TID_RE.match(value) is not None
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _seek_terms(columns, values, nullable, reverse, placeholders):
+    """
+    [[(sql, params), ...], ...]: conditions, ANDed within a term and ORed
+    across terms, selecting the rows after (before if `reverse`) `values` in
+    the order `columns` NULLS LAST. Each term is an index range on a prefix
+    of `columns`.
+    """
+    if not columns:
+        return []
+    # the longest prefix without NULLs is one row-value comparison
+    j = next((i for i, v in enumerate(values) if v is None), len(values))
+    prefix = [(f"{c} = {ph}", [v]) for c, ph, v in zip(columns[:j], placeholders[:j], values[:j])]
+    terms = []
+    if j:
+        op = "<" if reverse else ">"
+        terms.append([(f"({', '.join(columns[:j])}) {op} ({', '.join(placeholders[:j])})", list(values[:j]))])
+    if not reverse:
+        # NULLs sort after every value
+        terms += [prefix[:k] + [(f"{columns[k]} IS NULL", [])] for k in range(j) if nullable[k]]
+    if j < len(columns):
+        if reverse:
+            terms.append(prefix + [(f"{columns[j]} IS NOT NULL", [])])
+        same = prefix + [(f"{columns[j]} IS NULL", [])]
+        rest = _seek_terms(columns[j + 1:], values[j + 1:], nullable[j + 1:], reverse, placeholders[j + 1:])
+        terms += [same + term for term in rest]
+    return terms
+
+
+class RawKeysetPagination:
+    """
+    Cursor paginator for `SELECT * FROM <table>` style queries.
+
+    Two modes:
+      - row mode (default): one result per row, ties on key_columns broken by
+        the physical row id.
+      - group mode (group_keys=True): a page is N distinct key tuples plus every
+        row belonging to them; used by viewsets that merge rows per key (FA).
+
+    unique_key=True declares key_columns unique (a primary key), so row mode
+    orders and seeks on them alone, without the physical row id.
+
+    key_fields: the model field of each key column (None where unknown);
+    cursor values must pass its to_python().
+    """
+    cursor_query_param = "cursor"
+    page_size_query_param = "page_size"
+    page_size = 100
+    invalid_cursor_message = "Invalid cursor"
+
+    def __init__(self, key_columns, max_page_size=1000, group_keys=False, unique_key=False, key_fields=None):
+        self.key_columns = list(key_columns)
+        self.max_page_size = max_page_size
+        self.group_keys = group_keys
+        self.unique_key = unique_key
+        self.key_fields = list(key_fields or [None] * len(self.key_columns))
+
+    # -------------------- cursor encoding --------------------
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({"p": position, "r": int(reverse)}, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            position = payload["p"]
+            reverse = bool(payload.get("r", 0))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != self.width:
+            raise NotFound(self.invalid_cursor_message)
+        return self.clean_position(position), reverse
+
+    def clean_position(self, position):
+        """
+        The cursor's key values converted by their model fields; NotFound for
+        values no row of this table could have had.
+        """
+        cleaned = []
+        for value, field, nullable in zip(position, self.key_fields, self.nullable):
+            if value is None:
+                if not nullable:
+                    raise NotFound(self.invalid_cursor_message)
+            elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+                raise NotFound(self.invalid_cursor_message)
+            elif field is not None:
+                try:
+                    value = field.to_python(value)
+                except ValidationError:
+                    raise NotFound(self.invalid_cursor_message)
+            cleaned.append(value)
+        if self.width > len(self.key_columns):
+            if not valid_tiebreak(position[-1]):
+                raise NotFound(self.invalid_cursor_message)
+            cleaned.append(position[-1])
+        return cleaned
+
+    @property
+    def width(self):
+        return len(self.key_columns) + (0 if self.group_keys or self.unique_key else 1)
+
+    @property
+    def nullable(self):
+        # a primary key (unique_key) is NOT NULL
+        return [not self.unique_key] * len(self.key_columns)
+
+    def get_page_size(self, request):
+        raw = request.query_params.get(self.page_size_query_param)
+        if raw:
+            try:
+                size = int(raw)
+            except ValueError:
+                size = self.page_size
+            if size > 0:
+                return min(size, self.max_page_size)
+        return min(self.page_size, self.max_page_size)
+
+    # -------------------- query --------------------
+    def paginate(self, request, table_name, where_sql=None, params=None, columns="*"):
+        """
+        Run the page query and return the list of row dicts for this page.
+        `where_sql`/`params` are an optional extra filter (e.g. search) ANDed
+        with the keyset predicate; `columns` is the SELECT list (it must
+        include the key columns).
+        """
+        sql, query_params = self.prepare(request, table_name, where_sql, params, columns)
+        with connection.cursor() as cur:
+            cur.execute(sql, query_params)
+            rows = dictfetchall(cur)
+        return self.finish(rows)
+
+    def prepare(self, request, table_name, where_sql=None, params=None, columns="*"):
+        """
+        Build (sql, params) of the page query without running it.
+        """
+        self.request = request
+        self.size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        self.cursor_given = position is not None
+        self.reverse = reverse
+
+        limit = self.size + 1
+        order_cols, nullable = self.key_columns, self.nullable
+        placeholders = ["%s"] * len(order_cols)
+        if not (self.group_keys or self.unique_key):
+            tb_col, tb_placeholder, _ = _tiebreak_sql()
+            order_cols, nullable, placeholders = order_cols + [tb_col], nullable + [False], placeholders + [tb_placeholder]
+        terms = [[]]
+        if position is not None:
+            # nothing can follow a cursor on the last NULL row of a row id-less key
+            terms = _seek_terms(order_cols, position, nullable, reverse, placeholders) or [[("1 = 0", [])]]
+
+        def order_by(names):
+            if reverse:
+                return ", ".join(f"{c} DESC NULLS FIRST" for c in names)
+            return ", ".join(f"{c} NULLS LAST" for c in names)
+
+        def branch(select, term):
+            conditions = ([where_sql] if where_sql else []) + [sql for sql, _ in term]
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            branch_params = list(params or []) + [v for _, p in term for v in p]
+            return f"{select}{where} ORDER BY {order_by(order_cols)} LIMIT {limit}", branch_params
+
+        def union(select, result_order):
+            # one branch per term, merged in page order
+            if len(terms) == 1:
+                return branch(select, terms[0])
+            parts, query_params = [], []
+            for i, term in enumerate(terms):
+                sql, branch_params = branch(select, term)
+                parts.append(f"SELECT * FROM ({sql}) AS _keyset_{i}")
+                query_params += branch_params
+            return f"{' UNION ALL '.join(parts)} ORDER BY {order_by(result_order)} LIMIT {limit}", query_params
+
+        if self.group_keys:
+            # pick N+1 keys first, then pull every row for those keys (in
+            # physical order within a key, so row merging is deterministic)
+            aliases = [KEY_ALIAS.format(i) for i in range(len(self.key_columns))]
+            keys_sql, query_params = union(
+                f"SELECT DISTINCT {', '.join(f'{c} AS {a}' for c, a in zip(self.key_columns, aliases))} FROM {table_name}",
+                aliases,
+            )
+            tb_col = _tiebreak_sql()[0]
+            pairs = [(f"{table_name}.{c}", f"_keyset_keys.{a}") for c, a in zip(self.key_columns, aliases)]
+            select = f"{table_name}.*" if columns == "*" else columns
+            rows_select = f"SELECT {select}, {table_name}.{tb_col} AS {TIEBREAK_ALIAS} FROM {table_name}"
+            if connection.vendor == "postgresql":
+                # plain equality keeps the join hashable / indexable; the
+                # (rare) keys holding a NULL each look their rows up in a
+                # lateral subquery, which doesn't run when there are none
+                equal = " AND ".join(f"{c} = {a}" for c, a in pairs)
+                null_safe = " AND ".join(f"({c} = {a} OR ({c} IS NULL AND {a} IS NULL))" for c, a in pairs)
+                has_null = " OR ".join(f"{a} IS NULL" for _, a in pairs)
+                sql = (
+                    f"WITH _keyset_keys AS ({keys_sql}) "
+                    f"{rows_select} JOIN _keyset_keys ON {equal} UNION ALL "
+                    f"SELECT _keyset_rows.* FROM _keyset_keys CROSS JOIN LATERAL ({rows_select} WHERE {null_safe}) AS _keyset_rows"
+                    f" WHERE {has_null}"
+                )
+            else:
+                # SQLite's IS is a NULL-safe (and indexable) equality
+                equal = " AND ".join(f"{c} IS {a}" for c, a in pairs)
+                sql = f"{rows_select} JOIN ({keys_sql}) AS _keyset_keys ON {equal}"
+            direction = " DESC" if reverse else ""
+            sql += f" ORDER BY {order_by(self.key_columns)}, {TIEBREAK_ALIAS}{direction}"
+        elif self.unique_key:
+            sql, query_params = union(f"SELECT {columns} FROM {table_name}", order_cols)
+        else:
+            sql, query_params = union(
+                f"SELECT {columns}, {tb_col} AS {TIEBREAK_ALIAS} FROM {table_name}",
+                self.key_columns + [TIEBREAK_ALIAS],
+            )
+
+        self.position = position
+        return sql, query_params
+
+    def finish(self, rows):
+        """
+        Trim the N+1 probe row(s) and work out next/previous positions.
+        """
+        position, reverse = self.position, self.reverse
+        positions = [self._position(row) for row in rows]
+        if self.group_keys:
+            distinct = list(dict.fromkeys(tuple(p) for p in positions))
+            has_more = len(distinct) > self.size
+            if has_more:
+                keep = set(distinct[: self.size])
+                kept = [(r, p) for r, p in zip(rows, positions) if tuple(p) in keep]
+                rows = [r for r, _ in kept]
+                positions = [p for _, p in kept]
+        else:
+            has_more = len(rows) > self.size
+            rows, positions = rows[: self.size], positions[: self.size]
+        for row in rows:
+            row.pop(TIEBREAK_ALIAS, None)
+
+        if reverse:
+            rows.reverse()
+            positions.reverse()
+
+        if reverse:
+            self.has_previous, self.has_next = has_more, self.cursor_given
+        else:
+            self.has_previous, self.has_next = self.cursor_given, has_more
+
+        self.first_position = positions[0] if positions else None
+        self.last_position = positions[-1] if positions else None
+        if not rows and self.cursor_given:
+            # empty page after a cursor: keep the client able to step back/forward
+            self.first_position = self.last_position = position
+        return rows
+
+    def _position(self, row):
+        position = [row.get(c) for c in self.key_columns]
+        if not (self.group_keys or self.unique_key):
+            position.append(row.get(TIEBREAK_ALIAS))
+        return position
+
+    # -------------------- response --------------------
+    def _link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if not self.has_next or self.last_position is None:
+            return None
+        return self._link(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self._link(self.first_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+
+# -------------------- ORM viewsets --------------------
+def estimated_count(queryset):
+    """
+    The planner's row estimate for `queryset`, or None where there is none
+    (not Postgres, table never analyzed). Catalog / EXPLAIN only: no rows
+    are read.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    if not queryset.query.where:
+        table = connection.ops.quote_name(queryset.model._meta.db_table)
+        with connection.cursor() as cur:
+            cur.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cur.fetchone()
+        estimate = row[0] if row else -1
+    else:
+        plan = json.loads(queryset.order_by().explain(format="json"))
+        estimate = int(plan[0]["Plan"]["Plan Rows"])
+    # reltuples is -1 until the first ANALYZE / VACUUM
+    return estimate if estimate >= 0 else None
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Cursor pagination for ORM querysets, ordered by the primary key.
+
+    The inspected "primary keys" aren't always unique or even set (see
+    seed_synthetic), so, as in RawKeysetPagination, ties are broken by the
+    physical row id and NULL keys sort last:
+
+        WHERE (enrollment_id, ctid) > (%s, %s::tid) OR enrollment_id IS NULL
+        ORDER BY enrollment_id NULLS LAST, ctid LIMIT n + 1
+
+    The key values are annotated onto the page rows, which works for model
+    instances and values_list() querysets alike (annotations go after the
+    listed fields, so they can be sliced off a tuple).
+
+    `?page=` and `?ordering=` (OrderingFilter) fall back to page-number
+    pagination with an exact count: page numbers need the real total, and
+    arbitrary sort columns have no index or NOT NULL to seek on.
+    """
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    cursor_query_param = "cursor"
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+    # estimates below this are replaced by an exact (cheap) count
+    exact_count_below = 1000
+
+    KEY_ALIAS = "_keyset_key"
+
+    def use_keyset(self, request):
+        params = request.query_params
+        return self.page_query_param not in params and api_settings.ORDERING_PARAM not in params
+
+    # -------------------- count --------------------
+    def get_count(self, queryset, request):
+        """
+        (count, estimated) of `queryset`, computed once per request.
+        """
+        if not hasattr(self, "_count"):
+            estimate = None
+            if request.query_params.get(self.count_query_param) != "exact":
+                estimate = estimated_count(queryset)
+            if estimate is not None and estimate >= self.exact_count_below:
+                self._count = (estimate, True)
+            else:
+                self._count = (queryset.count(), False)
+        return self._count
+
+    # -------------------- cursor encoding --------------------
+    def encode_cursor(self, position, reverse):
+        payload = json.dumps({"p": position, "r": int(reverse)}, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, request, key_field=None):
+        """
+        (position, reverse) of the request's cursor, (None, False) without
+        one. The key (None for a NULL key) is converted by `key_field` (the
+        model's primary key), so a value the column can't hold is a 404, not
+        a database error.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            position = payload["p"]
+            reverse = bool(payload.get("r", 0))
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != 2:
+            raise NotFound(self.invalid_cursor_message)
+        key, tiebreak = position
+        if key is not None and (isinstance(key, bool) or not isinstance(key, (str, int, float))):
+            raise NotFound(self.invalid_cursor_message)
+        if not valid_tiebreak(tiebreak):
+            raise NotFound(self.invalid_cursor_message)
+        if key is not None and key_field is not None:
+            try:
+                key = key_field.to_python(key)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+        return [key, tiebreak], reverse
+
+    # -------------------- query --------------------
+    def page_queryset(self, queryset, request):
+        """
+        The (lazy) queryset of this page plus one probe row.
+        """
+        self.request = request
+        self.size = self.get_page_size(request)
+        meta = queryset.model._meta
+        position, reverse = self.decode_cursor(request, meta.pk)
+        self.cursor_given = position is not None
+        self.reverse = reverse
+        self.position = position
+
+        qn = connection.ops.quote_name
+        key = f"{qn(meta.db_table)}.{qn(meta.pk.column)}"
+        tb_col, tb_placeholder, tb_select = _tiebreak_sql()
+        tb_col = f"{qn(meta.db_table)}.{tb_col}"
+
+        queryset = queryset.annotate(**{
+            self.KEY_ALIAS: F(meta.pk.attname),
+            TIEBREAK_ALIAS: RawSQL(f"{qn(meta.db_table)}.{tb_select}", ()),
+        })
+        if position is not None:
+            # the column is NOT NULL in the model only
+            terms = _seek_terms([key, tb_col], position, [True, False], reverse, ["%s", tb_placeholder])
+            sql = " OR ".join("(" + " AND ".join(cond for cond, _ in term) + ")" for term in terms)
+            params = [p for term in terms for _, term_params in term for p in term_params]
+            queryset = queryset.filter(RawSQL(f"({sql})", params, output_field=BooleanField()))
+        tiebreak = RawSQL(tb_col, ())
+        if reverse:
+            queryset = queryset.order_by(F(meta.pk.attname).desc(nulls_first=True), tiebreak.desc())
+        else:
+            queryset = queryset.order_by(F(meta.pk.attname).asc(nulls_last=True), tiebreak.asc())
+        return queryset[: self.size + 1]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        rows = list(self.page_queryset(queryset, request))
+        self.count, self.count_estimated = self.get_count(queryset, request)
+
+        has_more = len(rows) > self.size
+        rows = rows[: self.size]
+        if self.reverse:
+            rows.reverse()
+            self.has_previous, self.has_next = has_more, self.cursor_given
+        else:
+            self.has_previous, self.has_next = self.cursor_given, has_more
+
+        if rows:
+            self.first_position, self.last_position = self._position(rows[0]), self._position(rows[-1])
+        else:
+            # empty page after a cursor: keep the client able to step back/forward
+            self.first_position = self.last_position = self.position
+        return rows
+
+    def _position(self, row):
+        if isinstance(row, tuple):
+            return list(row[-2:])
+        return [getattr(row, self.KEY_ALIAS), getattr(row, TIEBREAK_ALIAS)]
+
+    # -------------------- response --------------------
+    def _link(self, position, reverse):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or self.last_position is None:
+            return None
+        return self._link(self.last_position, reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or self.first_position is None:
+            return None
+        return self._link(self.first_position, reverse=True)
+
+    def get_paginated_response(self, data):
+        if self.keyset:
+            count, estimated = self.count, self.count_estimated
+        else:
+            count, estimated = self.page.paginator.count, False
+        return Response({
+            "count": count,
+            "count_estimated": estimated,
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema["properties"]["count_estimated"] = {"type": "boolean", "example": False}
+        return schema
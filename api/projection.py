@@ -0,0 +1,136 @@
+# api/projection.py
+"""
+`?fields=` / `?exclude=` column projection for the read endpoints.
+
+    GET /api/assessments/sa/by-enrollment/S000001-2022/?fields=subject,percentage
+    GET /api/subjects/?exclude=engagement_analysis,engagement_analysis_sub
+
+Names are comma-separated; `exclude` is applied after `fields`. Unknown
+names are a 400, so a typo doesn't silently return nothing.
+
+Raw viewsets (RawReadOnlyViewSet) validate the names against the table's
+columns, read once per process from the catalog, and push them into the
+SELECT list instead of `*`. Columns a viewset needs for its own bookkeeping
+(key columns for keyset cursors / batch-get matching, the FA task arrays)
+are selected as well and dropped from the output again. ORM viewsets
+(FieldsMixin in api/views.py) validate against the serializer's fields,
+load only those columns with .only() and render them through
+DynamicFieldsModelSerializer.
+
+Either way the blobs a client didn't ask for (descriptive_analysis,
+prescriptive_analysis, engagement_analysis, ...) are neither read from
+the database nor sent over the wire. The full query string is part of the
+ETag salt and response-cache key, so projected and full responses never
+share an entry.
+"""
+import threading
+
+from django.db import connection
+from rest_framework.exceptions import ParseError
+
+FIELDS_PARAM = "fields"
+EXCLUDE_PARAM = "exclude"
+
+# (alias, table) -> tuple of column names in table order
+_columns = {}
+_lock = threading.Lock()
+
+
+def table_columns(table):
+    """
+    Column names of `table` in table order (per-process memo; the lookup is a
+    catalog query and doesn't count against query budgets).
+    """
+    key = (connection.alias, table)
+    columns = _columns.get(key)
+    if columns is None:
+        with connection.cursor() as cur:
+            if connection.vendor == "postgresql":
+                cur.execute(
+                    "SELECT attname FROM pg_attribute "
+                    "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum",
+                    [table],
+                )
+                columns = tuple(row[0] for row in cur.fetchall())
+            else:
+                cur.execute(f"PRAGMA table_info({connection.ops.quote_name(table)})")
+                columns = tuple(row[1] for row in cur.fetchall())
+        with _lock:
+            _columns[key] = columns
+    return columns
+
+
+def forget_columns(table=None):
+    """
+    Drop the memoised columns of `table` (all tables when None), e.g. after a
+    reload changed its shape.
+    """
+    with _lock:
+        for key in [k for k in _columns if table is None or k[1] == table]:
+            del _columns[key]
+
+
+def requested(request):
+    params = request.query_params
+    return FIELDS_PARAM in params or EXCLUDE_PARAM in params
+
+
+def _names(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def select_fields(request, available):
+    """
+    The names of `available` selected by ?fields= / ?exclude=, in `available`
+    order, or None when the request has neither. Raises ParseError on unknown
+    names or an empty selection.
+    """
+    if not requested(request):
+        return None
+    params = request.query_params
+    known = set(available)
+    wanted = _names(params[FIELDS_PARAM]) if FIELDS_PARAM in params else list(available)
+    dropped = _names(params.get(EXCLUDE_PARAM, ""))
+
+    unknown = [name for name in dict.fromkeys(wanted + dropped) if name not in known]
+    if unknown:
+        raise ParseError(f"Unknown field(s): {', '.join(unknown)}")
+    keep = set(wanted) - set(dropped)
+    selected = [name for name in available if name in keep]
+    if not selected:
+        raise ParseError("No fields selected")
+    return selected
+
+
+class Projection:
+    """
+    The columns a raw query selects for one request: the requested `fields`
+    plus the `required` ones the viewset reads itself.
+    """
+
+    def __init__(self, fields, required=()):
+        self.fields = list(fields)
+        self.columns = self.fields + [c for c in required if c not in self.fields]
+
+    def select_sql(self, required=True):
+        quote = connection.ops.quote_name
+        return ", ".join(quote(c) for c in (self.columns if required else self.fields))
+
+    def apply(self, data):
+        """
+        Trim a row dict (or a list of them) to the requested fields.
+        """
+        if isinstance(data, list):
+            return [self.apply(item) for item in data]
+        if isinstance(data, dict):
+            return {name: data[name] for name in self.fields if name in data}
+        return data
+
+
+def from_request(request, table, required=()):
+    """
+    Projection of a raw-table read, or None for a plain `SELECT *`.
+    """
+    if request is None or not requested(request):
+        return None
+    return Projection(select_fields(request, table_columns(table)), required)
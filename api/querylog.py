@@ -0,0 +1,244 @@
+# api/querylog.py
+"""
+Lightweight query-shape recorder.
+
+When QUERY_RECORDER_DIR is set, QueryShapeMiddleware wraps (a sample of)
+requests in a DB execute_wrapper that reduces every statement to its access
+"shape":
+
+    table, equality columns, range columns, ORDER BY columns, LIKE/trigram columns
+
+e.g. `SELECT * FROM assessments_fa WHERE enrollment_id = %s LIMIT 1000`
+-> ("assessments_fa", eq=("enrollment_id",), range=(), order=(), pattern=()).
+
+Counts are kept per process and flushed to QUERY_RECORDER_DIR/shapes-<pid>.json
+every QUERY_RECORDER_FLUSH_EVERY recorded requests (and at exit), so
+`manage.py advise_indexes` can read them from a separate process. Parameter
+values are never recorded.
+"""
+import atexit
+import json
+import os
+import random
+import re
+import threading
+from collections import Counter, namedtuple
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+Shape = namedtuple("Shape", ["table", "eq", "range", "order", "pattern"])
+
+# physical row ids used as keyset tie-breakers; never worth indexing
+IGNORED_COLUMNS = {"ctid", "rowid"}
+
+_IDENT = r'(?:"?\w+"?\.)?"?(\w+)"?'
+_FROM_RE = re.compile(r'\bFROM\s+"?([A-Za-z_]\w*)"?(?!\s*\()', re.I)
+_KEYWORD_RE = re.compile(r"\b(WHERE|ORDER\s+BY|GROUP\s+BY|LIMIT|OFFSET|UNION|HAVING|FOR)\b", re.I)
+_ROW_RANGE_RE = re.compile(r"\(\s*([\w\".]+(?:\s*,\s*[\w\".]+)+)\s*\)\s*(?:<=|>=|<|>)", re.I)
+_EQ_RE = re.compile(_IDENT + r"\s*(?:=|\bIN\b|\bIS\b)(?!=)", re.I)
+_RANGE_RE = re.compile(_IDENT + r"\s*(?:<=|>=|<(?!>)|>|\bBETWEEN\b)", re.I)
+_PATTERN_RE = re.compile(_IDENT + r"\s*(?:\bI?LIKE\b|%%|%(?!s))", re.I)
+_ORDER_RE = re.compile(_IDENT + r"(?:\s+(?:ASC|DESC))?\s*(?:,|$)", re.I)
+_NOT_COLUMNS = {
+    "and", "or", "not", "null", "true", "false", "select", "where", "then", "else", "case", "when", "end",
+    "asc", "desc",
+}
+
+
+def _blank_literals(sql):
+    # keep offsets stable but drop anything inside '...' so it can't look like SQL
+    return re.sub(r"'(?:[^']|'')*'", lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+
+
+def _clause_end(sql, start):
+    """
+    Index where the clause starting at `start` ends: the next top-level
+    keyword, a closing paren that leaves the current level, or end of string.
+    Returns (end, keyword or None).
+    """
+    depth = 0
+    i = start
+    n = len(sql)
+    while i < n:
+        ch = sql[i]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            if depth == 0:
+                return i, None
+            depth -= 1
+        elif depth == 0 and ch.isalpha() and (i == 0 or not (sql[i - 1].isalnum() or sql[i - 1] == "_")):
+            m = _KEYWORD_RE.match(sql, i)
+            if m:
+                return i, m.group(1).upper().split()[0]
+        i += 1
+    return n, None
+
+
+def _strip_calls(text):
+    # "GREATEST(similarity(a, %s)) DESC, b" -> "GREATEST DESC, b": expressions aren't index keys
+    previous = None
+    while previous != text:
+        previous, text = text, re.sub(r"\w*\([^()]*\)", " ", text)
+    return text
+
+
+def _columns(regex, text):
+    cols = []
+    for m in regex.finditer(text):
+        if regex is _ROW_RANGE_RE:
+            # "(a, t.b, ctid) > (...)" -> a, b, ctid
+            names = [part.strip().split(".")[-1].strip('"') for part in m.group(1).split(",")]
+        else:
+            names = [m.group(1)]
+        for name in names:
+            name = name.lower()
+            if name in _NOT_COLUMNS or name in IGNORED_COLUMNS or name.isdigit():
+                continue
+            if name not in cols:
+                cols.append(name)
+    return cols
+
+
+def extract_shapes(sql):
+    """
+    Reduce one SQL statement to the Shapes of every `FROM <table> ...` it reads.
+    Heuristic (regex + paren depth), tuned to the statements this app issues.
+    """
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    sql = _blank_literals(sql)
+    shapes = []
+    for m in _FROM_RE.finditer(sql):
+        table = m.group(1)
+        pos = m.end()
+        where = order = ""
+        while True:
+            end, keyword = _clause_end(sql, pos)
+            if keyword is None:
+                break
+            kw_match = _KEYWORD_RE.match(sql, end)
+            body_start = kw_match.end()
+            body_end, _ = _clause_end(sql, body_start)
+            if keyword == "WHERE":
+                where = sql[body_start:body_end]
+            elif keyword == "ORDER":
+                order = sql[body_start:body_end]
+            pos = body_end
+            if pos >= len(sql) or sql[pos] == ")":
+                break
+
+        row_range = _columns(_ROW_RANGE_RE, where)
+        where_rest = _ROW_RANGE_RE.sub(" ", where)
+        eq = _columns(_EQ_RE, where_rest)
+        rng = [c for c in row_range + _columns(_RANGE_RE, where_rest) if c not in eq]
+        pattern = _columns(_PATTERN_RE, where_rest)
+        order_cols = _columns(_ORDER_RE, _strip_calls(order).strip())
+        if eq or rng or order_cols or pattern:
+            shapes.append(Shape(table.lower(), tuple(eq), tuple(dict.fromkeys(rng)), tuple(order_cols), tuple(pattern)))
+    return shapes
+
+
+def shape_to_dict(shape, count):
+    return {**shape._asdict(), "count": count}
+
+
+def shape_from_dict(data):
+    return Shape(data["table"], tuple(data["eq"]), tuple(data["range"]), tuple(data["order"]), tuple(data.get("pattern", ())))
+
+
+class ShapeRecorder:
+    """
+    Process-wide Counter of shapes, flushed to a per-pid JSON file.
+    """
+
+    def __init__(self, directory, flush_every=50):
+        self.directory = Path(directory)
+        self.flush_every = flush_every
+        self.counts = Counter()
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self.directory / f"shapes-{os.getpid()}.json"
+
+    def __call__(self, execute, sql, params, many, context):
+        try:
+            shapes = extract_shapes(sql)
+        except Exception:  # never let recording break a query
+            shapes = []
+        with self.lock:
+            self.counts.update(shapes)
+        return execute(sql, params, many, context)
+
+    def request_done(self):
+        with self.lock:
+            self.requests += 1
+            due = self.requests % self.flush_every == 0
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            data = [shape_to_dict(s, c) for s, c in self.counts.items()]
+        if not data:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+
+def load_recorded_shapes(directory):
+    """
+    Sum the shape counts flushed by every process into `directory`.
+    """
+    totals = Counter()
+    for path in Path(directory).glob("shapes-*.json"):
+        try:
+            entries = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        for entry in entries:
+            totals[shape_from_dict(entry)] += entry.get("count", 0)
+    return totals
+
+
+_recorder = None
+
+
+def get_recorder():
+    global _recorder
+    if _recorder is None:
+        _recorder = ShapeRecorder(
+            settings.QUERY_RECORDER_DIR,
+            flush_every=getattr(settings, "QUERY_RECORDER_FLUSH_EVERY", 50),
+        )
+        atexit.register(_recorder.flush)
+    return _recorder
+
+
+class QueryShapeMiddleware:
+    """
+    Record the query shapes of a sample of requests (QUERY_RECORDER_SAMPLE_RATE).
+    Disabled (MiddlewareNotUsed) unless QUERY_RECORDER_DIR is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "QUERY_RECORDER_DIR", None):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, "QUERY_RECORDER_SAMPLE_RATE", 1.0))
+        self.recorder = get_recorder()
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        with connection.execute_wrapper(self.recorder):
+            response = self.get_response(request)
+        self.recorder.request_done()
+        return response
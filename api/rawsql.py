@@ -0,0 +1,100 @@
+# api/rawsql.py
+"""
+Small helpers shared by the raw-SQL viewsets.
+"""
+import json
+from contextlib import nullcontext
+
+from django.db import connection, transaction
+
+from . import statements
+from .timing import db_block
+
+
+def dictfetchall(cursor):
+    cols = [c[0] for c in cursor.description] if cursor.description else []
+    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+
+
+def as_list(value):
+    """
+    Array column value as a list: Postgres hands back lists, SQLite dev
+    databases (see `manage.py seed_synthetic`) store arrays as JSON text.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return json.loads(value)
+    return value
+
+
+def iter_batches(sql, params=None, batch_size=2000):
+    """
+    Run `sql` through a server-side (named) cursor and yield
+    (columns, rows) one fetchmany() batch at a time.
+
+    The cursor is opened inside a transaction so Postgres does not need a
+    WITH HOLD cursor (which would materialise the whole result before the
+    first fetch). On SQLite chunked_cursor() is a plain cursor, which
+    already streams.
+    """
+    with transaction.atomic(), connection.chunked_cursor() as cur:
+        cur.execute(sql, params or [])
+        columns = [c[0] for c in cur.description] if cur.description else []
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield columns, rows
+
+
+def _pipeline_supported():
+    if connection.vendor != "postgresql":
+        return False
+    try:
+        from psycopg import Pipeline
+    except ImportError:  # psycopg2
+        return False
+    return Pipeline.is_supported()
+
+
+def cursor(prepared=False):
+    """
+    connection.cursor(), or one that prepares its statements if `prepared`
+    (api/statements.py; only for statement texts that don't vary per request).
+    """
+    return statements.cursor() if prepared else connection.cursor()
+
+
+def fetch_many(queries, prepared=False):
+    """
+    Run several independent (sql, params) statements and return one list of
+    row dicts per statement, in order.
+
+    On Postgres (psycopg 3) the statements are sent in pipeline mode, so the
+    whole batch costs a single network round trip; elsewhere they simply run
+    one after another. `prepared` runs them as prepared statements.
+    """
+    if not _pipeline_supported():
+        results = []
+        for sql, params in queries:
+            with cursor(prepared) as cur:
+                cur.execute(sql, params)
+                results.append(dictfetchall(cur))
+        return results
+
+    connection.ensure_connection()
+    cursors = []
+    try:
+        # results arrive when the pipeline syncs, not inside execute()
+        conn = connection.connection
+        prepare = prepared and statements.enabled(connection.vendor)
+        with db_block(), statements.preparing(conn) if prepare else nullcontext(), conn.pipeline():
+            for sql, params in queries:
+                cur = cursor(prepared)
+                cursors.append(cur)
+                cur.execute(sql, params)
+        return [dictfetchall(cur) for cur in cursors]
+    finally:
+        for cur in cursors:
+            cur.close()
@@ -0,0 +1,71 @@
+# api/renderers.py
+"""
+Renderers for the raw-table export formats.
+
+The export action streams rows itself (StreamingHttpResponse), so these
+renderers mainly exist to let DRF's content negotiation pick the format from
+`?format=ndjson|csv` or the Accept header. render() still works for a plain
+list of row dicts.
+"""
+import csv
+import io
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+def _csv_value(value):
+    # array / json columns go out as JSON so they survive a round trip
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def ndjson_lines(columns, rows):
+    """
+    Encode tuples (in `columns` order) as newline-delimited JSON.
+    """
+    return "".join(
+        json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + "\n" for row in rows
+    )
+
+
+def csv_lines(rows, header=None):
+    """
+    Encode tuples as CSV text (optionally preceded by a header row).
+    """
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows([_csv_value(v) for v in row] for row in rows)
+    return buf.getvalue()
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return ""
+        if isinstance(data, dict):
+            data = [data]
+        columns = list(data[0].keys())
+        return ndjson_lines(columns, [tuple(row.get(c) for c in columns) for row in data])
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not data:
+            return ""
+        if isinstance(data, dict):
+            data = [data]
+        columns = list(data[0].keys())
+        return csv_lines([tuple(row.get(c) for c in columns) for row in data], header=columns)
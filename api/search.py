@@ -0,0 +1,81 @@
+# api/search.py
+"""
+`?q=` search for the raw-SQL viewsets.
+
+Each RawReadOnlyViewSet declares the text columns it can be searched on
+(`search_fields`). On Postgres with pg_trgm the predicate is
+
+    col ILIKE '%q%' OR col % 'q'          -- both served by a GIN gin_trgm_ops index
+
+and results are ranked by GREATEST(similarity(col, q), ...). The indexes are
+created by `manage.py create_search_indexes`. Without pg_trgm (or on SQLite)
+search degrades to a case-insensitive substring match ordered by key.
+"""
+from django.db import connection
+
+# per-process memo: {connection alias: bool}
+_trgm_available = {}
+
+
+def trgm_available():
+    if connection.vendor != "postgresql":
+        return False
+    alias = connection.alias
+    if alias not in _trgm_available:
+        with connection.cursor() as cur:
+            cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trgm_available[alias] = cur.fetchone() is not None
+    return _trgm_available[alias]
+
+
+def escape_like(q):
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_filter(fields, q):
+    """
+    WHERE fragment + params matching `q` against any of `fields`.
+    """
+    pattern = f"%{escape_like(q)}%"
+    clauses, params = [], []
+    if connection.vendor == "postgresql":
+        fuzzy = trgm_available()
+        for f in fields:
+            clauses.append(f"{f} ILIKE %s ESCAPE '\\'")
+            params.append(pattern)
+            if fuzzy:
+                # '%%' is pg_trgm's similarity operator ('%' escaped for the driver)
+                clauses.append(f"{f} %% %s")
+                params.append(q)
+    else:
+        # SQLite: LIKE is already case-insensitive for ASCII
+        for f in fields:
+            clauses.append(f"{f} LIKE %s ESCAPE '\\'")
+            params.append(pattern)
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def search_order(fields, q, key_columns):
+    """
+    ORDER BY fragment + params ranking matches best-first.
+    """
+    key_order = ", ".join(key_columns)
+    if not trgm_available():
+        return key_order, []
+    if len(fields) == 1:
+        rank = f"similarity({fields[0]}, %s)"
+    else:
+        rank = "GREATEST(" + ", ".join(f"similarity({f}, %s)" for f in fields) + ")"
+    return f"{rank} DESC, {key_order}", [q] * len(fields)
+
+
+def index_name(table, column):
+    return f"{table}_{column}_trgm_idx"
+
+
+def index_statements(table, fields):
+    return [
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, f)} "
+        f"ON {table} USING gin ({f} gin_trgm_ops)"
+        for f in fields
+    ]
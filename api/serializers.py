@@ -1,59 +1,74 @@
 from rest_framework import serializers
 from . import models
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer taking an optional `fields` argument: only those of its
+    fields are rendered (?fields= / ?exclude=, see FieldsMixin in api/views.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class EnrollmentSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.Enrollments  # adjust to the exact class name generated
         fields = "__all__"
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.Subjects
         fields = "__all__"
 
-class AssessmentEOLSerializer(serializers.ModelSerializer):
+class AssessmentEOLSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.AssessmentsEol
         fields = "__all__"
 
-class AssessmentFASerializer(serializers.ModelSerializer):
+class AssessmentFASerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.AssessmentsFa
         fields = "__all__"
 
-class AssessmentSASerializer(serializers.ModelSerializer):
+class AssessmentSASerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.AssessmentsSa
         fields = "__all__"
 
 # api/serializers.py (append)
 
-class AssessmentWeightsSerializer(serializers.ModelSerializer):
+class AssessmentWeightsSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.AssessmentWeights
         fields = "__all__"
 
 
-class UsersTableSerializer(serializers.ModelSerializer):
+class UsersTableSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.UsersTable
         fields = "__all__"
 
 # api/serializers.py (append)
 
-class MypGradeBoundariesSerializer(serializers.ModelSerializer):
+class MypGradeBoundariesSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.MypGradeBoundaries
         fields = "__all__"
 
-class LmsUsersUserSerializer(serializers.ModelSerializer):
+class LmsUsersUserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.LmsUsersUser
         # hide password field from responses
         fields = ['id', 'email', 'username', 'first_name', 'last_name', 'role', 'is_staff', 'is_active', 'date_joined']
         read_only_fields = fields
 
-class LmsUsersStaffpreapprovedSerializer(serializers.ModelSerializer):
+class LmsUsersStaffpreapprovedSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.LmsUsersStaffpreapproved
         fields = "__all__"
@@ -62,28 +77,28 @@ class LmsUsersStaffpreapprovedSerializer(serializers.ModelSerializer):
         read_only_fields = tuple(f.name for f in models.LmsUsersStaffpreapproved._meta.fields)
 
 
-class TokenBlacklistOutstandingtokenSerializer(serializers.ModelSerializer):
+class TokenBlacklistOutstandingtokenSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.TokenBlacklistOutstandingtoken
         fields = "__all__"
         read_only_fields = tuple(f.name for f in models.TokenBlacklistOutstandingtoken._meta.fields)
 
 
-class TokenBlacklistBlacklistedtokenSerializer(serializers.ModelSerializer):
+class TokenBlacklistBlacklistedtokenSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.TokenBlacklistBlacklistedtoken
         fields = "__all__"
         read_only_fields = tuple(f.name for f in models.TokenBlacklistBlacklistedtoken._meta.fields)
 
 
-class DpGradeBoundariesSerializer(serializers.ModelSerializer):
+class DpGradeBoundariesSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.DpGradeBoundaries
         fields = "__all__"
         read_only_fields = tuple(f.name for f in models.DpGradeBoundaries._meta.fields)
 
 
-class AssessmentNonAcademicSerializer(serializers.ModelSerializer):
+class AssessmentNonAcademicSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = models.AssessmentsNonAcademic
         fields = "__all__"
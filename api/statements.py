@@ -0,0 +1,180 @@
+# api/statements.py
+"""
+Prepared statements for the hot raw-SQL lookups.
+
+The per-enrollment / per-key reads of the raw viewsets (retrieve,
+by-enrollment, the dashboard sections) are a small, fixed set of statement
+texts. Callers that opt in run them on a cursor from cursor() below: a
+server-binding psycopg cursor that executes with
+prepare=True, so psycopg parses each text once per connection (a
+protocol-level Parse of "... WHERE enrollment_id = $1 LIMIT 1000") and
+afterwards sends only Bind / Execute with the parameters. Postgres skips
+parsing and analysis and, once it settles on a generic plan (see
+pg_prepared_statements.generic_plans), planning as well.
+
+That is a switch from client-side to server-side parameter binding for
+these statements only: Django's own cursors (psycopg ClientCursor) still
+interpolate the parameters into the SQL text, while cursor() sends them
+separately as values typed by psycopg's dumpers. They can only stand where
+Postgres accepts a $n placeholder (values, not identifiers or fragments) and
+may need a cast where the server can't infer their type; the per-key
+lookups here need neither. The connection itself is left as Django
+configured it: preparing() enables prepare=True (and
+DB_PREPARED_STATEMENTS_MAX) around these executes only and then restores
+prepare_threshold / prepared_max.
+
+Protocol-level statements are what transaction-mode poolers track
+(PgBouncer >= 1.21 with max_prepared_statements, Neon's -pooler endpoint),
+unlike SQL-level PREPARE / EXECUTE, which only exist on the backend that ran
+the PREPARE. psycopg names, evicts (DB_PREPARED_STATEMENTS_MAX per
+connection, least recently used first) and re-prepares the statements
+itself.
+
+Only statements whose text doesn't depend on user input belong here.
+Per-process execution counts are reported by GET /api/db/statements/
+together with the session's pg_prepared_statements. SQLite has no prepared
+statements to manage: cursor() is a plain cursor there, and Python's sqlite3
+module already reuses compiled statements through its own cache.
+"""
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+# sql -> {"sql", "executions"}
+_stats = {}
+_lock = threading.Lock()
+
+_PLACEHOLDER_RE = re.compile(r"%%|%s")
+
+
+def enabled(vendor):
+    return vendor == "postgresql" and getattr(settings, "DB_PREPARED_STATEMENTS", True)
+
+
+def server_text(sql):
+    """
+    `sql` as psycopg sends it to the server: %s params numbered $1, $2, ...
+    """
+    count = 0
+
+    def number(match):
+        nonlocal count
+        if match.group() == "%%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    return _PLACEHOLDER_RE.sub(number, sql)
+
+
+def _count(sql):
+    with _lock:
+        entry = _stats.setdefault(sql, {"sql": sql, "executions": 0})
+        entry["executions"] += 1
+
+
+# Django opens connections with preparation off (prepare_threshold=None), which
+# psycopg applies to prepare=True too; a threshold no ad-hoc statement reaches
+# turns it back on for prepare=True only
+NEVER_AUTOMATIC = 2 ** 31 - 1
+
+
+@contextmanager
+def preparing(conn):
+    """
+    Enable prepare=True on psycopg connection `conn` for the duration of the
+    block, then restore its own prepare_threshold / prepared_max. Re-entrant;
+    wrap a whole pipeline, whose statements are rotated at sync time.
+    """
+    threshold, limit = conn.prepare_threshold, conn.prepared_max
+    if threshold is None:
+        conn.prepare_threshold = NEVER_AUTOMATIC
+    conn.prepared_max = getattr(settings, "DB_PREPARED_STATEMENTS_MAX", 200)
+    try:
+        yield conn
+    finally:
+        conn.prepare_threshold, conn.prepared_max = threshold, limit
+
+
+_cursor_classes = {}
+
+
+def _cursor_class(asynchronous=False):
+    # built on first use: psycopg (3) is only needed on Postgres
+    cls = _cursor_classes.get(asynchronous)
+    if cls is None:
+        import psycopg
+
+        if asynchronous:
+            class PreparedCursor(psycopg.AsyncCursor):
+                async def execute(self, query, params=None, *, prepare=None, binary=None):
+                    if isinstance(query, str):
+                        _count(query)
+                    with preparing(self.connection):
+                        return await super().execute(
+                            query, params, prepare=True if prepare is None else prepare, binary=binary
+                        )
+        else:
+            class PreparedCursor(psycopg.Cursor):
+                def execute(self, query, params=None, *, prepare=None, binary=None):
+                    if isinstance(query, str):
+                        _count(query)
+                    with preparing(self.connection):
+                        return super().execute(query, params, prepare=True if prepare is None else prepare, binary=binary)
+
+        cls = _cursor_classes.setdefault(asynchronous, PreparedCursor)
+    return cls
+
+
+def cursor(db=None):
+    """
+    A Django cursor whose statements are prepared (plain db.cursor() when
+    prepared statements are off or not Postgres).
+    """
+    db = db or connection
+    if not enabled(db.vendor):
+        return db.cursor()
+    from django.db.backends.postgresql.base import TIMESTAMPTZ_OID, Format, register_tzloader
+
+    db.ensure_connection()
+    db.validate_thread_sharing()
+    raw = _cursor_class()(db.connection)
+    # what DatabaseWrapper.create_cursor() does for its own cursors
+    if db.timezone != db.connection.adapters.get_loader(TIMESTAMPTZ_OID, Format.TEXT).timezone:
+        register_tzloader(db.timezone, raw)
+    # wrapped like db.cursor()'s own: logged / counted by assertNumQueries
+    return db.make_debug_cursor(raw) if db.queries_logged else db.make_cursor(raw)
+
+
+def acursor(conn):
+    """
+    A prepared-statement cursor on psycopg AsyncConnection `conn` (api/aio.py),
+    for `async with`.
+    """
+    return _cursor_class(asynchronous=True)(conn)
+
+
+def stats():
+    """
+    [{sql, executions}] of this process, busiest first.
+    """
+    with _lock:
+        rows = [dict(entry) for entry in _stats.values()]
+    return sorted(rows, key=lambda r: -r["executions"])
+
+
+def server_plans(cur):
+    """
+    {statement text: {"generic_plans", "custom_plans"}} of the protocol-level
+    statements on the session of `cur` (pg_prepared_statements, Postgres 14+).
+    """
+    cur.execute("SELECT statement, generic_plans, custom_plans FROM pg_prepared_statements WHERE NOT from_sql")
+    return {text: {"generic_plans": g, "custom_plans": c} for text, g, c in cur.fetchall()}
+
+
+def reset_stats():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,346 @@
+# api/summary.py
+"""
+Per-student summary table backing the landing page.
+
+`student_summary` holds one row per enrollment with everything the landing
+page shows: overall current / predicted percentage, strongest and weakest
+subject, and a JSON array of per-subject current / predicted percentages.
+It is a plain table on both backends (a Postgres materialized view can only
+be refreshed as a whole), keyed by enrollment_id and indexed for the
+academic_year / grade / school filters, so every read is one index lookup.
+
+`enrollments` holds duplicate ids (the ETL appends); they collapse onto one
+summary built from the most complete of those rows.
+
+Each row stores a fingerprint of the source rows it was built from (its
+`enrollments` rows plus its `subjects` rows). How refresh() finds the
+enrollments to rebuild:
+
+  - with change capture on both source tables (`manage.py change_log
+    --install`, api/changes.py) it reads the enrollment ids logged since the
+    last refresh, so the cost follows the number of changes;
+  - otherwise, or when the log can't tell (a table was reloaded, entries
+    were pruned, the log was reinstalled), it recomputes every fingerprint --
+    inside Postgres where possible -- which reads both tables in full, and
+    rebuilds those that differ from the stored ones.
+
+Summaries whose enrollment is gone are dropped either way.
+refresh(enrollment_ids=[...]) rebuilds a known set directly (e.g. from an
+ETL hook).
+"""
+import hashlib
+import json
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache as api_cache
+from . import changes
+from .rawsql import dictfetchall, iter_batches
+
+TABLE = "student_summary"
+# name -> value: the change-log position refresh() has caught up to
+SYNC_TABLE = "student_summary_sync"
+SOURCE_TABLES = ("enrollments", "subjects")
+
+# enrollments columns copied as-is
+ENROLLMENT_COLUMNS = (
+    "enrollment_id", "user_name", "academic_year", "grade", "school",
+    "current_pct_overall", "predictive_pct_overall",
+    "current_grade_overall", "predicted_grade_overall",
+)
+COLUMNS = ENROLLMENT_COLUMNS + ("strongest_subject", "weakest_subject", "subjects", "fingerprint", "refreshed_at")
+
+# enrollment ids per rebuild statement
+CHUNK = 500
+
+
+def _ddl():
+    pg = connection.vendor == "postgresql"
+    json_type = "jsonb" if pg else "text"
+    ts_type = "timestamptz" if pg else "text"
+    return [
+        f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+            enrollment_id text PRIMARY KEY,
+            user_name text,
+            academic_year text,
+            grade text,
+            school text,
+            current_pct_overall numeric(10, 2),
+            predictive_pct_overall numeric(10, 2),
+            current_grade_overall text,
+            predicted_grade_overall text,
+            strongest_subject text,
+            weakest_subject text,
+            subjects {json_type},
+            fingerprint text NOT NULL,
+            refreshed_at {ts_type}
+        )""",
+        # filter + keyset order in one index: (filters..., enrollment_id)
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_year_grade_school_idx "
+        f"ON {TABLE} (academic_year, grade, school, enrollment_id)",
+        f"CREATE INDEX IF NOT EXISTS {TABLE}_school_idx ON {TABLE} (school, enrollment_id)",
+        f"CREATE TABLE IF NOT EXISTS {SYNC_TABLE} (name text PRIMARY KEY, value text NOT NULL)",
+    ]
+
+
+def ensure_table():
+    with connection.cursor() as cur:
+        for stmt in _ddl():
+            cur.execute(stmt)
+
+
+def installed():
+    """
+    True once the first refresh() has created the table (a catalog lookup).
+    """
+    with connection.cursor() as cur:
+        if connection.vendor == "postgresql":
+            cur.execute("SELECT 1 FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        else:
+            cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+        return cur.fetchone() is not None
+
+
+# -------------------- fingerprints --------------------
+# every enrollments row of an id and every subjects row of it, each as the
+# md5 of its text, sorted: the same rows give the same fingerprint
+_PG_FINGERPRINTS = """
+    WITH en AS (
+        SELECT enrollment_id, string_agg(md5(e::text), ',' ORDER BY md5(e::text)) AS digests
+        FROM enrollments e {where} GROUP BY enrollment_id
+    ), su AS (
+        SELECT enrollment_id, string_agg(md5(s::text), ',' ORDER BY md5(s::text)) AS digests
+        FROM subjects s {where} GROUP BY enrollment_id
+    )
+    SELECT en.enrollment_id, md5(en.digests || ':' || COALESCE(su.digests, ''))
+    FROM en LEFT JOIN su USING (enrollment_id)
+"""
+
+
+def _row_digest(row):
+    return hashlib.md5(json.dumps(row, default=str).encode("utf-8")).hexdigest()
+
+
+def _digests(table, enrollment_ids):
+    """
+    {enrollment_id: [row digest, ...]} of `table` (only `enrollment_ids` if given).
+    """
+    if enrollment_ids is None:
+        batches = iter_batches(f"SELECT * FROM {table}")
+    else:
+        batches = iter_batches(
+            f"SELECT * FROM {table} WHERE enrollment_id IN ({', '.join(['%s'] * len(enrollment_ids))})",
+            list(enrollment_ids),
+        )
+    out = {}
+    for columns, rows in batches:
+        eid_index = columns.index("enrollment_id")
+        for row in rows:
+            out.setdefault(row[eid_index], []).append(_row_digest(row))
+    return out
+
+
+def source_fingerprints(enrollment_ids=None):
+    """
+    {enrollment_id: fingerprint} over the current source rows, of every
+    enrollment or only of `enrollment_ids`. Postgres hashes in the database;
+    elsewhere the rows are streamed and hashed here.
+    """
+    if enrollment_ids is not None and not enrollment_ids:
+        return {}
+    if connection.vendor == "postgresql":
+        where, params = "", []
+        if enrollment_ids is not None:
+            where, params = "WHERE enrollment_id = ANY(%s)", [list(enrollment_ids)]
+        with connection.cursor() as cur:
+            cur.execute(_PG_FINGERPRINTS.format(where=where), params * 2)
+            return dict(cur.fetchall())
+
+    subject_digests = _digests("subjects", enrollment_ids)
+    out = {}
+    for eid, digests in _digests("enrollments", enrollment_ids).items():
+        parts = [",".join(sorted(digests)), ",".join(sorted(subject_digests.get(eid, [])))]
+        out[eid] = hashlib.md5(":".join(parts).encode("utf-8")).hexdigest()
+    return out
+
+
+def stored_fingerprints():
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT enrollment_id, fingerprint FROM {TABLE}")
+        return dict(cur.fetchall())
+
+
+# -------------------- rebuild --------------------
+def _number(value):
+    if value is None or value == "":
+        return None
+    return float(value) if isinstance(value, (Decimal, int, float)) else float(Decimal(str(value)))
+
+
+def build_summary(enrollment, subjects, fingerprint, now):
+    """
+    One student_summary row from an enrollments row and its subjects rows.
+    The ETL's strongest/weakest subject wins; otherwise it is derived from
+    current_sub_pct.
+    """
+    per_subject = sorted(
+        (
+            {
+                "subject": s.get("subject"),
+                "current_pct": _number(s.get("current_sub_pct")),
+                "predicted_pct": _number(s.get("predicted_sub_pct")),
+                "current_grade": s.get("current_sub_grade"),
+                "predicted_grade": s.get("predicted_sub_grade"),
+            }
+            for s in subjects
+        ),
+        key=lambda s: s["subject"] or "",
+    )
+    ranked = sorted((s for s in per_subject if s["current_pct"] is not None), key=lambda s: s["current_pct"])
+    row = {c: enrollment.get(c) for c in ENROLLMENT_COLUMNS}
+    row["strongest_subject"] = enrollment.get("strongest_subject") or (ranked[-1]["subject"] if ranked else None)
+    row["weakest_subject"] = enrollment.get("weakest_subject") or (ranked[0]["subject"] if ranked else None)
+    row["subjects"] = json.dumps(per_subject)
+    row["fingerprint"] = fingerprint
+    row["refreshed_at"] = now if connection.vendor == "postgresql" else now.isoformat()
+    return row
+
+
+def _most_complete(rows):
+    # several enrollments rows per id: the one with the most values, then a
+    # stable tie-break so that rebuilds agree
+    return max(rows, key=lambda r: (sum(v is not None and v != "" for v in r.values()), _row_digest(sorted(r.items()))))
+
+
+def rebuild(enrollment_ids, fingerprints=None):
+    """
+    Recompute the summaries of `enrollment_ids` (delete + insert per chunk).
+    Ids without an enrollments row lose their summary. Returns
+    {"rebuilt": n, "deleted": n}.
+    """
+    enrollment_ids = list(dict.fromkeys(enrollment_ids))
+    now = timezone.now()
+    placeholders_sql = f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join(['%s'] * len(COLUMNS))})"
+    written = deleted = 0
+    for start in range(0, len(enrollment_ids), CHUNK):
+        chunk = enrollment_ids[start:start + CHUNK]
+        marks = ", ".join(["%s"] * len(chunk))
+        with transaction.atomic():
+            chunk_fingerprints = fingerprints if fingerprints is not None else source_fingerprints(chunk)
+            with connection.cursor() as cur:
+                cur.execute(f"SELECT * FROM enrollments WHERE enrollment_id IN ({marks})", chunk)
+                enrollments = {}
+                for e in dictfetchall(cur):
+                    enrollments.setdefault(e["enrollment_id"], []).append(e)
+                cur.execute(f"SELECT * FROM subjects WHERE enrollment_id IN ({marks})", chunk)
+                subjects = {}
+                for s in dictfetchall(cur):
+                    subjects.setdefault(s["enrollment_id"], []).append(s)
+
+                rows = [
+                    build_summary(_most_complete(rows), subjects.get(eid, []), chunk_fingerprints.get(eid, ""), now)
+                    for eid, rows in enrollments.items()
+                ]
+                cur.execute(f"DELETE FROM {TABLE} WHERE enrollment_id IN ({marks}) RETURNING enrollment_id", chunk)
+                deleted += sum(1 for (eid,) in cur.fetchall() if eid not in enrollments)
+                if rows:
+                    cur.executemany(placeholders_sql, [[r[c] for c in COLUMNS] for r in rows])
+        written += len(rows)
+    return {"rebuilt": written, "deleted": deleted}
+
+
+# -------------------- change detection --------------------
+def _sync_value(cur, name):
+    cur.execute(f"SELECT value FROM {SYNC_TABLE} WHERE name = %s", [name])
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _set_sync_value(cur, name, value):
+    cur.execute(
+        f"INSERT INTO {SYNC_TABLE} (name, value) VALUES (%s, %s) "
+        f"ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+        [name, value],
+    )
+
+
+def _capture_epoch():
+    """
+    The change log's epoch when it captures both source tables, else None.
+    """
+    if not changes.installed():
+        return None
+    with connection.cursor() as cur:
+        if not set(SOURCE_TABLES) <= set(changes.captured_tables(cur)):
+            return None
+        return changes.epoch(cur)
+
+
+def _logged_enrollments(since):
+    """
+    (enrollment ids logged after `since`, the token to continue from), or
+    None when the log can't tell (a reload, pruned entries).
+    """
+    ids = set()
+    position = changes.parse_token(since)
+    while True:
+        try:
+            page = changes.page(position, SOURCE_TABLES, changes.MAX_LIMIT)
+        except changes.Expired:
+            return None
+        for entry in page["results"]:
+            if entry["op"] == "T":
+                return None
+            ids.add(entry["key"]["enrollment_id"])
+        position = changes.parse_token(page["next"])
+        if not page["has_more"]:
+            return ids, page["next"]
+
+
+def refresh(enrollment_ids=None, full=False):
+    """
+    Bring student_summary up to date. Returns {"rebuilt": n, "deleted": n,
+    "mode": "changes" | "fingerprints" | "ids"}.
+      refresh()                   -> only enrollments whose source rows changed
+      refresh(enrollment_ids=ids) -> exactly those enrollments
+      refresh(full=True)          -> every enrollment
+    """
+    ensure_table()
+    if enrollment_ids is not None:
+        result = rebuild(enrollment_ids)
+        mode = "ids"
+    else:
+        epoch = _capture_epoch()
+        # taken before any source row is read: what changes meanwhile is read next time
+        head = changes.head() if epoch else None
+        logged = None
+        if epoch and not full:
+            with connection.cursor() as cur:
+                stored = _sync_value(cur, "changes")
+            if stored and stored.startswith(f"{epoch}:"):
+                logged = _logged_enrollments(stored.split(":", 1)[1])
+
+        if logged is not None:
+            targets, head = logged
+            result = rebuild(targets)
+            mode = "changes"
+        else:
+            current = source_fingerprints()
+            stored = stored_fingerprints()
+            if full:
+                targets = list(current)
+            else:
+                targets = [eid for eid, fp in current.items() if stored.get(eid) != fp]
+            # gone from enrollments: rebuild() drops them
+            targets += [eid for eid in stored if eid not in current]
+            result = rebuild(targets, current)
+            mode = "fingerprints"
+        if epoch:
+            with connection.cursor() as cur:
+                _set_sync_value(cur, "changes", f"{epoch}:{head}")
+
+    if result["rebuilt"] or result["deleted"]:
+        api_cache.bump_version(TABLE)
+    return {**result, "mode": mode}
@@ -0,0 +1,334 @@
+# api/terms.py
+"""
+Cohort-wide weighted term percentages.
+
+For one cohort (academic_year + grade of `enrollments`) the engine
+
+  1. loads the cohort's assessment_weights once: weight[term, assessment_type];
+  2. pulls every FA task (unnested from the per-task arrays, duplicate tasks
+     dropped the way the FA grouping drops them) and every SA row of the
+     cohort in bulk, as flat (enrollment_id, subject, assessment_type, month,
+     score, max) tuples;
+  3. maps each task's month to a term (ACADEMIC_TERMS) and sums score / max
+     per (student, subject, term, assessment_type) with np.bincount, giving
+     one percentage per cell;
+  4. combines the cells with the weights: the term percentage is the
+     weighted mean over the assessment types that have tasks in that term,
+     the overall percentage the weighted mean over every term and type.
+
+Results are returned as TermResult tuples; `write_results()` stores them in
+the `term_results` table (`manage.py compute_term_results`), and
+GET /api/term-results/?academic_year=&grade= computes one cohort on demand.
+"""
+import json
+from collections import namedtuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .rawsql import as_list
+
+RESULTS_TABLE = "term_results"
+
+# month number -> term when ACADEMIC_TERMS isn't configured
+DEFAULT_TERMS = {"T1": (8, 9, 10, 11), "T2": (12, 1, 2, 3), "T3": (4, 5, 6, 7)}
+
+# rows per INSERT batch when COPY isn't available
+WRITE_BATCH = 5000
+
+# one per (student, subject): overall %, {term: %}, {term: {assessment_type: %}}
+TermResult = namedtuple("TermResult", "enrollment_id subject overall terms components")
+
+
+def term_calendar():
+    """
+    (term names, month -> term index lookup array of length 13; -1 = no term).
+    """
+    terms = getattr(settings, "ACADEMIC_TERMS", None) or DEFAULT_TERMS
+    names = list(terms)
+    lookup = np.full(13, -1, dtype=np.int64)
+    for i, name in enumerate(names):
+        for month in terms[name]:
+            lookup[int(month)] = i
+    return names, lookup
+
+
+# -------------------- loading --------------------
+def weight_grade(grade):
+    """
+    `grade` as assessment_weights stores it (an integer), or None for a
+    free-text grade of enrollments ("DP1", "Grade 9"), which has no weights.
+    """
+    try:
+        return int(grade)
+    except (TypeError, ValueError):
+        return None
+
+
+def load_weights(academic_year, grade):
+    """
+    {(term, assessment_type): weight} for one cohort; empty for a grade
+    weight_grade() can't read.
+    """
+    grade = weight_grade(grade)
+    if grade is None:
+        return {}
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT term, assessment_type, weight FROM assessment_weights WHERE academic_year = %s AND grade = %s",
+            [academic_year, grade],
+        )
+        return {(term, kind): float(weight) for term, kind, weight in cur.fetchall() if weight is not None}
+
+
+# FA tasks (arrays truncated to the shortest, like zip()) + SA rows; UNION
+# keeps one tuple per distinct task, then tasks of the same month are summed
+# (the engine only needs score / max totals per term)
+_PG_TASKS_SQL = """
+    WITH cohort AS (
+        SELECT enrollment_id FROM enrollments WHERE academic_year = %s AND grade = %s
+    ),
+    tasks AS (
+        SELECT f.enrollment_id, f.subject, f.assessment_type, f.evaluation_criteria,
+               u.month, u.task_name, u.teachers,
+               NULLIF(u.student_score::text, '')::float8 AS score,
+               NULLIF(u.max_score_old::text, '')::float8 AS max_score
+        FROM assessments_fa f
+        JOIN cohort c ON c.enrollment_id = f.enrollment_id
+        CROSS JOIN LATERAL unnest(f.month, f.task_name, f.teachers, f.student_score, f.max_score_old)
+             WITH ORDINALITY AS u(month, task_name, teachers, student_score, max_score_old, ord)
+        WHERE u.ord <= LEAST(
+            COALESCE(cardinality(f.month), 0), COALESCE(cardinality(f.task_name), 0),
+            COALESCE(cardinality(f.teachers), 0), COALESCE(cardinality(f.student_score), 0),
+            COALESCE(cardinality(f.max_score_old), 0)
+        )
+        UNION
+        SELECT s.enrollment_id, s.subject, s.assessment_type, s.evaluation_criteria,
+               s.month, s.task_name, s.teachers,
+               NULLIF(s.student_score, '')::float8, s.max_score_old::float8
+        FROM assessments_sa s
+        JOIN cohort c ON c.enrollment_id = s.enrollment_id
+    )
+    SELECT enrollment_id, subject, assessment_type,
+           CASE WHEN month ~ '^[0-9]{4}-[0-9]{2}' THEN substr(month, 6, 2)::int END AS month_no,
+           sum(score), sum(max_score)
+    FROM tasks
+    WHERE score IS NOT NULL AND max_score > 0
+    GROUP BY enrollment_id, subject, assessment_type, month_no
+"""
+
+
+def _month_number(month):
+    try:
+        return int(str(month)[5:7])
+    except (TypeError, ValueError):
+        return 0
+
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    return float(value)
+
+
+def _python_tasks(academic_year, grade):
+    """
+    Same tuples as _PG_TASKS_SQL, flattened here (SQLite stores the FA arrays
+    as JSON text).
+    """
+    cohort_sql = "SELECT enrollment_id FROM enrollments WHERE academic_year = %s AND grade = %s"
+    tasks = set()
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT f.enrollment_id, f.subject, f.assessment_type, f.evaluation_criteria, "
+            "f.month, f.task_name, f.teachers, f.student_score, f.max_score_old "
+            f"FROM assessments_fa f WHERE f.enrollment_id IN ({cohort_sql})",
+            [academic_year, grade],
+        )
+        for eid, subject, kind, criteria, *arrays in cur.fetchall():
+            for month, name, teacher, score, mx in zip(*(as_list(a) for a in arrays)):
+                tasks.add((eid, subject, kind, criteria, month, name, teacher, _number(score), _number(mx)))
+        cur.execute(
+            "SELECT s.enrollment_id, s.subject, s.assessment_type, s.evaluation_criteria, "
+            "s.month, s.task_name, s.teachers, s.student_score, s.max_score_old "
+            f"FROM assessments_sa s WHERE s.enrollment_id IN ({cohort_sql})",
+            [academic_year, grade],
+        )
+        for eid, subject, kind, criteria, month, name, teacher, score, mx in cur.fetchall():
+            tasks.add((eid, subject, kind, criteria, month, name, teacher, _number(score), _number(mx)))
+    return [
+        (eid, subject, kind, _month_number(month), score, mx)
+        for eid, subject, kind, _, month, _, _, score, mx in tasks
+        if score is not None and mx and mx > 0
+    ]
+
+
+def load_tasks(academic_year, grade):
+    """
+    Flat (enrollment_id, subject, assessment_type, month number, score, max)
+    tuples of one cohort (per task, or already summed per month on Postgres).
+    """
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cur:
+            cur.execute(_PG_TASKS_SQL, [academic_year, grade])
+            return cur.fetchall()
+    return _python_tasks(academic_year, grade)
+
+
+# -------------------- computation --------------------
+def _or_none(value):
+    return None if value != value else value  # NaN -> None
+
+
+def _codes(values):
+    """
+    (sorted distinct values, int64 code per value) for low-cardinality columns.
+    """
+    names = sorted(set(values), key=lambda v: (v is None, v or ""))
+    code = {v: i for i, v in enumerate(names)}
+    return names, np.fromiter((code[v] for v in values), dtype=np.int64, count=len(values))
+
+
+def compute(tasks, weights):
+    """
+    Weighted term and overall percentages from flat task tuples.
+    Returns a list of TermResult ordered by enrollment_id, subject; terms
+    without any task are left out of `terms` / `components`.
+    """
+    if not tasks:
+        return []
+    term_names, month_to_term = term_calendar()
+    # column by column: zip(*tasks) is far slower on millions of tuples
+    eids, subjects, kinds, months, scores, maxima = ([row[i] for row in tasks] for i in range(6))
+
+    months = np.array([m or 0 for m in months], dtype=np.int64)
+    term_idx = month_to_term[np.clip(months, 0, 12)]
+    keep = term_idx >= 0
+    if not keep.any():
+        return []
+
+    # integer codes: students via np.unique, the few subjects / types via a dict
+    student_names, student_idx = np.unique(np.array(eids, dtype=str), return_inverse=True)
+    subject_names, subject_idx = _codes(subjects)
+    type_names, type_idx = _codes(kinds)
+    pairs, pair_idx = np.unique((student_idx * len(subject_names) + subject_idx)[keep], return_inverse=True)
+    type_idx = type_idx[keep]
+    term_idx = term_idx[keep]
+    n_pairs, n_terms, n_types = len(pairs), len(term_names), len(type_names)
+
+    # one cell per (pair, term, type); sum scores and maxima per cell
+    cell = (pair_idx * n_terms + term_idx) * n_types + type_idx
+    size = n_pairs * n_terms * n_types
+    got = np.bincount(cell, weights=np.asarray(scores, dtype=np.float64)[keep], minlength=size)
+    out_of = np.bincount(cell, weights=np.asarray(maxima, dtype=np.float64)[keep], minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = (100.0 * got / out_of).reshape(n_pairs, n_terms, n_types)
+    present = ~np.isnan(pct)  # cells without tasks are NaN
+
+    w = np.array([[weights.get((t, k), 0.0) for k in type_names] for t in term_names], dtype=np.float64)
+    w_present = np.where(present, w, 0.0)
+    weighted = np.where(present, pct, 0.0) * w
+    with np.errstate(invalid="ignore", divide="ignore"):
+        term_pct = weighted.sum(axis=2) / w_present.sum(axis=2)
+        overall_pct = weighted.sum(axis=(1, 2)) / w_present.sum(axis=(1, 2))
+
+    # back to Python values in bulk (flat lists convert much faster than
+    # nested ones); the loop below only assembles one result per pair
+    student_names = student_names.tolist()
+    pct_flat = np.round(pct, 2).ravel().tolist()
+    term_flat = np.round(term_pct, 2).ravel().tolist()
+    overall_r = np.round(overall_pct, 2).tolist()
+    results = []
+    for p, pair in enumerate(pairs.tolist()):
+        eid, subject = student_names[pair // len(subject_names)], subject_names[pair % len(subject_names)]
+        by_term, components = {}, {}
+        for t, term in enumerate(term_names):
+            base = (p * n_terms + t) * n_types
+            cells = {
+                name: pct_flat[base + k]
+                for k, name in enumerate(type_names)
+                if pct_flat[base + k] == pct_flat[base + k]
+            }
+            if cells:
+                by_term[term] = _or_none(term_flat[p * n_terms + t])
+                components[term] = cells
+        results.append(TermResult(eid, subject, _or_none(overall_r[p]), by_term, components))
+    return results
+
+
+def compute_cohort(academic_year, grade):
+    """
+    (results, weights) for one cohort.
+    """
+    weights = load_weights(academic_year, grade)
+    return compute(load_tasks(academic_year, str(grade)), weights), weights
+
+
+def cohorts():
+    """
+    Every (academic_year, grade) pair present in enrollments.
+    """
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT DISTINCT academic_year, grade FROM enrollments "
+            "WHERE academic_year IS NOT NULL AND grade IS NOT NULL ORDER BY 1, 2"
+        )
+        return cur.fetchall()
+
+
+# -------------------- storage --------------------
+def ensure_table():
+    pg = connection.vendor == "postgresql"
+    with connection.cursor() as cur:
+        cur.execute(f"""CREATE TABLE IF NOT EXISTS {RESULTS_TABLE} (
+            enrollment_id text NOT NULL,
+            subject text NOT NULL,
+            academic_year text NOT NULL,
+            grade text NOT NULL,
+            overall_pct numeric(6, 2),
+            term_pcts {"jsonb" if pg else "text"},
+            components {"jsonb" if pg else "text"},
+            computed_at {"timestamptz" if pg else "text"},
+            PRIMARY KEY (enrollment_id, subject)
+        )""")
+        cur.execute(
+            f"CREATE INDEX IF NOT EXISTS {RESULTS_TABLE}_cohort_idx "
+            f"ON {RESULTS_TABLE} (academic_year, grade, enrollment_id)"
+        )
+
+
+def write_results(academic_year, grade, results):
+    """
+    Replace one cohort's rows of term_results (COPY on Postgres, batched
+    INSERTs elsewhere). Returns the number of rows written.
+    """
+    ensure_table()
+    grade = str(grade)
+    now = timezone.now()
+    stamp = now if connection.vendor == "postgresql" else now.isoformat()
+    columns = (
+        "enrollment_id", "subject", "academic_year", "grade", "overall_pct", "term_pcts", "components", "computed_at",
+    )
+    rows = (
+        (r.enrollment_id, r.subject, academic_year, grade, r.overall, json.dumps(r.terms), json.dumps(r.components), stamp)
+        for r in results
+    )
+    with transaction.atomic(), connection.cursor() as cur:
+        cur.execute(f"DELETE FROM {RESULTS_TABLE} WHERE academic_year = %s AND grade = %s", [academic_year, grade])
+        if connection.vendor == "postgresql" and hasattr(cur.cursor, "copy"):
+            with cur.cursor.copy(f"COPY {RESULTS_TABLE} ({', '.join(columns)}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:
+            sql = f"INSERT INTO {RESULTS_TABLE} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= WRITE_BATCH:
+                    cur.executemany(sql, batch)
+                    batch = []
+            if batch:
+                cur.executemany(sql, batch)
+    return len(results)
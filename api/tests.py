@@ -1,3 +1,1273 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import gzip
+import json
+import re
+import statistics
+import tempfile
+import threading
+from collections import Counter
+from decimal import Decimal
+import unittest
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from rest_framework import serializers as drf_serializers
+
+from . import aio, analytics, async_views, blacklist, changes, compression, dbpool, fastpath, grading, ingest, models, search, serializers, statements, summary, terms, views
+from . import cache as api_cache
+from . import urls as api_urls
+from .querylog import Shape, ShapeRecorder, extract_shapes
+from .rawsql import dictfetchall, fetch_many
+from .timing import QueryBudgetExceeded
+
+# every request of the suite is held to its view's query budget
+_budgets_raise = override_settings(QUERY_BUDGET_RAISE=True)
+
+
+def setUpModule():
+    _budgets_raise.enable()
+
+
+def tearDownModule():
+    _budgets_raise.disable()
+
+
+class ExtractShapesTests(SimpleTestCase):
+    def test_equality_lookup(self):
+        shapes = extract_shapes("SELECT * FROM assessments_fa WHERE enrollment_id = %s LIMIT 1000")
+        self.assertEqual(shapes, [Shape("assessments_fa", ("enrollment_id",), (), (), ())])
+
+    def test_keyset_page_ignores_physical_row_id(self):
+        shapes = extract_shapes(
+            "SELECT *, ctid::text AS _keyset_tb FROM subjects "
+            "WHERE (enrollment_id, subject, ctid) > (%s, %s, %s::tid) "
+            "ORDER BY enrollment_id, subject, ctid LIMIT 101"
+        )
+        self.assertEqual(shapes, [Shape("subjects", (), ("enrollment_id", "subject"), ("enrollment_id", "subject"), ())])
+
+    def test_orm_filters(self):
+        shapes = extract_shapes(
+            'SELECT "enrollments"."grade" FROM "enrollments" '
+            'WHERE ("enrollments"."academic_year" = %s AND "enrollments"."grade" = %s) '
+            'ORDER BY "enrollments"."enrollment_id" ASC LIMIT 25'
+        )
+        self.assertEqual(shapes, [Shape("enrollments", ("academic_year", "grade"), (), ("enrollment_id",), ())])
+
+    def test_search_is_a_pattern(self):
+        shapes = extract_shapes(
+            "SELECT * FROM subjects WHERE (subject ILIKE %s ESCAPE '\\' OR subject %% %s) "
+            "ORDER BY GREATEST(similarity(subject, %s)) DESC, enrollment_id LIMIT 50"
+        )
+        self.assertEqual(shapes, [Shape("subjects", (), (), ("enrollment_id",), ("subject",))])
+
+    def test_literals_and_writes_ignored(self):
+        self.assertEqual(extract_shapes("SELECT * FROM t WHERE a = 'x WHERE b = 1'"), [Shape("t", ("a",), (), (), ())])
+        self.assertEqual(extract_shapes("UPDATE subjects SET subject = %s WHERE enrollment_id = %s"), [])
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "advise_indexes reads Postgres plans/catalogs")
+class AdviseIndexesTests(TransactionTestCase):
+    # CREATE INDEX CONCURRENTLY can't run inside TestCase's transaction
+
+    def setUp(self):
+        with connection.cursor() as cur:
+            cur.execute("CREATE TABLE advisor_probe (enrollment_id text, subject text, score int)")
+            cur.execute(
+                "INSERT INTO advisor_probe SELECT 'E' || (i % 500), 'S' || (i % 7), i FROM generate_series(1, 5000) i"
+            )
+            cur.execute("ANALYZE advisor_probe")
+        self.recording = tempfile.TemporaryDirectory()
+        recorder = ShapeRecorder(self.recording.name)
+        with connection.execute_wrapper(recorder), connection.cursor() as cur:
+            for _ in range(3):
+                cur.execute("SELECT * FROM advisor_probe WHERE enrollment_id = %s ORDER BY subject", ["E1"])
+        recorder.flush()
+
+    def tearDown(self):
+        with connection.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS advisor_probe")
+        self.recording.cleanup()
+
+    def advise(self, **options):
+        out = StringIO()
+        call_command("advise_indexes", dir=self.recording.name, stdout=out, **options)
+        return out.getvalue()
+
+    def test_suggests_then_applies(self):
+        output = self.advise()
+        self.assertIn(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS advisor_probe_enrollment_id_subject_idx "
+            "ON advisor_probe (enrollment_id, subject);",
+            output,
+        )
+        self.assertIn("seen 3x, cost", output)
+
+        self.advise(apply=True)
+        with connection.cursor() as cur:
+            cur.execute("SELECT indexdef FROM pg_indexes WHERE tablename = 'advisor_probe'")
+            self.assertEqual(len(cur.fetchall()), 1)
+        self.assertIn("already served by an index", self.advise())
+
+
+class ServerTimingTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_header_reports_queries(self):
+        response = self.client.get("/api/health/")
+        self.assertEqual(response.status_code, 200)
+        timing = response["Server-Timing"]
+        self.assertIn('db;dur=', timing)
+        self.assertIn('desc="1 queries"', timing)
+        for metric in ("app;dur=", "render;dur=", "total;dur="):
+            self.assertIn(metric, timing)
+
+    def test_budget_exceeded_raises_only_when_configured(self):
+        with mock.patch.object(views.health, "query_budget", 0):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get("/api/health/")
+            with override_settings(QUERY_BUDGET_RAISE=False), self.assertLogs("api.timing", "WARNING") as logs:
+                self.assertEqual(self.client.get("/api/health/").status_code, 200)
+        self.assertIn("ran 1 queries, budget is 0", logs.output[0])
+
+
+class SeedSyntheticTests(TestCase):
+    def test_seeded_fa_rows_group_cleanly(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        response = self.client.get("/api/assessments/fa/by-enrollment/S000000-2022/")
+        self.assertEqual(response.status_code, 200)
+        groups = response.json()
+        self.assertEqual(len(groups), 6 * 3)  # subjects x FA criteria
+        for obj in groups:
+            tasks = list(zip(obj["month"], obj["task_name"], obj["teachers"], obj["student_score"], obj["max_score_old"]))
+            self.assertEqual(len(tasks), len(set(tasks)))
+            self.assertEqual(obj["month"], sorted(obj["month"]))
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "FA rows are grouped in SQL on Postgres only")
+class FAGroupingTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        api_cache.bump_version()
+        with connection.cursor() as cur:
+            # uneven arrays (zip() stops at the shortest), a blank score and a
+            # task repeated from the seeded rows of the same key
+            cur.execute(
+                "INSERT INTO assessments_fa (enrollment_id, subject, evaluation_criteria, month, task_name, teachers,"
+                " student_score, max_score_old) SELECT enrollment_id, subject, evaluation_criteria,"
+                " month[1:1] || %s::text[], task_name[1:1] || %s::text[], teachers[1:1] || %s::text[],"
+                " student_score[1:1] || %s::text[], max_score_old[1:1] || %s::numeric[]"
+                " FROM assessments_fa WHERE enrollment_id = 'S000001-2022' AND evaluation_criteria = 'SDL' LIMIT 1",
+                [["2022-01-05", "2022-02-01"], ["Late task", "Dropped"], ["T. Late", "T. Gone"], [""], [10]],
+            )
+
+    def test_sql_grouping_matches_python(self):
+        viewset = views.AssessmentFAViewSet()
+        for enrollment_id in ("S000000-2022", "S000001-2022", "S000002-2022", "S999999-2022"):
+            with self.subTest(enrollment_id=enrollment_id):
+                sql, params, finish = viewset.enrollment_query(enrollment_id)
+                with connection.cursor() as cur:
+                    cur.execute(sql, params)
+                    in_sql = finish(dictfetchall(cur))
+                    cur.execute("SELECT * FROM assessments_fa WHERE enrollment_id = %s ORDER BY ctid", [enrollment_id])
+                    in_python = viewset._group_fa_rows(dictfetchall(cur))
+                self.assertEqual(in_sql, in_python)
+                self.assertEqual(len(in_sql), 0 if enrollment_id == "S999999-2022" else 6 * 3)
+
+    def test_by_enrollment_returns_the_groups(self):
+        groups = self.client.get("/api/assessments/fa/by-enrollment/S000001-2022/").json()
+        sdl = [g for g in groups if g["evaluation_criteria"] == "SDL"]
+        self.assertTrue(sdl)
+        for group in sdl:
+            self.assertEqual(group["count_sdl_t1"], len(group["task_name"]))
+            self.assertEqual(len(group["month"]), len(group["student_score"]))
+        tasks = [t for g in sdl for t in g["task_name"]]
+        self.assertIn("Late task", tasks)
+        self.assertNotIn("Dropped", tasks)  # past the shortest array
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+
+    def export(self, path, **query):
+        response = self.client.get(f"/api/{path}/export/", query)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content).decode("utf-8")
+
+    def table(self, table, where="", params=()):
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT * FROM {table}{where}", params)
+            return [c[0] for c in cur.description], cur.fetchall()
+
+    def test_csv_has_one_header_and_every_row(self):
+        columns, rows = self.table("subjects")
+        with mock.patch.object(views.SubjectViewSet, "export_batch_size", 4):
+            response, body = self.export("subjects", format="csv")
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="subjects.csv"')
+        lines = list(csv.reader(StringIO(body)))
+        self.assertEqual(lines[0], columns)
+        expected = [["" if v is None else str(v) for v in row] for row in rows]
+        self.assertEqual(sorted(lines[1:]), sorted(expected))
+
+    def test_ndjson_rows_match_the_table(self):
+        for table, path in (("subjects", "subjects"), ("assessments_fa", "assessments/fa")):
+            with self.subTest(table=table):
+                columns, rows = self.table(table)
+                response, body = self.export(path, format="ndjson")
+                self.assertTrue(response["Content-Type"].startswith("application/x-ndjson"))
+                exported = [json.loads(line) for line in body.splitlines()]
+                # raw rows, not FA groups
+                self.assertEqual(len(exported), len(rows))
+                expected = [json.loads(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder)) for row in rows]
+                self.assertEqual(sorted(map(repr, exported)), sorted(map(repr, expected)))
+
+    def test_search_filters_the_export(self):
+        _, rows = self.table("subjects", " WHERE enrollment_id = %s", ["S000001-2022"])
+        _, body = self.export("subjects", format="ndjson", q="S000001")
+        exported = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(exported), len(rows))
+        self.assertEqual({row["enrollment_id"] for row in exported}, {"S000001-2022"})
+        _, body = self.export("subjects", format="csv", q="no such student")
+        self.assertEqual(body, "")
+
+
+class StudentDashboardTests(TestCase):
+    URL = "/api/students/{}/dashboard/"
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        api_cache.bump_version()
+
+    def test_sections_match_their_endpoints(self):
+        data = self.client.get(self.URL.format("S000001-2022")).json()
+        self.assertEqual(set(data), {"enrollment_id", *views.DASHBOARD_SECTIONS})
+        self.assertEqual(data["enrollment"], self.client.get("/api/enrollments/S000001-2022/").json())
+        for section, path in (("fa", "fa"), ("sa", "sa"), ("non_academic", "non-academic")):
+            by_enrollment = self.client.get(f"/api/assessments/{path}/by-enrollment/S000001-2022/").json()
+            self.assertEqual(data[section], by_enrollment, section)
+        with connection.cursor() as cur:
+            cur.execute("SELECT count(*) FROM subjects WHERE enrollment_id = %s", ["S000001-2022"])
+            self.assertEqual(len(data["subjects"]), cur.fetchone()[0])
+        self.assertEqual({row["enrollment_id"] for row in data["subjects"] + data["eol"]}, {"S000001-2022"})
+
+    def test_include_limits_the_sections(self):
+        data = self.client.get(self.URL.format("S000001-2022"), {"include": "subjects, fa"}).json()
+        self.assertEqual(set(data), {"enrollment_id", "subjects", "fa"})
+        response = self.client.get(self.URL.format("S000001-2022"), {"include": "subjects,grades"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_student_is_not_found(self):
+        for include in ("", "enrollment", "subjects", "fa,sa,eol,non_academic"):
+            with self.subTest(include=include):
+                response = self.client.get(self.URL.format("S999999-2022"), {"include": include} if include else {})
+                self.assertEqual(response.status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    URLS = [
+        "/api/subjects/?page_size=5",
+        "/api/subjects/S000001-2022~Mathematics/",
+        "/api/assessments/fa/by-enrollment/S000001-2022/",
+        "/api/enrollments/?page_size=2",
+        "/api/enrollments/S000001-2022/",
+    ]
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        api_cache.bump_version()
+
+    def test_matching_etags_are_not_modified(self):
+        for url in self.URLS:
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                etag = first["ETag"]
+                self.assertRegex(etag, r'^"[0-9a-f]{32}"$')
+                self.assertEqual(self.client.get(url)["ETag"], etag)
+                for header in (etag, f"W/{etag}", f'"stale", {etag}', "*"):
+                    response = self.client.get(url, headers={"If-None-Match": header})
+                    self.assertEqual(response.status_code, 304, header)
+                    self.assertEqual((response["ETag"], response.content), (etag, b""))
+                self.assertEqual(self.client.get(url, headers={"If-None-Match": '"stale"'}).status_code, 200)
+
+    def test_changed_rows_change_the_etag(self):
+        etags = {url: self.client.get(url)["ETag"] for url in self.URLS}
+        with connection.cursor() as cur:
+            cur.execute("UPDATE subjects SET grade = 'X'")
+            cur.execute("UPDATE assessments_fa SET assessment_type = 'changed' WHERE enrollment_id = 'S000001-2022'")
+            cur.execute("UPDATE enrollments SET user_name = 'renamed' WHERE enrollment_id = 'S000001-2022'")
+        api_cache.bump_version()
+        for url, etag in etags.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, headers={"If-None-Match": etag})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response["ETag"], etag)
+
+    def test_raw_etags_are_the_cache_versions(self):
+        url = "/api/subjects/?page_size=5"
+        with self.assertNumQueries(1):  # the page only, no hashing query
+            etag = self.client.get(url)["ETag"]
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 304)
+        api_cache.bump_version("subjects", "S000002-2022")
+        self.assertEqual(self.client.get(url, headers={"If-None-Match": etag}).status_code, 200)
+
+
+class SearchTests(TestCase):
+    URL = "/api/subjects/"
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO subjects (enrollment_id, subject) VALUES "
+                        "('S000000-2022', 'Applied Mathematics and Statistics'), ('S000000-2022', '100%_Maths')")
+
+    def subjects(self, q, **params):
+        response = self.client.get(self.URL, {"q": q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row["subject"] for row in response.json()["results"]]
+
+    def test_substring_fallback(self):
+        with mock.patch.object(search, "trgm_available", return_value=False):
+            found = self.subjects("mathematics")
+            self.assertEqual(found.count("Mathematics"), 3)
+            self.assertIn("Applied Mathematics and Statistics", found)
+            # ordered by key without similarity ranking
+            rows = self.client.get(self.URL, {"q": "S000001", "fields": "enrollment_id,subject"}).json()["results"]
+            self.assertEqual(rows, sorted(rows, key=lambda r: (r["enrollment_id"], r["subject"])))
+            self.assertEqual({r["enrollment_id"] for r in rows}, {"S000001-2022"})
+            # LIKE wildcards in q are literal
+            self.assertEqual(self.subjects("0%_m"), ["100%_Maths"])
+            self.assertEqual(self.subjects("0__m"), [])
+            self.assertEqual(self.subjects("mathmatics"), [])
+            self.assertEqual(len(self.subjects("mathematics", page_size=2)), 2)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "pg_trgm is a Postgres extension")
+    def test_trigram_ranking(self):
+        try:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DatabaseError:
+            self.skipTest("pg_trgm is not installed on this server")
+        with mock.patch.dict(search._trgm_available, clear=True):
+            found = self.subjects("mathematics")
+            self.assertEqual(found[:3], ["Mathematics"] * 3)
+            self.assertLess(found.index("Mathematics"), found.index("Applied Mathematics and Statistics"))
+            # a misspelling still matches by similarity
+            self.assertEqual(self.subjects("mathmatics")[:3], ["Mathematics"] * 3)
+            self.assertEqual(self.subjects("0%_m"), ["100%_Maths"])
+
+
+class StudentSummaryTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        self.assertEqual(summary.refresh(), {"rebuilt": 3, "deleted": 0, "mode": "fingerprints"})
+
+    def test_filtered_keyset_pages(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT academic_year, grade, school FROM enrollments WHERE enrollment_id = 'S000001-2022'")
+            year, grade, school = cur.fetchone()
+        response = self.client.get("/api/student-summaries/", {"academic_year": year, "grade": grade, "school": school})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([r["enrollment_id"] for r in results], ["S000001-2022"])
+        self.assertEqual(len(results[0]["subjects"]), 6)
+
+        first = self.client.get("/api/student-summaries/", {"page_size": 2}).json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([r["enrollment_id"] for r in first["results"] + second["results"]],
+                         ["S000000-2022", "S000001-2022", "S000002-2022"])
+
+    def test_refresh_rebuilds_changed_enrollments_only(self):
+        self.assertEqual(summary.refresh(), {"rebuilt": 0, "deleted": 0, "mode": "fingerprints"})
+        with connection.cursor() as cur:
+            cur.execute("UPDATE subjects SET current_sub_pct = 100 WHERE enrollment_id = 'S000002-2022'")
+            cur.execute("DELETE FROM enrollments WHERE enrollment_id = 'S000000-2022'")
+        self.assertEqual(summary.refresh(), {"rebuilt": 1, "deleted": 1, "mode": "fingerprints"})
+        data = self.client.get("/api/student-summaries/S000002-2022/").json()
+        self.assertEqual({s["current_pct"] for s in data["subjects"]}, {100.0})
+        self.assertEqual(self.client.get("/api/student-summaries/S000000-2022/").status_code, 404)
+
+    def test_duplicate_enrollments_collapse(self):
+        models.Enrollments.objects.create(enrollment_id="S000001-2022", user_name="duplicate")
+        self.assertEqual(summary.refresh(), {"rebuilt": 1, "deleted": 0, "mode": "fingerprints"})
+        self.assertEqual(summary.refresh(full=True)["rebuilt"], 3)
+        data = self.client.get("/api/student-summaries/S000001-2022/").json()
+        # the seeded row has every column, the appended one a name only
+        self.assertNotEqual(data["user_name"], "duplicate")
+        self.assertIsNotNone(data["academic_year"])
+
+    def test_not_found_before_the_first_refresh(self):
+        with connection.cursor() as cur:
+            cur.execute(f"DROP TABLE {summary.TABLE}")
+        for url in ("/api/student-summaries/", "/api/student-summaries/S000001-2022/"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertIn("refresh_student_summary", response.json()["detail"])
+
+
+class StudentSummaryChangeLogTests(TransactionTestCase):
+    # the change log only shows committed changes
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        call_command("change_log", install=True, table=list(summary.SOURCE_TABLES), stdout=StringIO())
+
+    def tearDown(self):
+        changes.uninstall()
+        with connection.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {summary.TABLE}")
+            cur.execute(f"DROP TABLE IF EXISTS {summary.SYNC_TABLE}")
+
+    def test_refresh_reads_the_logged_enrollments(self):
+        self.assertEqual(summary.refresh(), {"rebuilt": 3, "deleted": 0, "mode": "fingerprints"})
+        self.assertEqual(summary.refresh(), {"rebuilt": 0, "deleted": 0, "mode": "changes"})
+        with connection.cursor() as cur:
+            cur.execute("UPDATE subjects SET current_sub_pct = 100 WHERE enrollment_id = 'S000002-2022'")
+            cur.execute("DELETE FROM enrollments WHERE enrollment_id = 'S000000-2022'")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(summary.refresh(), {"rebuilt": 1, "deleted": 1, "mode": "changes"})
+        # no full read of the source tables
+        reads = [q["sql"] for q in queries.captured_queries if re.search(r"FROM (enrollments|subjects)\b", q["sql"])]
+        self.assertTrue(reads)
+        self.assertTrue(all(re.search(r"enrollment_id (= ANY|IN) ?\(", sql) for sql in reads), reads)
+        data = self.client.get("/api/student-summaries/S000002-2022/").json()
+        self.assertEqual({s["current_pct"] for s in data["subjects"]}, {100.0})
+
+        # a reinstalled log starts a new epoch: positions from the old one mean nothing
+        changes.uninstall()
+        call_command("change_log", install=True, table=list(summary.SOURCE_TABLES), stdout=StringIO())
+        self.assertEqual(summary.refresh()["mode"], "fingerprints")
+
+
+class GradingLookupTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=1, years=1, reset=True, stdout=StringIO())
+        grading.reset()
+
+    def lookup(self, items):
+        return self.client.post("/api/grading/lookup/", {"items": items}, content_type="application/json")
+
+    def test_bulk_lookup_without_queries_once_warm(self):
+        items = [[7, 0], [7, "14"], [7, 14.5], [7, 15], ["7", 100], [7, 101], [99, 50],
+                 ["Mathematics", "hl", 85], ["Mathematics", "HL", -1], ["Nope", "SL", 50]]
+        self.assertEqual(self.lookup(items).json()["grades"], [1, 1, 1, 2, 7, None, None, 7, None, None])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup(items * 500).json()["grades"][:2], [1, 1])
+
+    def test_bands_run_up_to_the_next_band(self):
+        index = grading.BoundaryIndex([(7, 15, 29, 2), (7, 0, 14, 1), (7, 30, 100, 3), (8, 0, 50, 1)])
+        for score, expected in [(-0.1, None), (0, 1), (14, 1), (14.5, 1), (14.99, 1), (15, 2), (29.5, 2),
+                                (30, 3), (100, 3), (100.01, None)]:
+            self.assertEqual(index.lookup(7, score), expected, score)
+        self.assertEqual((index.lookup(8, 50), index.lookup(8, 51), index.lookup(9, 10)), (1, None, None))
+
+    def test_version_bump_rebuilds_index(self):
+        self.lookup([[7, 50]])
+        with connection.cursor() as cur:
+            cur.execute("UPDATE myp_grade_boundaries SET boundary_level = boundary_level + 10")
+        self.assertEqual(self.lookup([[7, 50]]).json()["grades"], [4])
+        call_command("invalidate_api_cache", table=["myp_grade_boundaries"], stdout=StringIO())
+        self.assertEqual(self.lookup([[7, 50]]).json()["grades"], [14])
+
+    def test_malformed_items(self):
+        self.assertEqual(self.lookup([[7]]).status_code, 400)
+        self.assertIn("item 1", self.lookup([[7, 1], [7, "x"]]).json()["detail"])
+
+
+class TermEngineTests(SimpleTestCase):
+    WEIGHTS = {(t, "FA"): 40.0 for t in ("T1", "T2", "T3")} | {(t, "SA"): 60.0 for t in ("T1", "T2", "T3")}
+
+    def test_weighted_terms_and_overall(self):
+        tasks = [
+            ("E1", "Maths", "FA", 9, 8.0, 10.0),   # T1 FA 80%
+            ("E1", "Maths", "FA", 10, 6.0, 10.0),  # ... now 70%
+            ("E1", "Maths", "SA", 11, 45.0, 50.0),  # T1 SA 90%
+            ("E1", "Maths", "SA", 1, 25.0, 50.0),   # T2 SA only: 50%
+            ("E1", "Maths", "FA", 0, 1.0, 1.0),     # no month: no term
+            ("E2", "Art", "FA", 4, 3.0, 4.0),       # T3 FA only: 75%
+        ]
+        results = terms.compute(tasks, self.WEIGHTS)
+        self.assertEqual([(r.enrollment_id, r.subject) for r in results], [("E1", "Maths"), ("E2", "Art")])
+        maths, art = results
+        self.assertEqual(maths.components, {"T1": {"FA": 70.0, "SA": 90.0}, "T2": {"SA": 50.0}})
+        self.assertEqual(maths.terms, {"T1": 82.0, "T2": 50.0})
+        # (40*70 + 60*90 + 60*50) / (40 + 60 + 60)
+        self.assertEqual(maths.overall, 70.0)
+        self.assertEqual((art.terms, art.overall), ({"T3": 75.0}, 75.0))
+
+    def test_missing_weights_leave_percentages_empty(self):
+        [result] = terms.compute([("E1", "Maths", "EOL", 9, 5.0, 10.0)], self.WEIGHTS)
+        self.assertEqual(result.components, {"T1": {"EOL": 50.0}})
+        self.assertEqual((result.terms, result.overall), ({"T1": None}, None))
+
+
+class TermResultsTests(TestCase):
+    def test_command_and_endpoint_agree(self):
+        call_command("seed_synthetic", students=5, years=1, reset=True, stdout=StringIO())
+        call_command("compute_term_results", stdout=StringIO())
+        with connection.cursor() as cur:
+            cur.execute("SELECT count(DISTINCT grade) FROM term_results")
+            self.assertEqual(cur.fetchone()[0], 5)
+            cur.execute("SELECT academic_year, grade, overall_pct FROM term_results WHERE enrollment_id = 'S000000-2022'")
+            rows = cur.fetchall()
+            year, grade = rows[0][:2]
+            stored = sorted(float(v) for _, _, v in rows)
+            cur.execute("SELECT count(*) FROM term_results WHERE grade = %s", [grade])
+            count = cur.fetchone()[0]
+
+        data = self.client.get("/api/term-results/", {"academic_year": year, "grade": grade}).json()
+        self.assertEqual(data["count"], count)
+        self.assertEqual(data["weights"]["T1"], {"FA": 40.0, "SA": 60.0})
+        self.assertEqual(sorted(r["overall"] for r in data["results"] if r["enrollment_id"] == "S000000-2022"), stored)
+        self.assertEqual(self.client.get("/api/term-results/", {"grade": grade}).status_code, 400)
+
+    def test_free_text_grades_are_skipped(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+        models.Enrollments.objects.filter(enrollment_id="S000001-2022").update(grade="DP1")
+        self.assertEqual(terms.load_weights("2022-23", "DP1"), {})
+        out = StringIO()
+        call_command("compute_term_results", stdout=out)
+        self.assertIn("grade 'DP1': not a numeric grade, skipped", out.getvalue())
+        with connection.cursor() as cur:
+            cur.execute("SELECT DISTINCT enrollment_id FROM term_results")
+            self.assertEqual(cur.fetchall(), [("S000000-2022",)])
+        response = self.client.get("/api/term-results/", {"academic_year": "2022-23", "grade": "DP1"})
+        self.assertEqual(response.status_code, 400)
+
+
+class CohortAnalyticsTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=12, years=1, reset=True, stdout=StringIO())
+        api_cache.bump_version("subjects")  # reports cached by earlier tests
+
+    def test_group_matches_its_rows(self):
+        with connection.cursor() as cur:
+            cur.execute(
+                "SELECT s.current_sub_pct, s.current_sub_grade FROM subjects s "
+                "JOIN enrollments e ON e.enrollment_id = s.enrollment_id WHERE e.grade = '6' AND s.subject = 'Sciences'"
+            )
+            rows = cur.fetchall()
+        values = sorted(float(pct) for pct, _ in rows)
+
+        data = self.client.get("/api/analytics/cohort/", {"grade": "6", "group_by": "grade,subject", "bins": 4}).json()
+        self.assertEqual(data["bin_edges"], [0, 25, 50, 75, 100])
+        group = next(g for g in data["results"] if g["subject"] == "Sciences")
+        current = group["current"]
+        self.assertEqual((group["grade"], group["students"], current["count"]), ("6", len(rows), len(rows)))
+        self.assertAlmostEqual(current["mean"], sum(values) / len(values), places=2)
+        self.assertAlmostEqual(current["median"], statistics.median(values), places=2)
+        bins = Counter(min(int(v // 25), 3) for v in values)
+        self.assertEqual(current["histogram"], [bins[b] for b in range(4)])
+        self.assertEqual(current["bands"], dict(sorted(Counter(band for _, band in rows).items())))
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "the SQL path is Postgres only")
+    def test_sql_matches_python_fallback(self):
+        for filters, group_by, bins in [({}, list(analytics.DIMENSIONS), 10), ({"school": "North Campus"}, ["grade"], 7)]:
+            sql_report = analytics.compute(filters, group_by, bins)
+            with mock.patch.object(connection, "vendor", "sqlite"):
+                python_report = analytics.compute(filters, group_by, bins)
+            self.assertEqual(sql_report, python_report)
+
+    def test_cached_until_the_tables_change(self):
+        url = "/api/analytics/cohort/?group_by=school"
+        with self.assertNumQueries(1):
+            first = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        api_cache.bump_version("enrollments")
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).json(), first.json())
+
+    def test_bad_parameters(self):
+        for params in ({"group_by": "grade,nope"}, {"bins": "0"}, {"bins": "x"}):
+            self.assertEqual(self.client.get("/api/analytics/cohort/", params).status_code, 400, params)
+
+
+class IngestTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+
+    def export(self, path, fmt):
+        return b"".join(self.client.get(f"/api/{path}/export/", {"format": fmt}).streaming_content)
+
+    def rows(self, table):
+        with connection.cursor() as cur:
+            cur.execute(f"SELECT * FROM {table}")
+            return sorted(map(repr, cur.fetchall()))
+
+    def test_export_round_trips(self):
+        for table, path in (("subjects", "subjects"), ("assessments_fa", "assessments/fa")):
+            for fmt in ingest.FORMATS:
+                with self.subTest(table=table, format=fmt):
+                    before = self.rows(table)
+                    version = api_cache.current_version(table, None)
+                    result = ingest.ingest(table, BytesIO(self.export(path, fmt)), fmt)
+                    self.assertEqual(result["rows"], len(before))
+                    self.assertEqual(self.rows(table), before)
+                    self.assertNotEqual(api_cache.current_version(table, None), version)
+
+    def test_bad_uploads_leave_the_table_alone(self):
+        before = self.rows("subjects")
+        for body in (
+            b"enrollment_id,nope\nE1,x\n",                  # unknown column
+            b"subject\nMathematics\n",                       # non-null enrollment_id missing
+            b"enrollment_id,current_sub_pct\n,5\n",          # ... or NULL
+            b"enrollment_id,current_sub_pct\nE1,abc\n",      # not a number
+            b"enrollment_id,current_sub_pct\nE1,123456789\n",  # beyond numeric(10, 2)
+            b"enrollment_id,subject\nE1\n",                  # short row
+            b"enrollment_id,subject\n",                      # no rows
+        ):
+            with self.subTest(body=body):
+                with self.assertRaises(ingest.IngestError):
+                    ingest.ingest("subjects", BytesIO(body), "csv")
+        self.assertEqual(self.rows("subjects"), before)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "staging swap is Postgres-only")
+    def test_swap_keeps_the_table_structure(self):
+        with connection.cursor() as cur:
+            cur.execute("CREATE INDEX subjects_subject_idx ON subjects (subject, enrollment_id)")
+        ingest.ingest("subjects", BytesIO(self.export("subjects", "ndjson")), "ndjson")
+        with connection.cursor() as cur:
+            cur.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'subjects'")
+            self.assertEqual(cur.fetchall(), [("subjects_subject_idx",)])
+            cur.execute("SELECT relpersistence, reltuples FROM pg_class WHERE oid = 'subjects'::regclass")
+            self.assertEqual(cur.fetchone(), ("p", len(self.rows("subjects"))))
+            cur.execute("SELECT count(*) FROM pg_class WHERE relname LIKE '\\_ingest\\_%%'")
+            self.assertEqual(cur.fetchone(), (0,))
+
+    def test_admin_upload(self):
+        body = self.export("subjects", "csv")
+        self.assertEqual(self.client.post("/api/ingest/subjects/", body, content_type="text/csv").status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        response = self.client.post("/api/ingest/subjects/", body, content_type="text/csv")
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()["rows"], len(self.rows("subjects")))
+        response = self.client.post("/api/ingest/subjects/", b"enrollment_id,nope\n", content_type="text/csv")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post("/api/ingest/users_table/", body, content_type="text/csv").status_code, 404)
+
+
+class ChangeFeedTests(TransactionTestCase):
+    # an open test transaction would hold the feed's horizon back
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        call_command("change_log", install=True, stdout=StringIO())
+
+    def tearDown(self):
+        changes.uninstall()
+
+    def feed(self, **params):
+        response = self.client.get("/api/changes/", params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_keys_match_the_viewsets(self):
+        for viewset in views.RawReadOnlyViewSet.__subclasses__():
+            if viewset.table_name in changes.KEYS:
+                self.assertEqual(changes.KEYS[viewset.table_name], viewset.key_columns, viewset.table_name)
+
+    def test_pages_of_changed_keys(self):
+        since = self.feed(since="now")["next"]
+        with connection.cursor() as cur:
+            cur.execute("UPDATE subjects SET current_sub_pct = 50 WHERE enrollment_id = 'S000001-2022'")
+            updated = cur.rowcount
+            cur.execute("DELETE FROM enrollments WHERE enrollment_id = 'S000002-2022'")
+        seen, pages = [], 0
+        while True:
+            page = self.feed(since=since, limit=2)
+            seen += page["results"]
+            since, pages = page["next"], pages + 1
+            if not page["has_more"]:
+                break
+        self.assertEqual(len(seen), updated + 1)
+        self.assertEqual(pages, (updated + 1) // 2 + 1)
+        self.assertEqual({r["op"] for r in seen[:updated]}, {"U"})
+        self.assertEqual(seen[0]["key"]["enrollment_id"], "S000001-2022")
+        self.assertEqual(seen[-1], {**seen[-1], "table": "enrollments", "op": "D", "pk": "S000002-2022"})
+        self.assertEqual(self.feed(since=since)["results"], [])
+        self.assertEqual(self.feed(since=since, table="enrollments")["next"], since)
+
+        export = self.client.get("/api/subjects/export/", {"format": "ndjson"}).streaming_content
+        ingest.ingest("subjects", BytesIO(b"".join(export)), "ndjson")
+        reload = self.feed(since=since, table="subjects", limit=changes.MAX_LIMIT)["results"]
+        self.assertEqual(reload[-1], {**reload[-1], "op": "T", "key": None})
+
+    def test_pruned_and_malformed_tokens(self):
+        with connection.cursor() as cur:
+            cur.execute("DELETE FROM subjects WHERE enrollment_id = 'S000001-2022'")
+        call_command("change_log", prune_days=0, stdout=StringIO())
+        self.assertEqual(self.client.get("/api/changes/").status_code, 410)
+        self.assertEqual(self.feed(since="now")["results"], [])
+        for params in ({"since": "12"}, {"since": "a-1"}, {"table": "nope"}, {"limit": "0"}):
+            self.assertEqual(self.client.get("/api/changes/", params).status_code, 400, params)
+        changes.uninstall()
+        self.assertEqual(self.client.get("/api/changes/").status_code, 404)
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        blacklist.reset()
+        self.refresh = blacklist.RefreshToken.for_user(get_user_model().objects.create_user("ops"))
+
+    def post(self):
+        return self.client.post("/api/token/refresh/", {"refresh": str(self.refresh)})
+
+    def test_bloom_filter(self):
+        bloom = blacklist.BloomFilter(2000, 0.01)
+        for i in range(2000):
+            bloom.add(f"in-{i}")
+        self.assertTrue(all(f"in-{i}" in bloom for i in range(2000)))
+        false_positives = sum(f"out-{i}" in bloom for i in range(20000))
+        self.assertLess(false_positives, 20000 * 0.02)
+
+    def test_checks_answered_from_memory(self):
+        self.assertEqual(self.post().status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post().status_code, 200)
+        self.assertFalse([q["sql"] for q in queries if blacklist.TABLE in q["sql"]])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.refresh.blacklist()
+        self.assertEqual(self.post().status_code, 401)  # recent set
+        blacklist.reset()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.post().status_code, 401)  # rebuilt: Bloom hit, confirmed
+        self.assertEqual(len([q for q in queries if blacklist.TABLE in q["sql"]]), 2)
+
+    def test_version_is_read_from_memory(self):
+        self.assertEqual(self.post().status_code, 200)
+        with mock.patch.object(api_cache, "current_version", wraps=api_cache.current_version) as read:
+            for _ in range(5):
+                self.assertEqual(self.post().status_code, 200)
+            self.assertEqual(read.call_count, 0)
+            with override_settings(TOKEN_BLACKLIST_VERSION_CHECK=0):
+                self.assertEqual(self.post().status_code, 200)
+            self.assertTrue(read.called)
+
+    def test_blacklisting_elsewhere_is_seen_within_the_staleness_bound(self):
+        self.assertEqual(self.post().status_code, 200)
+        # another host: the row is there, but no version bump reaches this worker
+        self.refresh.blacklist()
+        self.assertEqual(self.post().status_code, 200)
+        with override_settings(TOKEN_BLACKLIST_MAX_STALENESS=0):
+            self.assertEqual(self.post().status_code, 401)
+
+
+class DbPoolStatsTests(TestCase):
+    def test_admin_only_pool_snapshot(self):
+        self.assertEqual(self.client.get("/api/db/pool/").status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        data = self.client.get("/api/db/pool/").json()
+        self.assertEqual(set(data), {"pid", "sync", "async"})
+        if connection.vendor == "postgresql":
+            pool = data["sync"]["pool"]
+            self.assertEqual((pool["name"], pool["in_use"]), ("sync", 1))  # the test's own connection
+            self.assertGreaterEqual(data["sync"]["wait"]["count"], 1)
+        else:
+            self.assertIsNone(data["sync"]["pool"])
+
+
+class PreparedStatementTests(TestCase):
+    def test_placeholders_become_numbered_params(self):
+        self.assertEqual(
+            statements.server_text("SELECT * FROM t WHERE a = %s AND b LIKE 'x%%' AND c = %s LIMIT 10"),
+            "SELECT * FROM t WHERE a = $1 AND b LIKE 'x%' AND c = $2 LIMIT 10",
+        )
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "psycopg connection settings")
+    def test_connection_settings_are_restored(self):
+        connection.ensure_connection()
+        before = (connection.connection.prepare_threshold, connection.connection.prepared_max)
+        with statements.cursor() as cur:
+            cur.execute("SELECT %s::int AS n", [1])
+            self.assertEqual(cur.fetchall(), [(1,)])
+        self.assertEqual(fetch_many([("SELECT 1 AS n", None)] * 2, prepared=True), [[{"n": 1}]] * 2)
+        self.assertEqual((connection.connection.prepare_threshold, connection.connection.prepared_max), before)
+
+    def test_repeated_lookups_reuse_the_statement(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+        statements.reset_stats()
+        sent = []
+
+        def record(execute, sql, params, many, context):
+            sent.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            for _ in range(3):
+                api_cache.bump_version()  # miss the response cache: query each time
+                response = self.client.get("/api/assessments/sa/by-enrollment/S000001-2022/")
+                self.assertEqual(response.status_code, 200)
+        # nothing a transaction-mode pooler would route to the wrong backend
+        self.assertFalse([sql for sql in sent if sql.lstrip().upper().startswith(("PREPARE", "EXECUTE"))])
+        self.assertEqual(len(response.json()), 6 * 3)  # subjects x SA criteria
+
+        self.client.force_login(get_user_model().objects.create_user("ops", is_staff=True))
+        data = self.client.get("/api/db/statements/").json()
+        self.assertEqual(data["enabled"], connection.vendor == "postgresql")
+        if data["enabled"]:
+            by_sql = {row["sql"]: row for row in data["statements"]}
+            rows = by_sql["SELECT * FROM assessments_sa WHERE enrollment_id = %s LIMIT 1000"]
+            self.assertEqual(rows["executions"], 3)
+            # protocol-level: one statement on the session, no SQL PREPARE sent
+            self.assertGreaterEqual(rows["session"]["custom_plans"] + rows["session"]["generic_plans"], 3)
+            self.assertEqual(len(data["statements"]), 1)
+
+
+class FieldProjectionTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+
+    def test_raw_rows_carry_only_requested_columns(self):
+        fields = {"fields": "subject,current_percentage"}
+        rows = self.client.get("/api/assessments/sa/by-enrollment/S000001-2022/", fields).json()
+        self.assertEqual(len(rows), 6 * 3)
+        self.assertEqual({tuple(row) for row in rows}, {("subject", "current_percentage")})
+
+        # FA groups and keyset cursors need columns that aren't returned
+        first = self.client.get("/api/assessments/fa/", {"page_size": 2, "fields": "subject,task_name"}).json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual({tuple(obj) for obj in first["results"] + second["results"]}, {("subject", "task_name")})
+        self.assertNotEqual(first["results"], second["results"])
+
+        full = self.client.get("/api/subjects/S000000-2022/").json()[0]
+        slim = self.client.get("/api/subjects/S000000-2022/", {"exclude": "engagement_analysis"}).json()[0]
+        self.assertEqual(slim, {k: v for k, v in full.items() if k != "engagement_analysis"})
+
+    def test_orm_reads_only_selected_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/enrollments/", {"fields": "enrollment_id,grade"})
+        self.assertEqual({tuple(row) for row in response.json()["results"]}, {("enrollment_id", "grade")})
+        page_sql = [q["sql"] for q in ctx.captured_queries if "LIMIT" in q["sql"]]
+        self.assertTrue(page_sql)
+        self.assertTrue(all("engagement_analysis" not in sql for sql in page_sql))
+
+    def test_unknown_fields_are_rejected(self):
+        for url in ("/api/subjects/", "/api/enrollments/"):
+            response = self.client.get(url, {"fields": "subject,nope"})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertIn("nope", response.json()["detail"])
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+
+    def test_negotiation(self):
+        available = ["zstd", "br", "gzip"]
+        self.assertEqual(compression.negotiate("gzip, deflate, br, zstd", available), "zstd")
+        self.assertEqual(compression.negotiate("gzip;q=0.5, br", available), "br")
+        self.assertEqual(compression.negotiate("*;q=0.1, gzip;q=0.8", available), "gzip")
+        self.assertIsNone(compression.negotiate("identity, gzip;q=0", available))
+        self.assertIsNone(compression.negotiate(None, available))
+
+    def test_gzip_body_timing_and_revalidation(self):
+        url = "/api/assessments/fa/?page_size=50"
+        plain = self.client.get(url)
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) / 4)
+        self.assertEqual(response["ETag"], "W/" + plain["ETag"])
+        self.assertIn('compress;dur=', response["Server-Timing"])
+        self.assertIn('desc="gzip ', response["Server-Timing"])
+        again = self.client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response["ETag"]})
+        self.assertEqual(again.status_code, 304)
+
+    def test_streamed_export(self):
+        url = "/api/subjects/export/?format=ndjson"
+        plain = b"".join(self.client.get(url).streaming_content)
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), plain)
+
+    def test_threshold_and_opt_out(self):
+        url, gz = "/api/assessments/fa/by-enrollment/S000000-2022/", {"Accept-Encoding": "gzip"}
+        self.assertEqual(self.client.get(url, headers=gz)["Content-Encoding"], "gzip")
+        self.assertFalse(self.client.get("/api/health/", headers=gz).has_header("Content-Encoding"))
+        with override_settings(API_COMPRESSION_MIN_SIZE=10 ** 9):
+            self.assertFalse(self.client.get(url, headers=gz).has_header("Content-Encoding"))
+        with mock.patch.object(views.AssessmentFAViewSet, "compress_response", False, create=True):
+            response = self.client.get(url, headers=gz)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+
+class ResponseCacheTests(TestCase):
+    URL = "/api/assessments/sa/by-enrollment/S000001-2022/"
+
+    def setUp(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+        api_cache.bump_version()
+        api_cache.reset_stats()
+
+    def counts(self):
+        found = api_cache.stats(["assessments_sa"])["assessments_sa"]
+        return found["hits"], found["misses"]
+
+    def teachers(self, response):
+        return {row["teachers"] for row in response.json()}
+
+    def test_hits_not_modified_and_invalidation(self):
+        first = self.client.get(self.URL)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.counts(), (0, 1))
+        with self.assertNumQueries(0):
+            again = self.client.get(self.URL)
+            unchanged = self.client.get(self.URL, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(self.counts(), (1, 1))  # a 304 doesn't read the cache either
+
+        with connection.cursor() as cur:
+            cur.execute("UPDATE assessments_sa SET teachers = 'Changed' WHERE enrollment_id = 'S000001-2022'")
+        self.assertNotEqual(self.teachers(self.client.get(self.URL)), {"Changed"})  # still cached
+        api_cache.bump_version("assessments_sa", "S000002-2022")
+        self.assertEqual(self.client.get(self.URL).content, first.content)
+        api_cache.bump_version("assessments_sa", "S000001-2022")
+        self.assertEqual(self.teachers(self.client.get(self.URL)), {"Changed"})
+        self.assertEqual(self.counts(), (3, 2))
+
+        with connection.cursor() as cur:
+            cur.execute("UPDATE assessments_sa SET teachers = 'Again' WHERE enrollment_id = 'S000001-2022'")
+        call_command("invalidate_api_cache", table=["assessments_sa"], stdout=StringIO())
+        response = self.client.get(self.URL, headers={"If-None-Match": first["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.teachers(response), {"Again"})
+        self.assertEqual(self.counts(), (3, 3))
+
+    def test_counters_are_never_culled_and_increment_atomically(self):
+        with tempfile.TemporaryDirectory() as location:
+            cache = api_cache.CounterFileCache(location, {"OPTIONS": {"MAX_ENTRIES": 2, "CULL_FREQUENCY": 1}})
+            for i in range(10):
+                api_cache._incr(cache, f"ver:{i}")
+            self.assertEqual(len(cache.get_many([f"ver:{i}" for i in range(10)])), 10)
+
+            def bump():
+                for _ in range(25):
+                    api_cache._incr(cache, "ver:shared")
+
+            threads = [threading.Thread(target=bump) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(cache.get("ver:shared"), 100)
+
+
+class BatchGetTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=2, years=1, reset=True, stdout=StringIO())
+
+    def batch_get(self, url, ids):
+        return self.client.post(url, {"ids": ids}, content_type="application/json")
+
+    def test_found_and_missing_on_typed_keys(self):
+        ids = ["2022-23~07~T1~FA", "2022-23~7~T1~SA", "2022-23~7~T1~FA", "2022-23~99~T1~FA"]
+        with self.assertNumQueries(1):
+            data = self.batch_get("/api/assessment-weights/batch-get/", ids).json()
+        self.assertEqual(sorted(data["results"]), sorted(ids[:3]))
+        self.assertEqual(data["results"]["2022-23~07~T1~FA"], data["results"]["2022-23~7~T1~FA"])
+        self.assertEqual(data["results"]["2022-23~7~T1~SA"]["assessment_type"], "SA")
+        self.assertEqual(data["missing"], ["2022-23~99~T1~FA"])
+
+        data = self.batch_get("/api/myp-grade-boundaries/batch-get/", ["07~1", "7~2", "7~99"]).json()
+        self.assertEqual(sorted(data["results"]), ["07~1", "7~2"])
+        self.assertEqual(data["results"]["07~1"]["boundary_level"], 1)
+        self.assertEqual(data["missing"], ["7~99"])
+
+        data = self.batch_get("/api/enrollments/batch-get/", ["S000001-2022", "nope"]).json()
+        self.assertEqual(list(data["results"]), ["S000001-2022"])
+        self.assertEqual(data["missing"], ["nope"])
+
+    def test_invalid_keys_are_bad_requests(self):
+        response = self.batch_get("/api/assessment-weights/batch-get/", ["2022-23~abc~T1~FA"])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("2022-23~abc~T1~FA", response.json()["detail"])
+        self.assertEqual(self.batch_get("/api/assessment-weights/batch-get/", ["2022-23~7"]).status_code, 400)
+        self.assertEqual(self.batch_get("/api/myp-grade-boundaries/batch-get/", ["x~1"]).status_code, 400)
+        self.assertEqual(self.batch_get("/api/enrollments/batch-get/", [1]).status_code, 400)
+
+
+class FastReadTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        joined = datetime.datetime(2024, 6, 1, 9, 30, 15, 123456, tzinfo=datetime.timezone.utc)
+        models.LmsUsersUser.objects.create(
+            username="r\u00e9ka\u2028", email="reka@example.com", is_staff="true", date_joined=joined, role="teacher"
+        )
+        models.LmsUsersUser.objects.create(username="no-dates", email=None)
+        models.DpGradeBoundaries.objects.create(
+            subject="Physics", level="HL", grade=7, min_score=Decimal("71.005"), max_score=Decimal("-0.5")
+        )
+        models.UsersTable.objects.create(email="u@example.com", username="u", created_at=joined)
+
+    def test_same_bytes_as_the_serializers(self):
+        urls = [
+            "/api/enrollments/?page_size=200",
+            "/api/enrollments/?page_size=2&page=2&ordering=-current_pct_overall",
+            "/api/enrollments/?fields=enrollment_id,engagement_analysis,current_pct_overall",
+            "/api/assessment-weights/",
+            "/api/dp-grade-boundaries/",
+            "/api/lms-users/",
+            "/api/users-table/",
+        ]
+        for url in urls:
+            with override_settings(API_FAST_READS=False):
+                expected = self.client.get(url)
+            with mock.patch.object(drf_serializers.Serializer, "to_representation", side_effect=AssertionError):
+                response = self.client.get(url)  # must not serialize per instance
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.content, expected.content, url)
+            self.assertEqual(response.get("ETag"), expected.get("ETag"), url)
+
+    def test_unsupported_serializers_keep_the_serializer(self):
+        class Computed(serializers.DpGradeBoundariesSerializer):
+            band = drf_serializers.SerializerMethodField()
+
+            class Meta(serializers.DpGradeBoundariesSerializer.Meta):
+                fields = ["subject", "band"]
+
+            def get_band(self, obj):
+                return f"{obj.min_score}-{obj.max_score}"
+
+        self.assertIsNone(fastpath.plan(Computed()))
+        self.assertIsNotNone(fastpath.plan(serializers.DpGradeBoundariesSerializer()))
+
+
+class RawKeysetPaginationTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO subjects (enrollment_id, subject) VALUES (NULL, 'Maths'), "
+                        "('S000001-2022', NULL), ('S000001-2022', NULL), (NULL, NULL)")
+            cur.execute("INSERT INTO assessments_fa (enrollment_id, subject, evaluation_criteria) VALUES "
+                        "('S000001-2022', 'Mathematics', NULL), (NULL, 'Mathematics', 'SDL'), (NULL, NULL, NULL)")
+
+    def walk(self, url):
+        pages = [self.client.get(url).json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).json())
+        return pages
+
+    @staticmethod
+    def nulls_last(key):
+        return [(value is None, value or "") for value in key]
+
+    def cursor(self, *position):
+        payload = json.dumps({"p": list(position), "r": 0}).encode("utf-8")
+        return base64.urlsafe_b64encode(payload).decode("ascii")
+
+    def test_row_pages_cover_null_keys_forwards_and_back(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT enrollment_id, subject FROM subjects")
+            expected = sorted(cur.fetchall(), key=self.nulls_last)
+        pages = self.walk("/api/subjects/?page_size=4&fields=enrollment_id,subject")
+        rows = [(r["enrollment_id"], r["subject"]) for page in pages for r in page["results"]]
+        self.assertEqual(rows, expected)
+        self.assertEqual(len(pages), 6)  # 22 rows
+
+        back = [pages[-1]]
+        while back[-1]["previous"]:
+            back.append(self.client.get(back[-1]["previous"]).json())
+        self.assertEqual([page["results"] for page in reversed(back[1:])], [page["results"] for page in pages[:-1]])
+
+    def test_group_pages_cover_null_keys(self):
+        with connection.cursor() as cur:
+            cur.execute("SELECT DISTINCT enrollment_id, subject, evaluation_criteria FROM assessments_fa")
+            expected = sorted(cur.fetchall(), key=self.nulls_last)
+        pages = self.walk("/api/assessments/fa/?page_size=5")
+        keys = [(r["enrollment_id"], r["subject"], r["evaluation_criteria"]) for page in pages for r in page["results"]]
+        self.assertEqual(keys, expected)
+        back = self.client.get(pages[-1]["previous"]).json()
+        self.assertEqual(back["results"], pages[-2]["results"])
+
+    def test_invalid_cursors_are_not_found(self):
+        tid = "(0,1)" if connection.vendor == "postgresql" else 1
+        self.assertEqual(self.client.get("/api/subjects/", {"cursor": self.cursor(None, None, tid)}).status_code, 200)
+        invalid = [
+            ("/api/subjects/", self.cursor("S000001-2022", "Maths", "(0,1) OR 1=1")),
+            ("/api/subjects/", self.cursor("S000001-2022", ["Maths"], tid)),
+            ("/api/subjects/", self.cursor("S000001-2022", True, tid)),
+            ("/api/subjects/", self.cursor("S000001-2022", tid)),
+            ("/api/myp-grade-boundaries/", self.cursor("abc", 1, tid)),
+            ("/api/student-summaries/", self.cursor(None)),
+            ("/api/subjects/", "not base64!"),
+        ]
+        summary.refresh()
+        for url, cursor in invalid:
+            response = self.client.get(url, {"cursor": cursor})
+            self.assertEqual(response.status_code, 404, (url, cursor))
+            self.assertEqual(response.json()["detail"], "Invalid cursor")
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=2, reset=True, stdout=StringIO())
+        # the "primary key" isn't unique in the real data
+        models.Enrollments.objects.create(enrollment_id="S000001-2022", user_name="duplicate")
+
+    def walk(self, url):
+        pages = [self.client.get(url).json()]
+        while pages[-1]["next"]:
+            pages.append(self.client.get(pages[-1]["next"]).json())
+        return pages
+
+    def test_cursor_pages_cover_every_row_once(self):
+        expected = sorted(models.Enrollments.objects.values_list("enrollment_id", "user_name"))
+        for fast in (True, False):
+            with override_settings(API_FAST_READS=fast):
+                pages = self.walk("/api/enrollments/?page_size=2")
+            rows = [(r["enrollment_id"], r["user_name"]) for page in pages for r in page["results"]]
+            self.assertEqual(sorted(rows), expected)
+            self.assertEqual([r[0] for r in rows], sorted(r[0] for r in rows))
+            self.assertEqual(len(pages), 4)
+            self.assertEqual({(p["count"], p["count_estimated"]) for p in pages}, {(7, False)})
+
+            back = self.client.get(pages[-1]["previous"]).json()
+            self.assertEqual(back["results"], pages[-2]["results"])
+
+    def test_null_keys_sort_last_and_page_through(self):
+        with connection.cursor() as cur:
+            cur.execute("INSERT INTO enrollments (enrollment_id, user_name) VALUES (NULL, 'n1'), (NULL, 'n2')")
+        for fast in (True, False):
+            with override_settings(API_FAST_READS=fast):
+                pages = self.walk("/api/enrollments/?page_size=2")
+                # 9 rows: the 4th page ends on a NULL key
+                self.assertEqual(len(pages), 5)
+                self.assertIsNone(pages[3]["results"][-1]["enrollment_id"])
+                rows = [(r["enrollment_id"], r["user_name"]) for page in pages for r in page["results"]]
+                self.assertEqual(sorted(rows[-2:]), [(None, "n1"), (None, "n2")])
+                self.assertEqual(len(set(rows)), 9)
+
+                back = [pages[-1]]
+                while back[-1]["previous"]:
+                    back.append(self.client.get(back[-1]["previous"]).json())
+                self.assertEqual([p["results"] for p in reversed(back[1:])], [p["results"] for p in pages[:-1]])
+
+    def test_invalid_cursors_are_not_found(self):
+        tid = "(0,1)" if connection.vendor == "postgresql" else 1
+
+        def cursor(*position):
+            return base64.urlsafe_b64encode(json.dumps({"p": list(position), "r": 0}).encode("utf-8")).decode("ascii")
+
+        for key in ("S000001-2022", None):
+            self.assertEqual(self.client.get("/api/enrollments/", {"cursor": cursor(key, tid)}).status_code, 200)
+        invalid = [
+            ("/api/lms-users/", cursor("abc", tid)),
+            ("/api/enrollments/", cursor({"a": 1}, tid)),
+            ("/api/enrollments/", cursor("S000001-2022", "(0,1)) OR (1=1")),
+            ("/api/enrollments/", cursor("S000001-2022", True)),
+        ]
+        for fast in (True, False):
+            with override_settings(API_FAST_READS=fast):
+                for url, value in invalid:
+                    response = self.client.get(url, {"cursor": value})
+                    self.assertEqual(response.status_code, 404, (url, value))
+                    self.assertEqual(response.json()["detail"], "Invalid cursor")
+
+    def test_page_numbers_and_ordering_keep_offset_pages(self):
+        data = self.client.get("/api/enrollments/", {"page_size": 2, "page": 2}).json()
+        self.assertEqual((data["count"], data["count_estimated"]), (7, False))
+        self.assertIn("page=3", data["next"])
+        data = self.client.get("/api/enrollments/", {"ordering": "-enrollment_id"}).json()
+        self.assertEqual(data["results"][0]["enrollment_id"], "S000002-2023")
+
+    def test_every_orm_list_is_paginated(self):
+        models.LmsUsersUser.objects.bulk_create([models.LmsUsersUser(id=i, username=f"u{i}") for i in range(30)])
+        data = self.client.get("/api/lms-users/").json()
+        self.assertEqual((len(data["results"]), data["count"]), (25, 30))
+        self.assertEqual(len(self.client.get(data["next"]).json()["results"]), 5)
+        for url in ["/api/lms-users-preapproved/", "/api/token-outstanding/", "/api/token-blacklisted/", "/api/dp-grade-boundaries/"]:
+            self.assertIn("results", self.client.get(url).json(), url)
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "row estimates come from the Postgres planner")
+    def test_large_tables_report_the_planner_estimate(self):
+        with connection.cursor() as cur:
+            cur.execute("ANALYZE enrollments")
+        with mock.patch.object(views.DefaultPagination, "exact_count_below", 0):
+            data = self.client.get("/api/enrollments/").json()
+            self.assertEqual((data["count"], data["count_estimated"]), (7, True))
+            data = self.client.get("/api/enrollments/", {"search": "nope", "page_size": 1}).json()
+            self.assertTrue(data["count_estimated"])  # EXPLAIN's estimate for the search
+            data = self.client.get("/api/enrollments/", {"count": "exact"}).json()
+            self.assertEqual((data["count"], data["count_estimated"]), (7, False))
+
+
+# urlconf of AsyncViewTests: the API as routed with ASYNC_API on
+urlpatterns = [path("api/", include(async_views.urlpatterns(api_urls.router) + api_urls.urlpatterns))]
+
+
+class AsyncViewTests(TransactionTestCase):
+    # the async views read through their own connections: the rows must be committed
+
+    def setUp(self):
+        call_command("seed_synthetic", students=3, years=1, reset=True, stdout=StringIO())
+
+    async def test_same_bytes_as_sync_views(self):
+        paths = [
+            "/api/subjects/?page_size=4",
+            "/api/assessments/fa/?page_size=2",
+            "/api/assessments/sa/?q=S000001",
+            "/api/assessments/fa/by-enrollment/S000001-2022/",
+            "/api/assessments/fa/by-enrollment/S000001-2022/?fields=subject,month",
+            "/api/subjects/?page_size=4&exclude=engagement_analysis",
+            "/api/assessments/non-academic/S000002-2022/",
+            "/api/subjects/S000000-2022~nope/",
+            "/api/health/",
+        ]
+        try:
+            for url in paths:
+                expected = await sync_to_async(self.client.get)(url)
+                api_cache.response_cache().clear()  # build the async response, don't share the sync one
+                with override_settings(ROOT_URLCONF=__name__):
+                    response = await self.async_client.get(url)
+                    again = await self.async_client.get(url, headers={"If-None-Match": response.get("ETag", "")})
+                self.assertEqual((response.status_code, response.content), (expected.status_code, expected.content), url)
+                self.assertEqual(response.get("ETag"), expected.get("ETag"), url)
+                if response.status_code == 200 and url != "/api/health/":
+                    self.assertEqual(again.status_code, 304, url)
+            self.assertGreaterEqual(dbpool.snapshot()["async"]["wait"]["count"], 1 if aio.is_postgres() else 0)
+        finally:
+            await aio.close_pool()
+
+    async def test_next_cursor_and_sync_fallback(self):
+        try:
+            with override_settings(ROOT_URLCONF=__name__):
+                first = (await self.async_client.get("/api/subjects/", {"page_size": 10})).json()
+                second = (await self.async_client.get(first["next"])).json()
+                csv = await self.async_client.get("/api/subjects/", {"format": "csv"})
+            self.assertEqual(len(first["results"] + second["results"]), 18)
+            self.assertEqual(second["next"], None)
+            self.assertEqual(csv.status_code, 404)  # list has no csv renderer; handled by the sync view
+        finally:
+            await aio.close_pool()
+
+    async def test_export_streams_from_an_async_cursor(self):
+        try:
+            for query in ({"format": "ndjson"}, {"format": "csv"}, {"format": "csv", "q": "S000001"}):
+                expected = await sync_to_async(
+                    lambda: b"".join(self.client.get("/api/subjects/export/", query).streaming_content)
+                )()
+                with override_settings(ROOT_URLCONF=__name__), \
+                        mock.patch.object(views.SubjectViewSet, "export_batch_size", 4):
+                    response = await self.async_client.get("/api/subjects/export/", query)
+                    self.assertTrue(response.is_async)
+                    chunks = [chunk async for chunk in response.streaming_content]
+                self.assertEqual(b"".join(chunks), expected, query)
+                self.assertEqual(len(chunks), 5 if "q" not in query else 2)  # 18 / 6 rows, 4 per batch
+            self.assertEqual(response["Content-Disposition"], 'attachment; filename="subjects.csv"')
+        finally:
+            await aio.close_pool()
@@ -0,0 +1,311 @@
+# api/timing.py
+"""
+Per-request timing: query count, DB time, view (Python) time and render time.
+
+ServerTimingMiddleware installs a RequestTimer as a DB execute_wrapper on
+every connection for the duration of a request and reports the result
+
+    Server-Timing: db;dur=12.4;desc="3 queries", group;dur=4.1, app;dur=6.0, render;dur=2.2, total;dur=24.7
+
+plus one JSON log line on the "api.timing" logger. Code that wants its own
+bucket wraps itself in `span("name")` (e.g. the FA grouping); `db_block()`
+marks work whose DB wait doesn't happen inside cursor.execute() (pipelined
+batches), so it is booked as DB time.
+
+Views may declare a query budget:
+
+    class SubjectViewSet(RawReadOnlyViewSet):
+        query_budget = 2                       # every action
+        query_budget = {"list": 2, "retrieve": 1}
+
+    @query_budget(1)
+    @api_view(["GET"])
+    def health(request): ...
+
+Going over budget is logged; with QUERY_BUDGET_RAISE (off by default, on
+in the test suite) it raises QueryBudgetExceeded instead.
+
+Under ASGI Django runs sync code in per-request threads, each with its own
+connections, so the wrapper is installed from process_view() (which Django
+calls in that thread) and removed once the response is back. The async
+views' queries (api/aio.py) don't go through Django connections and book
+themselves with RequestTimer.add_queries().
+"""
+import json
+import logging
+import re
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("api.timing")
+
+_current = ContextVar("api_request_timer", default=None)
+
+# one-off catalog lookups (type OIDs on a worker's first connection, extension
+# probes, table columns for ?fields=, row estimates for list counts) are timed
+# and counted but don't use up a view's budget
+_CATALOG_RE = re.compile(
+    r"\bFROM\s+(?:pg_(?:type|extension|namespace|class|attribute)|sqlite_master)\b|^(?:PRAGMA|EXPLAIN)\s", re.I
+)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class RequestTimer:
+    """
+    Accumulates DB/query counters (as an execute_wrapper) and named spans.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = 0
+        self.catalog_queries = 0
+        self.db = 0.0
+        self.spans = {}
+        self.render_started = None
+        self.view_name = None
+        self.budget = None
+        self._db_block = 0
+        # async requests: connections the wrapper was added to in process_view()
+        self.wrapped = None
+        # (encoding, bytes in, bytes out, wall seconds, CPU seconds), see api/compression.py
+        self.compression = None
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        if _CATALOG_RE.search(sql):
+            self.catalog_queries += 1
+        if self._db_block:
+            return execute(sql, params, many, context)
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += perf_counter() - start
+
+    def add_queries(self, count, seconds):
+        """
+        Book `count` queries that took `seconds` of wall time outside the
+        execute_wrapper (async connections).
+        """
+        self.queries += count
+        if not self._db_block:
+            self.db += seconds
+
+    def wrap(self, connection):
+        connection.execute_wrappers.append(self)
+        self.wrapped.append(connection)
+
+    def unwrap(self):
+        for connection in self.wrapped or ():
+            connection.execute_wrappers.remove(self)
+        self.wrapped = None
+
+    def compressed(self, encoding, bytes_in, bytes_out, wall, cpu):
+        self.compression = (encoding, bytes_in, bytes_out, wall, cpu)
+
+    def compression_fields(self):
+        """
+        compress_* fields of the log line ({} when nothing was compressed).
+        """
+        if self.compression is None:
+            return {}
+        encoding, bytes_in, bytes_out, _, cpu = self.compression
+        return {
+            "compress_encoding": encoding,
+            "compress_bytes_in": bytes_in,
+            "compress_bytes_out": bytes_out,
+            "compress_ratio": round(bytes_in / bytes_out, 2) if bytes_out else None,
+            "compress_cpu_ms": round(cpu * 1000, 1),
+        }
+
+    @property
+    def budgeted_queries(self):
+        return self.queries - self.catalog_queries
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def metrics(self):
+        """
+        [(name, seconds, description)] in Server-Timing order.
+        """
+        total = perf_counter() - self.started
+        view_end = self.render_started or self.started + total
+        compress = None
+        if self.compression is not None:
+            encoding, bytes_in, bytes_out, wall, cpu = self.compression
+            ratio = f"{bytes_in / bytes_out:.1f}x" if bytes_out else "-"
+            compress = ("compress", wall, f"{encoding} {ratio} cpu {cpu * 1000:.1f}ms")
+        render = total - (view_end - self.started) - (compress[1] if compress else 0.0)
+        app = (view_end - self.started) - self.db - sum(self.spans.values())
+        out = [("db", self.db, f"{self.queries} queries")]
+        out += [(name, seconds, None) for name, seconds in self.spans.items()]
+        out += [("app", max(app, 0.0), None), ("render", max(render, 0.0), None)]
+        if compress:
+            out.append(compress)
+        out.append(("total", total, None))
+        return out
+
+    def header(self, metrics):
+        parts = []
+        for name, seconds, desc in metrics:
+            part = f"{name};dur={seconds * 1000:.1f}"
+            if desc:
+                part += f';desc="{desc}"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+def current_timer():
+    return _current.get()
+
+
+@contextmanager
+def span(name):
+    """
+    Book the enclosed block under `name` (no-op outside a timed request).
+    Also usable as a decorator: @span("group").
+    """
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, perf_counter() - start)
+
+
+@contextmanager
+def db_block():
+    """
+    Count the whole block as DB time; queries inside it are still counted.
+    """
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    timer._db_block += 1
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        timer._db_block -= 1
+        if not timer._db_block:
+            timer.db += perf_counter() - start
+
+
+def query_budget(n):
+    """
+    Decorator setting the query budget of a function view.
+    """
+    def decorator(view):
+        view.query_budget = n
+        return view
+    return decorator
+
+
+def resolve_budget(view_func, method):
+    budget = getattr(view_func, "query_budget", None)
+    if budget is None:
+        budget = getattr(getattr(view_func, "cls", None), "query_budget", None)
+    if isinstance(budget, dict):
+        action = (getattr(view_func, "actions", None) or {}).get(method.lower())
+        budget = budget.get(action)
+    if budget is None:
+        budget = getattr(settings, "QUERY_BUDGET_DEFAULT", None)
+    return budget
+
+
+class ServerTimingMiddleware:
+    """
+    Time every request; add Server-Timing, log a JSON line, enforce budgets.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timer = RequestTimer()
+        token = _current.set(timer)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, timer, response)
+
+    async def __acall__(self, request):
+        timer = RequestTimer()
+        timer.wrapped = []
+        token = _current.set(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+            timer.unwrap()
+        return self.finish(request, timer, response)
+
+    def finish(self, request, timer, response):
+        metrics = timer.metrics()
+        response["Server-Timing"] = timer.header(metrics)
+        logger.info(json.dumps({
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "view": timer.view_name,
+            "queries": timer.queries,
+            "catalog_queries": timer.catalog_queries,
+            "budget": timer.budget,
+            **{f"{name}_ms": round(seconds * 1000, 1) for name, seconds, _ in metrics},
+            **timer.compression_fields(),
+        }))
+
+        if timer.budget is not None and timer.budgeted_queries > timer.budget:
+            message = (
+                f"{request.method} {request.path} ({timer.view_name}) ran {timer.budgeted_queries} queries, "
+                f"budget is {timer.budget}"
+            )
+            if getattr(settings, "QUERY_BUDGET_RAISE", False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = _current.get()
+        if timer is not None:
+            # viewsets and @api_view functions both hang their class off the view
+            name = getattr(getattr(view_func, "cls", None), "__name__", None) or getattr(view_func, "__name__", None)
+            action = (getattr(view_func, "actions", None) or {}).get(request.method.lower())
+            timer.view_name = f"{name}.{action}" if action else name
+            timer.budget = resolve_budget(view_func, request.method)
+            if timer.wrapped is not None:
+                # async request: this runs in the thread sync views will use
+                for alias in connections:
+                    timer.wrap(connections[alias])
+        return None
+
+    def process_template_response(self, request, response):
+        # DRF Responses are rendered right after this hook returns
+        timer = _current.get()
+        if timer is not None:
+            timer.render_started = perf_counter()
+        return response
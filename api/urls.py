@@ -1,14 +1,15 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     EnrollmentViewSet, SubjectViewSet,
     AssessmentEOLViewSet, AssessmentFAViewSet, AssessmentSAViewSet,
-    health, AssessmentWeightsViewSet, UsersTableViewSet, MypGradeBoundariesViewSet,
+    health, cache_stats, db_pool_stats, db_statements, grading_lookup, term_results, cohort_analytics, ingest_table, change_feed, student_dashboard, AssessmentWeightsViewSet, UsersTableViewSet, MypGradeBoundariesViewSet,
     LmsUsersUserViewSet, LmsUsersStaffpreapprovedViewSet, TokenBlacklistOutstandingtokenViewSet,
     TokenBlacklistBlacklistedtokenViewSet, DpGradeBoundariesViewSet,
-    AssessmentNonAcademicViewSet,
+    AssessmentNonAcademicViewSet, StudentSummaryViewSet,
 )
-from . import views
+from . import async_views, views
 
 
 router = DefaultRouter()
@@ -28,12 +29,24 @@ router.register(r"token-outstanding", TokenBlacklistOutstandingtokenViewSet, bas
 router.register(r"token-blacklisted", TokenBlacklistBlacklistedtokenViewSet, basename="token-blacklisted")
 router.register(r"dp-grade-boundaries", DpGradeBoundariesViewSet, basename="dp-grade-boundaries")
 router.register(r"assessments/non-academic", AssessmentNonAcademicViewSet, basename="assessments-non-academic")
+router.register(r"student-summaries", StudentSummaryViewSet, basename="student-summaries")
 
 
 
-urlpatterns = [
-    path("", include(router.urls)),
+# explicit paths go first: the router's detail routes accept any lookup value
+# ('.+'), so they would otherwise swallow ".../by-enrollment/<id>/".
+# On ASGI workers (ASYNC_API) the async views answer the raw tables' GETs first.
+urlpatterns = (async_views.urlpatterns(router) if settings.ASYNC_API else []) + [
     path("health/", health, name="api-health"),
+    path("cache/stats/", cache_stats, name="api-cache-stats"),
+    path("db/pool/", db_pool_stats, name="api-db-pool"),
+    path("db/statements/", db_statements, name="api-db-statements"),
+    path("grading/lookup/", grading_lookup, name="grading-lookup"),
+    path("term-results/", term_results, name="term-results"),
+    path("analytics/cohort/", cohort_analytics, name="analytics-cohort"),
+    path("ingest/<str:table>/", ingest_table, name="api-ingest"),
+    path("changes/", change_feed, name="api-changes"),
+    path("students/<path:enrollment_id>/dashboard/", student_dashboard, name="student-dashboard"),
     path(
     "assessments/fa/by-enrollment/<path:enrollment_id>/",
     views.AssessmentFAViewSet.as_view({"get": "list_by_enrollment"}),
@@ -49,7 +62,7 @@ urlpatterns = [
     views.AssessmentNonAcademicViewSet.as_view({"get": "list_by_enrollment"}),
     name="assessments-non-academic-by-enrollment",
     ),
-
+    path("", include(router.urls)),
 ]
 
 # ensure router viewsets accept arbitrary chars for lookup value
@@ -1,24 +1,42 @@
 # api/views.py
+import json
+import operator
+from functools import cached_property, reduce
 from urllib.parse import unquote
 from rest_framework import viewsets, filters
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.exceptions import NotFound, ParseError
 from .permissions import ReadOnlyOrAdmin
 from . import models, serializers
+from django.conf import settings
+from django.apps import apps
+from django.core.exceptions import ValidationError
 from django.db import connection
+from django.db.models import Q
+from django.http import StreamingHttpResponse
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticatedOrReadOnly
+from rest_framework.permissions import SAFE_METHODS, AllowAny, IsAdminUser, IsAuthenticatedOrReadOnly
 from django_filters.rest_framework import DjangoFilterBackend
+from . import cache as api_cache
+from . import projection as api_projection
+from . import analytics, changes, dbpool, fastpath, grading, ingest, statements, summary, terms
+from .conditional import conditional_response
+from .pagination import KeysetPagination, RawKeysetPagination
+from .rawsql import as_list, cursor, dictfetchall, fetch_many, iter_batches
+from .search import search_filter, search_order
+from .renderers import NDJSONRenderer, CSVRenderer, ndjson_lines, csv_lines
+from .timing import query_budget, span
 
 # ------------------------------------------------------------
-# Pagination + healthcheck (unchanged)
+# Keyset pagination, healthcheck + admin-only diagnostics
+# (response cache, connection pool, prepared statements)
 # ------------------------------------------------------------
-class DefaultPagination(PageNumberPagination):
+class DefaultPagination(KeysetPagination):
     page_size = 25
     page_size_query_param = "page_size"
     max_page_size = 200
 
+@query_budget(1)
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def health(request):
@@ -27,6 +45,47 @@ def health(request):
         row = cur.fetchone()
     return Response({"status": "ok", "db": bool(row and row[0] == 1)})
 
+# admin-only views: the session + user lookups of the authenticated admin
+@query_budget(2)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    """
+    Hit/miss counters of the per-enrollment response cache, per table, of the
+    worker that answers (each worker counts its own).
+    """
+    tables = sorted({vs.table_name for vs in RawReadOnlyViewSet.__subclasses__() if vs.table_name})
+    return Response({"ttl": settings.API_CACHE_TTL, "tables": api_cache.stats(tables)})
+
+@query_budget(2)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def db_pool_stats(request):
+    """
+    Connection-pool usage of this worker: size / in use / waiting per pool
+    and a histogram of checkout waits (api/dbpool.py).
+    """
+    return Response(dbpool.snapshot())
+
+# + pg_prepared_statements of this worker's session
+@query_budget(3)
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def db_statements(request):
+    """
+    Prepared statements of this worker (api/statements.py): executions per
+    statement, plus the generic / custom plan counts Postgres reports for
+    them on this session.
+    """
+    enabled = statements.enabled(connection.vendor)
+    rows = statements.stats()
+    if enabled:
+        with connection.cursor() as cur:
+            plans = statements.server_plans(cur)
+        for row in rows:
+            row["session"] = plans.get(statements.server_text(row["sql"]))
+    return Response({"enabled": enabled, "statements": rows})
+
 # ------------------------------------------------------------
 # Composite lookup mixin (keeps behaviour for viewsets that use ORM)
 # ------------------------------------------------------------
@@ -58,44 +117,453 @@ class CompositeLookupMixin:
         return obj
 
 # ------------------------------------------------------------
-# Helper for raw-SQL read-only viewsets (to avoid 'id' expectation)
+# Conditional GET for ORM viewsets (see api/conditional.py)
+# ------------------------------------------------------------
+class ConditionalGetMixin:
+    """
+    Strong ETags for list/retrieve, hashed over the response data (these
+    tables are written through the API without bumping the cache versions),
+    so If-None-Match -> 304 skips rendering and the transfer without a
+    second query.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return conditional_response(request, None, lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return conditional_response(
+            request, None, lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+# ------------------------------------------------------------
+# ?fields= / ?exclude= for ORM viewsets (see api/projection.py)
 # ------------------------------------------------------------
-def dictfetchall(cursor):
-    cols = [c[0] for c in cursor.description] if cursor.description else []
-    return [dict(zip(cols, row)) for row in cursor.fetchall()]
+class FieldsMixin:
+    """
+    Column projection for list/retrieve: only the selected serializer fields
+    are loaded (.only()) and rendered (DynamicFieldsModelSerializer).
+    Writes and batch-get work on whole rows.
+    """
+
+    def get_projected_fields(self):
+        if self.request.method not in SAFE_METHODS or self.action not in ("list", "retrieve"):
+            return None
+        if not api_projection.requested(self.request):
+            return None
+        if not hasattr(self, "_projected_fields"):
+            available = list(self.get_serializer_class()().fields)
+            self._projected_fields = api_projection.select_fields(self.request, available)
+        return self._projected_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_projected_fields()
+        if fields is None:
+            return queryset
+        columns = {f.name for f in queryset.model._meta.concrete_fields}
+        return queryset.only(*[f for f in fields if f in columns])
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_projected_fields()
+        if fields is not None:
+            kwargs.setdefault("fields", fields)
+        return super().get_serializer(*args, **kwargs)
+
+# ------------------------------------------------------------
+# Serializer-bypass list pages for ORM viewsets (see api/fastpath.py)
+# ------------------------------------------------------------
+class FastReadMixin:
+    """
+    list() from values_list() tuples instead of per-instance serialization,
+    whenever the serializer's fields are plain columns; the JSON is the same.
+    Set `fast_reads = False` (or API_FAST_READS=false) to always serialize.
+    """
+    fast_reads = True
+
+    def get_fast_plan(self):
+        if not (self.fast_reads and getattr(settings, "API_FAST_READS", True)):
+            return None
+        fields = self.get_projected_fields() if hasattr(self, "get_projected_fields") else None
+        return fastpath.cached_plan(self.get_serializer_class(), fields)
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset()).values_list(*plan.sources)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(fastpath.to_rows(page, plan))
+        return Response(fastpath.to_rows(queryset, plan))
+
+# ------------------------------------------------------------
+# Batch retrieve: POST /{resource}/batch-get/ {"ids": [...]}
+# ------------------------------------------------------------
+def parse_batch_ids(request, limit):
+    """
+    Pull the list of ids out of a batch-get body ({"ids": [...]} or a bare list).
+    Raises ParseError on anything else.
+    """
+    data = request.data
+    ids = data.get("ids") if isinstance(data, dict) else data
+    if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+        raise ParseError('Expected {"ids": ["<id>", ...]}')
+    if len(ids) > limit:
+        raise ParseError(f"At most {limit} ids per batch")
+    # de-dupe but keep the caller's order
+    return list(dict.fromkeys(ids))
+
+
+def typed_key(fields, values):
+    """
+    `values` converted with to_python() of the matching model fields (None
+    leaves a value as-is), so "07" and "7" name the same integer key.
+    Raises ValueError on a value the field rejects.
+    """
+    key = []
+    for field, value in zip(fields, values):
+        if field is not None:
+            try:
+                value = field.to_python(value)
+            except ValidationError as e:
+                raise ValueError(f"{field.name}: {' '.join(e.messages)}")
+        key.append(value)
+    return tuple(key)
+
+
+class BatchGetMixin:
+    """
+    Resolve many detail ids in one query.
+    Ids use the same format as /{pk}/; viewsets with CompositeLookupMixin
+    parse them with parse_pk(), others match on lookup_field.
+    Response: {"results": {<id>: <object>}, "missing": [<id>, ...]}
+    """
+    batch_get_limit = 1000
+
+    def get_batch_filters(self, pk: str) -> dict:
+        if hasattr(self, "parse_pk"):
+            return self.parse_pk(pk)
+        return {self.lookup_field: unquote(pk)}
+
+    # read-only lookup sent as POST (ids don't fit in a URL); same access as GET
+    @action(detail=False, methods=["post"], url_path="batch-get", permission_classes=[AllowAny])
+    def batch_get(self, request):
+        """
+        WHERE <lookup> IN (...) over typed values, or
+        (a = ... AND b = ...) OR (a = ... AND b = ...) ... for composite ids.
+        """
+        ids = parse_batch_ids(request, self.batch_get_limit)
+        queryset = self.get_queryset()
+        names = None
+        wanted = {}
+        for pk in ids:
+            try:
+                filters = self.get_batch_filters(pk)
+                if names is None:
+                    names = sorted(filters)
+                    fields = [queryset.model._meta.get_field(name) for name in names]
+                key = typed_key(fields, [filters[name] for name in names])
+            except ParseError as e:
+                raise ParseError(f"{pk}: {e.detail}")
+            except ValueError as e:
+                raise ParseError(f"{pk}: {e}")
+            wanted.setdefault(key, []).append(pk)
+
+        results = {}
+        if ids:
+            if len(names) == 1:
+                queryset = queryset.filter(**{f"{names[0]}__in": [key[0] for key in wanted]})
+            else:
+                queryset = queryset.filter(reduce(operator.or_, (Q(**dict(zip(names, key))) for key in wanted)))
+            for obj in queryset:
+                pks = [pk for pk in wanted.get(tuple(getattr(obj, name) for name in names), []) if pk not in results]
+                if pks:
+                    data = self.get_serializer(obj).data
+                    for pk in pks:
+                        results[pk] = data
+
+        return Response({
+            "results": results,
+            "missing": [pk for pk in ids if pk not in results],
+        })
+
+# ------------------------------------------------------------
+# Raw-SQL read-only viewsets (to avoid 'id' expectation)
+# ------------------------------------------------------------
+def export_chunk(fmt, columns, rows, first):
+    """
+    One batch of export rows as CSV (header before the first batch) or NDJSON.
+    """
+    if fmt == "csv":
+        return csv_lines(rows, header=columns if first else None)
+    return ndjson_lines(columns, rows)
+
 
 class RawReadOnlyViewSet(viewsets.ViewSet):
     """
     Generic read-only ViewSet using raw SQL to avoid Django expecting 'id' PK.
-    Subclasses must set `table_name` and implement parse_pk_parts(parts) -> (where_sql, params).
+    Subclasses must set `table_name` and `key_columns` and implement
+    parse_pk_parts(parts) -> (where_sql, params).
     Provides:
-      - list(self, request)
+      - list(self, request)             keyset-paginated by key_columns (?cursor=, ?page_size=),
+                                        or ranked search over search_fields (?q=);
+                                        ?<filter_field>=<value> narrows either
       - retrieve(self, request, pk)
+      - export(self, request)           full-table stream (?format=ndjson|csv)
+    Every read takes ?fields= / ?exclude= (api/projection.py).
     """
     permission_classes = [ReadOnlyOrAdmin]
     table_name: str = None
+    # columns parse_pk_parts() filters on, in order; also the keyset pagination order
+    key_columns: tuple = ()
+    # text columns ?q= matches on (trigram-indexed by `manage.py create_search_indexes`)
+    search_fields: tuple = ()
+    search_limit = 50
+    # columns list()/export() accept as exact-match query params (?grade=...)
+    filter_fields: tuple = ()
+    # page over whole key groups instead of rows (for viewsets that merge rows per key)
+    list_group_keys = False
+    # key_columns are unique (a primary key): keyset pages need no row-id tiebreak
+    unique_key = False
     safety_limit = 1000
+    # rows per server-side cursor fetch when streaming /export/
+    export_batch_size = 2000
+    # the page / rows query; ETags come from the cache versions
+    query_budget = 1
     # ensure router accepts arbitrary lookup values (keeps parity with other viewsets)
     lookup_value_regex = ".+"
+    # () -> bool for tables created outside the migrations: 404 until they exist
+    table_installed = None
+    table_missing_detail = "Not available yet"
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.check_table_installed()
+
+    def check_table_installed(self):
+        if self.table_installed is not None and not self.table_installed():
+            raise NotFound(self.table_missing_detail)
+
+    @classmethod
+    def key_fields(cls):
+        """
+        Model fields of key_columns (from the unmanaged model over table_name),
+        None where there is none.
+        """
+        model = next((m for m in apps.get_app_config("api").get_models() if m._meta.db_table == cls.table_name), None)
+        fields = {f.column: f for f in model._meta.concrete_fields} if model else {}
+        return [fields.get(column) for column in cls.key_columns]
+
+    def get_paginator(self, group_keys=False):
+        return RawKeysetPagination(
+            self.key_columns, max_page_size=self.safety_limit, group_keys=group_keys, unique_key=self.unique_key,
+            key_fields=self.key_fields(),
+        )
+
+    def get_list_filter(self, request):
+        """
+        Extra WHERE clause for list()/export() -> (where_sql or None, params):
+        equality on the filter_fields present in the query string, ANDed with
+        the ?q= search.
+        """
+        conditions, params = [], []
+        for field in self.filter_fields:
+            value = request.query_params.get(field)
+            if value is not None:
+                conditions.append(f"{field} = %s")
+                params.append(value)
+
+        q = request.query_params.get("q")
+        if q:
+            if not self.search_fields:
+                raise ParseError("Search (?q=) is not supported on this resource")
+            search_sql, search_params = search_filter(self.search_fields, q)
+            conditions.append(search_sql)
+            params.extend(search_params)
+
+        if not conditions:
+            return None, []
+        return " AND ".join(conditions), params
+
+    def transform_rows(self, rows):
+        """
+        Hook to reshape the rows of a list page / search result (FA groups them).
+        """
+        return rows
+
+    @property
+    def required_columns(self):
+        """
+        Columns a ?fields= query selects besides the requested ones (keyset
+        positions, batch-get matching); project() drops them again.
+        """
+        return self.key_columns
+
+    @cached_property
+    def projection(self):
+        """
+        The ?fields= / ?exclude= projection of this request, None for whole rows.
+        """
+        return api_projection.from_request(getattr(self, "request", None), self.table_name, self.required_columns)
+
+    def select_list(self, required=True):
+        return self.projection.select_sql(required) if self.projection else "*"
+
+    def project(self, data):
+        return self.projection.apply(data) if self.projection else data
+
+    def output_rows(self, rows):
+        """
+        transform_rows(), trimmed to the requested fields.
+        """
+        return self.project(self.transform_rows(rows))
 
     def list(self, request):
         if not self.table_name:
             return Response({"detail": "table_name not configured"}, status=500)
 
         q = request.query_params.get("q")
-        sql = f"SELECT * FROM {self.table_name}"
-        params = []
-
         if q:
-            # permissive text search; no guarantee that columns exist on every table but this is graceful.
-            sql += " WHERE (CAST(enrollment_id AS TEXT) ILIKE %s OR CAST(subject AS TEXT) ILIKE %s)"
-            params = [f"%{q}%", f"%{q}%"]
+            return self.search(request, q)
+        where_sql, params = self.get_list_filter(request)
+        paginator = self.get_paginator(group_keys=self.list_group_keys)
+        return self.paginated(request, paginator, where_sql, params, self.output_rows)
 
-        sql += f" LIMIT {self.safety_limit}"
-        with connection.cursor() as cur:
-            cur.execute(sql, params)
-            rows = dictfetchall(cur)
-        return Response(rows)
+    def search(self, request, q):
+        """
+        Ranked ?q= search over search_fields, bounded by search_limit
+        (?page_size= may lower it). Not cursor-paginated: best matches only.
+        """
+        sql, params = self.search_query(request, q)
+
+        def build():
+            with connection.cursor() as cur:
+                cur.execute(sql, params)
+                rows = dictfetchall(cur)
+            return Response({"next": None, "previous": None, "results": self.output_rows(rows)})
+
+        return conditional_response(request, api_cache.version_etag(request, self.table_name), build)
+
+    def search_query(self, request, q):
+        """
+        (sql, params) of the ?q= search (shared with the async views, api/aio.py).
+        """
+        where_sql, params = self.get_list_filter(request)
+        order_sql, order_params = search_order(self.search_fields, q, self.key_columns)
+        try:
+            limit = min(int(request.query_params.get("page_size", self.search_limit)), self.search_limit)
+        except ValueError:
+            limit = self.search_limit
+        sql = (
+            f"SELECT {self.select_list()} FROM {self.table_name} "
+            f"WHERE {where_sql} ORDER BY {order_sql} LIMIT {max(limit, 1)}"
+        )
+        return sql, params + order_params
+
+    def paginated(self, request, paginator, where_sql, params, transform):
+        """
+        Run one keyset page (ETag'd with the table's cache version) and
+        render transform(rows) as the paginated response.
+        """
+        sql, page_params = paginator.prepare(request, self.table_name, where_sql, params, self.select_list())
+
+        def build():
+            with connection.cursor() as cur:
+                cur.execute(sql, page_params)
+                rows = paginator.finish(dictfetchall(cur))
+            return paginator.get_paginated_response(transform(rows))
+
+        return conditional_response(request, api_cache.version_etag(request, self.table_name), build)
+
+    @action(detail=False, methods=["get"], url_path="export", renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """
+        Stream every (optionally ?q= filtered) row of the table as NDJSON or CSV.
+        Rows are read through a server-side cursor in export_batch_size batches,
+        so worker memory stays flat regardless of table size. Raw rows are
+        exported as stored (FA rows are not grouped).
+        """
+        if not self.table_name:
+            return Response({"detail": "table_name not configured"}, status=500)
+
+        renderer = request.accepted_renderer
+        batches = iter_batches(*self.export_query(request), batch_size=self.export_batch_size)
+
+        def stream():
+            for i, (columns, rows) in enumerate(batches):
+                yield export_chunk(renderer.format, columns, rows, first=i == 0)
+
+        return self.export_response(renderer, stream())
+
+    def export_query(self, request):
+        where_sql, params = self.get_list_filter(request)
+        sql = f"SELECT {self.select_list(required=False)} FROM {self.table_name}"
+        if where_sql:
+            sql += f" WHERE {where_sql}"
+        return sql, params
+
+    def export_response(self, renderer, content):
+        # `content`: export_chunk() strings, from a sync or (ASGI) async iterator
+        response = StreamingHttpResponse(content, content_type=f"{renderer.media_type}; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{self.table_name}.{renderer.format}"'
+        return response
+
+    # read-only lookup sent as POST (ids don't fit in a URL); same access as GET
+    @action(detail=False, methods=["post"], url_path="batch-get", permission_classes=[AllowAny])
+    def batch_get(self, request):
+        """
+        Resolve many '~'-encoded composite ids in one query:
+          WHERE (key_columns) IN ((...), (...), ...)
+        Each id is validated with parse_pk_parts(), whose params are in
+        key_columns order. Returns {"results": {<id>: <row>}, "missing": [...]}.
+        """
+        if not self.table_name:
+            return Response({"detail": "table_name not configured"}, status=500)
+
+        ids = parse_batch_ids(request, self.safety_limit)
+        fields = self.key_fields()
+        wanted = {}
+        for pk in ids:
+            parts = [unquote(p) for p in pk.split("~")]
+            try:
+                _, key_params = self.parse_pk_parts(parts)
+                key = typed_key(fields, key_params)
+            except ValueError as e:
+                return Response({"detail": f"{pk}: {e}"}, status=400)
+            wanted.setdefault(key, []).append(pk)
+
+        results = {}
+        if wanted:
+            cols = ", ".join(self.key_columns)
+            row_placeholder = "(" + ", ".join(["%s"] * len(self.key_columns)) + ")"
+            sql = (
+                f"SELECT {self.select_list()} FROM {self.table_name} "
+                f"WHERE ({cols}) IN ({', '.join([row_placeholder] * len(wanted))})"
+            )
+            with connection.cursor() as cur:
+                cur.execute(sql, [value for key in wanted for value in key])
+                rows = dictfetchall(cur)
+            for row in rows:
+                # keep retrieve()'s "first matching row" semantics
+                try:
+                    key = typed_key(fields, [row[c] for c in self.key_columns])
+                except ValueError:
+                    continue
+                for pk in wanted.get(key, []):
+                    results.setdefault(pk, self.project(row))
+
+        return Response({
+            "results": results,
+            "missing": [pk for pk in ids if pk not in results],
+        })
+
+    def cached(self, request, enrollment_id, build):
+        """
+        Serve build() through the per-enrollment response cache (api/cache.py),
+        keyed by table, enrollment_id and the full request path, and ETag'd
+        with the enrollment's cache version.
+        """
+        return api_cache.cached_response(request, self.table_name, enrollment_id, build)
 
     def retrieve(self, request, pk=None):
         if not self.table_name:
@@ -103,48 +571,73 @@ class RawReadOnlyViewSet(viewsets.ViewSet):
         if pk is None:
             return Response({"detail": "No id provided"}, status=400)
 
+        try:
+            enrollment_id, query = self.retrieve_plan(pk)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+        return self.cached(request, enrollment_id, lambda: self.run_query(*query))
+
+    def retrieve_plan(self, pk):
+        """
+        What retrieve(pk) reads -> (enrollment_id, query): the cache / ETag
+        scope plus the (sql, params, finish) query, where finish(rows)
+        returns the response data or None for a 404.
+        Raises ValueError on a malformed id.
+        """
         # decode parts separated by "~"
         parts = [unquote(p) for p in pk.split("~")]
 
         # ---- Special case: single-part pk -> treat as enrollment_id list request ----
         if len(parts) == 1:
-            # if subclass defines list_by_enrollment, call it (returns multiple rows)
             enrollment_id = parts[0]
             if hasattr(self, "list_by_enrollment"):
-                return self.list_by_enrollment(request, enrollment_id=enrollment_id)
-
-            # fallback: run simple WHERE on enrollment_id and return first row (existing semantics)
-            where_sql = "enrollment_id = %s"
-            params = [enrollment_id]
-            sql = f"SELECT * FROM {self.table_name} WHERE {where_sql} LIMIT 1"
-            with connection.cursor() as cur:
-                cur.execute(sql, params)
-                rows = dictfetchall(cur)
-            if not rows:
-                return Response({"detail": "Not found"}, status=404)
-            return Response(rows)
+                # every row of the enrollment (what list_by_enrollment returns)
+                return enrollment_id, self.enrollment_query(enrollment_id)
+            # fallback: first row of the enrollment (existing semantics)
+            sql = f"SELECT {self.select_list()} FROM {self.table_name} WHERE enrollment_id = %s LIMIT 1"
+            return enrollment_id, (sql, [enrollment_id], self._rows_or_none)
 
         # ---- 3-part or other (expected composite) ----
-        try:
-            where_sql, params = self.parse_pk_parts(parts)
-        except ValueError as e:
-            return Response({"detail": str(e)}, status=400)
-
+        where_sql, params = self.parse_pk_parts(parts)
         # If parse_pk_parts returns a WHERE that can select multiple rows but the
         # intent was returning a single record we keep old LIMIT 1 behavior.
-        sql = f"SELECT * FROM {self.table_name} WHERE {where_sql} LIMIT 1"
-        with connection.cursor() as cur:
+        sql = f"SELECT {self.select_list()} FROM {self.table_name} WHERE {where_sql} LIMIT 1"
+        # key columns start with enrollment_id for every table except the grade boundaries
+        enrollment_id = parts[0] if "enrollment_id" in self.key_columns[:1] else None
+        return enrollment_id, (sql, params, self._rows_or_none)
+
+    def enrollment_query(self, enrollment_id):
+        """
+        (sql, params, finish) of every row of one enrollment, bounded by
+        safety_limit; list_by_enrollment() and the dashboard read this.
+        """
+        sql = f"SELECT {self.select_list()} FROM {self.table_name} WHERE enrollment_id = %s LIMIT {self.safety_limit}"
+        return sql, [enrollment_id], lambda rows: rows
+
+    @staticmethod
+    def _rows_or_none(rows):
+        return rows or None
+
+    def run_query(self, sql, params, finish):
+        """
+        Run one (sql, params, finish) query; finish(rows) -> data, None -> 404.
+        The retrieve / by-enrollment texts are fixed per viewset, so they run
+        as prepared statements (api/statements.py); projected ones vary with
+        ?fields= and don't.
+        """
+        with cursor(prepared=self.projection is None) as cur:
             cur.execute(sql, params)
             rows = dictfetchall(cur)
-        if not rows:
+        data = self.project(finish(rows))
+        if data is None:
             return Response({"detail": "Not found"}, status=404)
-        return Response(rows)
+        return Response(data)
 
 
 # ------------------------------------------------------------
 # Enrollment (unchanged; uses ORM and has enrollment_id lookup)
 # ------------------------------------------------------------
-class EnrollmentViewSet(viewsets.ModelViewSet):
+class EnrollmentViewSet(FieldsMixin, ConditionalGetMixin, FastReadMixin, BatchGetMixin, viewsets.ModelViewSet):
     lookup_value_regex = ".+"
     queryset = models.Enrollments.objects.all()
     serializer_class = serializers.EnrollmentSerializer
@@ -154,6 +647,8 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
     search_fields = ["enrollment_id", "user_email", "user_name", "academic_year", "grade", "school"]
     ordering_fields = "__all__"
     lookup_field = "enrollment_id"
+    # count + page; writes aren't budgeted
+    query_budget = {"list": 2, "retrieve": 1, "batch_get": 1}
 
 # ------------------------------------------------------------
 # Subjects: use RawReadOnlyViewSet to avoid missing 'id' DB errors
@@ -162,6 +657,9 @@ class EnrollmentViewSet(viewsets.ModelViewSet):
 # ------------------------------------------------------------
 class SubjectViewSet(RawReadOnlyViewSet):
     table_name = "subjects"
+    key_columns = ("enrollment_id", "subject")
+    search_fields = ("enrollment_id", "subject")
+
     def parse_pk_parts(self, parts):
         if len(parts) != 2:
             raise ValueError("Expected '<enrollment_id>~<subject>'")
@@ -175,6 +673,9 @@ class SubjectViewSet(RawReadOnlyViewSet):
 # ------------------------------------------------------------
 class AssessmentEOLViewSet(RawReadOnlyViewSet):
     table_name = "assessments_eol"
+    key_columns = ("enrollment_id", "subject")
+    search_fields = ("enrollment_id", "subject")
+
     def parse_pk_parts(self, parts):
         if len(parts) != 2:
             raise ValueError("Expected '<enrollment_id>~<subject>'")
@@ -189,6 +690,11 @@ class AssessmentEOLViewSet(RawReadOnlyViewSet):
 # ------------------------------------------------------------
 class AssessmentFAViewSet(RawReadOnlyViewSet):
     table_name = "assessments_fa"
+    key_columns = ("enrollment_id", "subject", "evaluation_criteria")
+    search_fields = ("enrollment_id", "subject")
+    # page over whole (enrollment_id, subject, evaluation_criteria) groups so a
+    # group is never split across two pages
+    list_group_keys = True
 
     def parse_pk_parts(self, parts):
         if len(parts) != 3:
@@ -199,6 +705,7 @@ class AssessmentFAViewSet(RawReadOnlyViewSet):
             [enrollment_id, subject, evaluation_criteria],
         )
 
+    @span("group")
     def _group_fa_rows(self, rows):
         grouped = {}
 
@@ -230,16 +737,16 @@ class AssessmentFAViewSet(RawReadOnlyViewSet):
                     "max_score_old": [],
                 }
 
-            grouped[key]["month"].extend(row["month"])
-            grouped[key]["task_name"].extend(row["task_name"])
-            grouped[key]["teachers"].extend(row["teachers"])
+            grouped[key]["month"].extend(as_list(row["month"]))
+            grouped[key]["task_name"].extend(as_list(row["task_name"]))
+            grouped[key]["teachers"].extend(as_list(row["teachers"]))
 
             grouped[key]["student_score"].extend(
-                [float(x) if x not in (None, "") else None for x in row["student_score"]]
+                [float(x) if x not in (None, "") else None for x in as_list(row["student_score"])]
             )
 
             grouped[key]["max_score_old"].extend(
-                [float(x) if x not in (None, "") else None for x in row["max_score_old"]]
+                [float(x) if x not in (None, "") else None for x in as_list(row["max_score_old"])]
             )
 
         # CLEAN + FIX COUNTS
@@ -270,53 +777,141 @@ class AssessmentFAViewSet(RawReadOnlyViewSet):
             obj["student_score"] = [u[3] for u in unique]
             obj["max_score_old"] = [u[4] for u in unique]
 
-            # ------------------------------------------
-            # RECALCULATE ALL COUNTS BASED ON CLEAN TASKS
-            # ------------------------------------------
-            t1_count = len(obj["task_name"])
+            self._fix_fa_counts(obj)
+            cleaned.append(obj)
+
+        return cleaned
 
-            if obj["evaluation_criteria"] == "SDL":
-                obj["count_sdl_t1"] = t1_count
-                obj["count_sdl_t2"] = 0
-                obj["count_sdl_t3"] = 0
+    @staticmethod
+    def _fix_fa_counts(obj):
+        # ------------------------------------------
+        # RECALCULATE ALL COUNTS BASED ON CLEAN TASKS
+        # ------------------------------------------
+        t1_count = len(obj["task_name"])
 
-            elif obj["evaluation_criteria"] == "WT":
-                obj["count_wt_t1"] = t1_count
-                obj["count_wt_t2"] = 0
-                obj["count_wt_t3"] = 0
+        if obj["evaluation_criteria"] == "SDL":
+            obj["count_sdl_t1"] = t1_count
+            obj["count_sdl_t2"] = 0
+            obj["count_sdl_t3"] = 0
 
-            elif obj["evaluation_criteria"] == "FA":
-                obj["count_fawriting_t1"] = t1_count
-                obj["count_fawriting_t2"] = 0
-                obj["count_fawriting_t3"] = 0
+        elif obj["evaluation_criteria"] == "WT":
+            obj["count_wt_t1"] = t1_count
+            obj["count_wt_t2"] = 0
+            obj["count_wt_t3"] = 0
 
-            cleaned.append(obj)
+        elif obj["evaluation_criteria"] == "FA":
+            obj["count_fawriting_t1"] = t1_count
+            obj["count_fawriting_t2"] = 0
+            obj["count_fawriting_t3"] = 0
 
-        return cleaned
+        return obj
 
-    def list(self, request):
-        sql = f"SELECT * FROM {self.table_name} LIMIT {self.safety_limit}"
-        with connection.cursor() as cur:
-            cur.execute(sql)
-            rows = dictfetchall(cur)
-        return Response(self._group_fa_rows(rows))
+    # Postgres-side equivalent of _group_fa_rows(): unnest the per-task arrays
+    # (WITH ORDINALITY, truncated to the shortest array like zip()), drop
+    # duplicate tasks keeping the first occurrence, and re-aggregate per key
+    # ordered by month. Non-array columns come from the first row of each key.
+    FA_GROUPED_SQL = """
+        WITH src AS (
+            SELECT ctid AS _rid, {columns}
+            FROM {table}
+            WHERE {where}
+            LIMIT {limit}
+        ),
+        tasks AS (
+            SELECT DISTINCT ON (s.enrollment_id, s.subject, s.evaluation_criteria,
+                                t.month, t.task_name, t.teachers, t.student_score, t.max_score_old)
+                   s.enrollment_id, s.subject, s.evaluation_criteria,
+                   t.month, t.task_name, t.teachers, t.student_score, t.max_score_old,
+                   s._rid, t.ord
+            FROM src s
+            CROSS JOIN LATERAL (
+                SELECT u.month, u.task_name, u.teachers,
+                       NULLIF(u.student_score::text, '')::float8 AS student_score,
+                       NULLIF(u.max_score_old::text, '')::float8 AS max_score_old,
+                       u.ord
+                FROM unnest(s.month, s.task_name, s.teachers, s.student_score, s.max_score_old)
+                     WITH ORDINALITY AS u(month, task_name, teachers, student_score, max_score_old, ord)
+                WHERE u.ord <= LEAST(
+                    COALESCE(cardinality(s.month), 0), COALESCE(cardinality(s.task_name), 0),
+                    COALESCE(cardinality(s.teachers), 0), COALESCE(cardinality(s.student_score), 0),
+                    COALESCE(cardinality(s.max_score_old), 0)
+                )
+            ) t
+            ORDER BY s.enrollment_id, s.subject, s.evaluation_criteria,
+                     t.month, t.task_name, t.teachers, t.student_score, t.max_score_old,
+                     s._rid, t.ord
+        ),
+        agg AS (
+            SELECT enrollment_id, subject, evaluation_criteria,
+                   array_agg(month ORDER BY month::text COLLATE "C", _rid, ord) AS _g_month,
+                   array_agg(task_name ORDER BY month::text COLLATE "C", _rid, ord) AS _g_task_name,
+                   array_agg(teachers ORDER BY month::text COLLATE "C", _rid, ord) AS _g_teachers,
+                   array_agg(student_score ORDER BY month::text COLLATE "C", _rid, ord) AS _g_student_score,
+                   array_agg(max_score_old ORDER BY month::text COLLATE "C", _rid, ord) AS _g_max_score_old
+            FROM tasks
+            GROUP BY enrollment_id, subject, evaluation_criteria
+        ),
+        firsts AS (
+            SELECT DISTINCT ON (enrollment_id, subject, evaluation_criteria) *
+            FROM src
+            ORDER BY enrollment_id, subject, evaluation_criteria, _rid
+        )
+        SELECT f.*, a._g_month, a._g_task_name, a._g_teachers, a._g_student_score, a._g_max_score_old
+        FROM firsts f
+        LEFT JOIN agg a
+          ON a.enrollment_id IS NOT DISTINCT FROM f.enrollment_id
+         AND a.subject IS NOT DISTINCT FROM f.subject
+         AND a.evaluation_criteria IS NOT DISTINCT FROM f.evaluation_criteria
+        ORDER BY f._rid
+    """
 
-    def list_by_enrollment(self, request, enrollment_id=None):
-        if not enrollment_id:
-            return Response({"detail": "No enrollment_id provided"}, status=400)
+    FA_ARRAY_COLUMNS = ("month", "task_name", "teachers", "student_score", "max_score_old")
+
+    @property
+    def required_columns(self):
+        # grouping reads the task arrays of every row
+        return self.key_columns + self.FA_ARRAY_COLUMNS
 
-        sql = f"""
-            SELECT *
-            FROM {self.table_name}
-            WHERE enrollment_id = %s
-            LIMIT {self.safety_limit}
+    def grouped_query(self, where_sql, params):
         """
+        Build the query for FA rows matching `where_sql`, grouped per
+        (enrollment_id, subject, evaluation_criteria).
+        Returns (sql, params, finish) where finish(rows) produces the grouped
+        objects. Postgres does the grouping in SQL; other backends (SQLite in
+        dev) fall back to _group_fa_rows().
+        """
+        if connection.vendor != "postgresql":
+            sql = f"SELECT {self.select_list()} FROM {self.table_name} WHERE {where_sql} LIMIT {self.safety_limit}"
+            return sql, params, self._group_fa_rows
 
-        with connection.cursor() as cur:
-            cur.execute(sql, [enrollment_id])
-            rows = dictfetchall(cur)
+        sql = self.FA_GROUPED_SQL.format(
+            table=self.table_name, columns=self.select_list(), where=where_sql, limit=self.safety_limit
+        )
+        return sql, params, self._finish_sql_grouped
+
+    def enrollment_query(self, enrollment_id):
+        return self.grouped_query("enrollment_id = %s", [enrollment_id])
+
+    @span("group")
+    def _finish_sql_grouped(self, rows):
+        for obj in rows:
+            obj.pop("_rid", None)
+            # re-append the arrays last so key order matches _group_fa_rows()
+            for col in self.FA_ARRAY_COLUMNS:
+                obj.pop(col, None)
+            for col in self.FA_ARRAY_COLUMNS:
+                obj[col] = obj.pop(f"_g_{col}", None) or []
+            self._fix_fa_counts(obj)
+        return rows
+
+    def transform_rows(self, rows):
+        return self._group_fa_rows(rows)
+
+    def list_by_enrollment(self, request, enrollment_id=None):
+        if not enrollment_id:
+            return Response({"detail": "No enrollment_id provided"}, status=400)
 
-        return Response(self._group_fa_rows(rows))
+        return self.cached(request, enrollment_id, lambda: self.run_query(*self.enrollment_query(enrollment_id)))
 
 # ------------------------------------------------------------
 # Assessments SA (read-only via raw SQL)
@@ -325,6 +920,8 @@ class AssessmentFAViewSet(RawReadOnlyViewSet):
 # ------------------------------------------------------------
 class AssessmentSAViewSet(RawReadOnlyViewSet):
     table_name = "assessments_sa"
+    key_columns = ("enrollment_id", "subject", "evaluation_criteria")
+    search_fields = ("enrollment_id", "subject")
 
     def parse_pk_parts(self, parts):
         if len(parts) != 3:
@@ -340,17 +937,15 @@ class AssessmentSAViewSet(RawReadOnlyViewSet):
     def list_by_enrollment(self, request, enrollment_id=None):
         if not enrollment_id:
             return Response({"detail": "No enrollment_id provided"}, status=400)
-        sql = f"SELECT * FROM {self.table_name} WHERE enrollment_id = %s LIMIT {self.safety_limit}"
-        with connection.cursor() as cur:
-            cur.execute(sql, [enrollment_id])
-            rows = dictfetchall(cur)
-        return Response(rows)
+        return self.cached(request, enrollment_id, lambda: self.run_query(*self.enrollment_query(enrollment_id)))
 
 # ------------------------------------------------------------
 # AssessmentWeights (unchanged ORM usage)
 # composite primary lookup by academic_year~grade~term~assessment_type
 # ------------------------------------------------------------
-class AssessmentWeightsViewSet(CompositeLookupMixin, viewsets.ModelViewSet):
+class AssessmentWeightsViewSet(
+    FieldsMixin, CompositeLookupMixin, ConditionalGetMixin, FastReadMixin, BatchGetMixin, viewsets.ModelViewSet
+):
     """
     Detail id format:
       <academic_year>~<grade>~<term>~<assessment_type>
@@ -363,6 +958,7 @@ class AssessmentWeightsViewSet(CompositeLookupMixin, viewsets.ModelViewSet):
     filterset_fields = ["academic_year", "grade", "term", "assessment_type"]
     search_fields = ["academic_year", "grade", "term", "assessment_type"]
     ordering_fields = "__all__"
+    query_budget = {"list": 2, "retrieve": 1, "batch_get": 1}
 
     def parse_pk(self, pk: str) -> dict:
         parts = [unquote(p) for p in pk.split(self.pk_delim)]
@@ -380,7 +976,7 @@ class AssessmentWeightsViewSet(CompositeLookupMixin, viewsets.ModelViewSet):
 # ------------------------------------------------------------
 # UsersTable + MypGradeBoundaries (Myp handled via raw SQL if table has no id)
 # ------------------------------------------------------------
-class UsersTableViewSet(viewsets.ModelViewSet):
+class UsersTableViewSet(FieldsMixin, FastReadMixin, viewsets.ModelViewSet):
     queryset = models.UsersTable.objects.all()
     serializer_class = serializers.UsersTableSerializer
     permission_classes = [ReadOnlyOrAdmin]
@@ -392,6 +988,8 @@ class UsersTableViewSet(viewsets.ModelViewSet):
 # If myp_grade_boundaries has no 'id' column, use raw viewset; otherwise you can switch back to ModelViewSet.
 class MypGradeBoundariesViewSet(RawReadOnlyViewSet):
     table_name = "myp_grade_boundaries"
+    key_columns = ("grade", "boundary_level")
+
     def parse_pk_parts(self, parts):
         if len(parts) != 2:
             raise ValueError("Expected '<grade>~<boundary_level>'")
@@ -401,42 +999,47 @@ class MypGradeBoundariesViewSet(RawReadOnlyViewSet):
 # ------------------------------------------------------------
 # Lms users + token blacklist + dp grade boundaries (unchanged)
 # ------------------------------------------------------------
-class LmsUsersUserViewSet(viewsets.ReadOnlyModelViewSet):
+class LmsUsersUserViewSet(FieldsMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.LmsUsersUser.objects.all()
     serializer_class = serializers.LmsUsersUserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = DefaultPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['email', 'username', 'first_name', 'last_name', 'role']
     filterset_fields = ['email', 'role']
 
-class LmsUsersStaffpreapprovedViewSet(viewsets.ReadOnlyModelViewSet):
+class LmsUsersStaffpreapprovedViewSet(FieldsMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.LmsUsersStaffpreapproved.objects.all()
     serializer_class = serializers.LmsUsersStaffpreapprovedSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = DefaultPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['email', 'invite_token', 'name']
     filterset_fields = ['email', 'role']
 
-class TokenBlacklistOutstandingtokenViewSet(viewsets.ReadOnlyModelViewSet):
+class TokenBlacklistOutstandingtokenViewSet(FieldsMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.TokenBlacklistOutstandingtoken.objects.all()
     serializer_class = serializers.TokenBlacklistOutstandingtokenSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = DefaultPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['user_id', 'jti']
     filterset_fields = ['user_id']
 
-class TokenBlacklistBlacklistedtokenViewSet(viewsets.ReadOnlyModelViewSet):
+class TokenBlacklistBlacklistedtokenViewSet(FieldsMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.TokenBlacklistBlacklistedtoken.objects.all()
     serializer_class = serializers.TokenBlacklistBlacklistedtokenSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = DefaultPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['token_id']
     filterset_fields = ['token_id']
 
-class DpGradeBoundariesViewSet(viewsets.ReadOnlyModelViewSet):
+class DpGradeBoundariesViewSet(FieldsMixin, FastReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = models.DpGradeBoundaries.objects.all()
     serializer_class = serializers.DpGradeBoundariesSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = DefaultPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['subject', 'level', 'grade']
     filterset_fields = ['subject', 'level', 'grade']
@@ -444,6 +1047,8 @@ class DpGradeBoundariesViewSet(viewsets.ReadOnlyModelViewSet):
 
 class AssessmentNonAcademicViewSet(RawReadOnlyViewSet):
     table_name = "assessments_non_academic"
+    key_columns = ("enrollment_id", "subject", "task_name")
+    search_fields = ("enrollment_id", "subject", "task_name")
 
     def parse_pk_parts(self, parts):
         if len(parts) != 3:
@@ -459,15 +1064,297 @@ class AssessmentNonAcademicViewSet(RawReadOnlyViewSet):
         if not enrollment_id:
             return Response({"detail": "No enrollment_id provided"}, status=400)
 
-        sql = f"""
-            SELECT *
-            FROM {self.table_name}
-            WHERE enrollment_id = %s
-            LIMIT {self.safety_limit}
-        """
+        return self.cached(request, enrollment_id, lambda: self.run_query(*self.enrollment_query(enrollment_id)))
+
+
+# ------------------------------------------------------------
+# Student summaries (landing page), read from the student_summary table
+# maintained by `manage.py refresh_student_summary` (api/summary.py)
+# URL: /api/student-summaries/?academic_year=&grade=&school=
+# Key format for retrieve: <enrollment_id>
+# ------------------------------------------------------------
+class StudentSummaryViewSet(RawReadOnlyViewSet):
+    table_name = summary.TABLE
+    key_columns = ("enrollment_id",)
+    unique_key = True
+    filter_fields = ("academic_year", "grade", "school")
+    search_fields = ("enrollment_id", "user_name")
+    table_installed = staticmethod(summary.installed)
+    table_missing_detail = "Student summaries have not been built yet (manage.py refresh_student_summary)"
+
+    def parse_pk_parts(self, parts):
+        if len(parts) != 1:
+            raise ValueError("Expected '<enrollment_id>'")
+        return "enrollment_id = %s", [parts[0]]
+
+    def transform_rows(self, rows):
+        for row in rows:
+            # jsonb / text column; raw cursors hand back the JSON text
+            if isinstance(row.get("subjects"), str):
+                row["subjects"] = json.loads(row["subjects"])
+            row.pop("fingerprint", None)
+        return rows
+
+    def retrieve_plan(self, pk):
+        # one object per enrollment, not a list
+        enrollment_id = unquote(pk)
+        sql = f"SELECT {self.select_list()} FROM {self.table_name} WHERE enrollment_id = %s"
+        return enrollment_id, (sql, [enrollment_id], self._first)
+
+    def _first(self, rows):
+        return self.transform_rows(rows)[0] if rows else None
+
+
+# ------------------------------------------------------------
+# Bulk grading against the in-process boundary index (api/grading.py)
+# URL: POST /api/grading/lookup/ {"items": [[grade, score], [subject, level, score], ...]}
+# ------------------------------------------------------------
+# 0 once the index is warm; a rebuild reads both boundary tables
+@query_budget(2)
+@api_view(["POST"])
+@permission_classes([AllowAny])  # read-only lookup sent as POST
+def grading_lookup(request):
+    """
+    Map percentages to MYP levels ([grade, score]) or DP grades
+    ([subject, level, score]). Response: {"grades": [...]} in input order,
+    null for unknown grades / subjects and scores outside the table.
+    """
+    data = request.data
+    items = data.get("items") if isinstance(data, dict) else data
+    limit = settings.GRADING_LOOKUP_LIMIT
+    if not isinstance(items, list):
+        raise ParseError('Expected {"items": [[grade, score] | [subject, level, score], ...]}')
+    if len(items) > limit:
+        raise ParseError(f"At most {limit} items per lookup")
+    try:
+        grades = grading.lookup_many(items)
+    except ValueError as e:
+        raise ParseError(str(e))
+    return Response({"grades": grades})
+
+
+# ------------------------------------------------------------
+# Weighted term percentages for one cohort, computed on demand (api/terms.py)
+# URL: /api/term-results/?academic_year=<year>&grade=<grade>
+# ------------------------------------------------------------
+# weights + tasks (FA and SA are read separately off Postgres)
+@query_budget(3)
+@api_view(["GET"])
+@permission_classes([ReadOnlyOrAdmin])
+def term_results(request):
+    """
+    Weighted T1..Tn and overall percentage of every student and subject of
+    one cohort, with the per-assessment-type percentages behind each term.
+    """
+    academic_year = request.query_params.get("academic_year")
+    grade = request.query_params.get("grade")
+    if not academic_year or not grade:
+        raise ParseError("Pass ?academic_year=<year>&grade=<grade>")
+    if terms.weight_grade(grade) is None:
+        raise ParseError("grade must be an integer")
+
+    results, weights = terms.compute_cohort(academic_year, grade)
+    weight_table = {}
+    for (term, kind), weight in sorted(weights.items()):
+        weight_table.setdefault(term, {})[kind] = weight
+
+    return Response({
+        "academic_year": academic_year,
+        "grade": grade,
+        "weights": weight_table,
+        "count": len(results),
+        "results": [r._asdict() for r in results],
+    })
+
+
+# ------------------------------------------------------------
+# Cohort distributions of subject percentages (api/analytics.py)
+# URL: /api/analytics/cohort/?academic_year=&grade=&school=&subject=&group_by=&bins=
+# ------------------------------------------------------------
+# one grouped query on a miss, none once cached
+@query_budget(1)
+@api_view(["GET"])
+@permission_classes([ReadOnlyOrAdmin])
+def cohort_analytics(request):
+    """
+    Count, mean, median, p10/p90, histogram and grade-band counts of the
+    current and predicted subject percentages, per cohort group.
+    """
+    params = request.query_params
+    filters = {name: params[name] for name in analytics.DIMENSIONS if params.get(name)}
+    if "group_by" in params:
+        group_by = list(dict.fromkeys(n.strip() for n in params["group_by"].split(",") if n.strip()))
+    else:
+        group_by = list(analytics.DIMENSIONS)
+    unknown = [name for name in group_by if name not in analytics.DIMENSIONS]
+    if unknown:
+        raise ParseError(f"Unknown group_by column(s): {', '.join(unknown)}")
+    try:
+        bins = int(params.get("bins", analytics.DEFAULT_BINS))
+    except ValueError:
+        raise ParseError("bins must be an integer")
+    if not 1 <= bins <= analytics.MAX_BINS:
+        raise ParseError(f"bins must be between 1 and {analytics.MAX_BINS}")
+
+    results = analytics.cohort_report(filters, group_by, bins)
+    data = {
+        "group_by": group_by,
+        "filters": filters,
+        "bin_edges": [round(100 * i / bins, 2) for i in range(bins + 1)],
+        "count": len(results),
+        "results": results,
+    }
+    return conditional_response(request, None, lambda: Response(data))
 
-        with connection.cursor() as cur:
-            cur.execute(sql, [enrollment_id])
-            rows = dictfetchall(cur)
 
-        return Response(rows)
+# ------------------------------------------------------------
+# Whole-table reloads through a staging table (api/ingest.py), admin only
+# URL: POST /api/ingest/<table>/  body: CSV / NDJSON, or a multipart "file"
+# ------------------------------------------------------------
+# no query budget: a reload runs a few statements per index of the table
+@api_view(["POST"])
+@permission_classes([IsAdminUser])
+def ingest_table(request, table):
+    """
+    Replace `table` with the uploaded rows (text/csv with a header line or
+    application/x-ndjson; ?allow_empty=true to accept no rows). The body is
+    streamed into COPY, validated and swapped in atomically.
+    """
+    if table not in ingest.TABLES:
+        raise NotFound(f"Unknown table {table!r}")
+    if request.content_type.startswith("multipart/"):
+        source = request.FILES.get("file")
+        if source is None:
+            raise ParseError('Send the rows as the "file" part')
+        fmt = ingest.format_for(source.name) or ingest.format_for(source.content_type)
+    else:
+        source = request.stream
+        fmt = ingest.format_for(request.content_type)
+    if source is None:
+        raise ParseError("Empty upload")
+    if fmt is None:
+        raise ParseError("Send text/csv or application/x-ndjson")
+
+    allow_empty = request.query_params.get("allow_empty", "").lower() in ("1", "true", "yes")
+    try:
+        result = ingest.ingest(table, source, fmt, allow_empty=allow_empty)
+    except ingest.IngestError as e:
+        raise ParseError(str(e))
+    return Response(result)
+
+
+# ------------------------------------------------------------
+# Changed keys of the captured tables (api/changes.py), for delta syncs
+# URL: /api/changes/?since=<token>|now&table=subjects,enrollments&limit=500
+# ------------------------------------------------------------
+# table check, horizon, page
+@query_budget(3)
+@api_view(["GET"])
+@permission_classes([ReadOnlyOrAdmin])
+def change_feed(request):
+    """
+    Composite keys changed after `since`, oldest first, with the token to
+    pass as the next `since`. 410 when the log no longer reaches back that far.
+    """
+    if not changes.installed():
+        raise NotFound("Change capture is not installed (manage.py change_log --install)")
+    params = request.query_params
+    tables = [name.strip() for name in params.get("table", "").split(",") if name.strip()]
+    unknown = [name for name in tables if name not in changes.KEYS]
+    if unknown:
+        raise ParseError(f"Unknown table(s): {', '.join(unknown)}")
+    try:
+        limit = int(params.get("limit", changes.DEFAULT_LIMIT))
+    except ValueError:
+        raise ParseError("limit must be an integer")
+    if not 1 <= limit <= changes.MAX_LIMIT:
+        raise ParseError(f"limit must be between 1 and {changes.MAX_LIMIT}")
+
+    since = params.get("since")
+    if since == "now":
+        return Response({"next": changes.head(), "has_more": False, "results": []})
+    try:
+        position = changes.parse_token(since) if since else changes.START
+    except ValueError as e:
+        raise ParseError(str(e))
+    try:
+        return Response(changes.page(position, tables, limit))
+    except changes.Expired as e:
+        return Response({"detail": str(e)}, status=410)
+
+
+# ------------------------------------------------------------
+# Student dashboard: every per-enrollment section in one request
+# URL: /api/students/<enrollment_id>/dashboard/?include=subjects,fa,...
+# ------------------------------------------------------------
+def _enrollment_rows(rows):
+    if not rows:
+        return None
+    row = rows[0]
+    # raw cursors skip the ORM's value conversion (e.g. JSONField decoding)
+    for field in models.Enrollments._meta.concrete_fields:
+        if hasattr(field, "from_db_value") and field.column in row:
+            row[field.column] = field.from_db_value(row[field.column], None, connection)
+    return serializers.EnrollmentSerializer(row).data
+
+# section name -> (viewset, how the rows are turned into the response)
+DASHBOARD_SECTIONS = {
+    "enrollment": (EnrollmentViewSet, _enrollment_rows),
+    "subjects": (SubjectViewSet, None),
+    "fa": (AssessmentFAViewSet, None),
+    "sa": (AssessmentSAViewSet, None),
+    "eol": (AssessmentEOLViewSet, None),
+    "non_academic": (AssessmentNonAcademicViewSet, None),
+}
+
+
+def _dashboard_query(name, enrollment_id):
+    """
+    (sql, params, finish) for one dashboard section: the raw tables reuse
+    their viewset's enrollment_query() (FA grouped, the others every row up
+    to safety_limit).
+    """
+    viewset, finish = DASHBOARD_SECTIONS[name]
+    if viewset is EnrollmentViewSet:
+        sql = f"SELECT * FROM {models.Enrollments._meta.db_table} WHERE enrollment_id = %s LIMIT 1"
+        return sql, [enrollment_id], finish
+    return viewset().enrollment_query(enrollment_id)
+
+
+@query_budget(len(DASHBOARD_SECTIONS))
+@api_view(["GET"])
+@permission_classes([ReadOnlyOrAdmin])
+def student_dashboard(request, enrollment_id=None):
+    """
+    Gather the enrollment, subjects, FA (grouped), SA, EOL and non-academic
+    data for one student. ?include=a,b limits the sections returned; an
+    unknown enrollment is a 404 whichever sections are asked for.
+    All section queries go to the DB as one pipelined batch of prepared
+    statements on Postgres.
+    """
+    include = request.query_params.get("include")
+    if include:
+        sections = [s.strip() for s in include.split(",") if s.strip()]
+        unknown = [s for s in sections if s not in DASHBOARD_SECTIONS]
+        if unknown:
+            return Response(
+                {"detail": f"Unknown section(s): {', '.join(unknown)}. Choose from {', '.join(DASHBOARD_SECTIONS)}."},
+                status=400,
+            )
+    else:
+        sections = list(DASHBOARD_SECTIONS)
+
+    # the enrollment row is always read: it decides between 200 and 404
+    fetched = sections if "enrollment" in sections else ["enrollment"] + sections
+    queries = [_dashboard_query(name, enrollment_id) for name in fetched]
+    results = fetch_many([(sql, params) for sql, params, _ in queries], prepared=True)
+
+    data = {"enrollment_id": enrollment_id}
+    for name, (_, _, finish), rows in zip(fetched, queries, results):
+        data[name] = finish(rows)
+
+    if data["enrollment"] is None:
+        return Response({"detail": "Not found"}, status=404)
+    if "enrollment" not in sections:
+        del data["enrollment"]
+    return Response(data)
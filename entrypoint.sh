@@ -10,5 +10,11 @@ fi
 
 python manage.py collectstatic --noinput
 
+# ASYNC_API=true: ASGI (uvicorn) workers, raw-table reads served by the async views
+if [ "${ASYNC_API,,}" = "true" ] || [ "${ASYNC_API}" = "1" ]; then
+  exec gunicorn lms_backend.asgi:application --worker-class uvicorn_worker.UvicornWorker \
+    --workers 3 --bind 0.0.0.0:8080 --log-level=info
+fi
+
 exec gunicorn lms_backend.wsgi:application --workers 3 --bind 0.0.0.0:8080 --log-level=info
     
\ No newline at end of file
@@ -70,17 +70,44 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # -----------------------
 MIDDLEWARE = [
+    "api.timing.ServerTimingMiddleware",  # first, so "total" covers the whole stack
+    "api.compression.CompressionMiddleware",  # inside the timer, which reports its cost
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",  # serve static files
+    "api.async_views.StaticFilesMiddleware",  # whitenoise; async-capable for ASGI workers
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api.querylog.QueryShapeMiddleware",  # no-op unless QUERY_RECORDER_DIR is set
 ]
 
+# Query-shape recorder feeding `manage.py advise_indexes` (api/querylog.py).
+QUERY_RECORDER_DIR = os.getenv("QUERY_RECORDER_DIR") or None
+QUERY_RECORDER_SAMPLE_RATE = float(os.getenv("QUERY_RECORDER_SAMPLE_RATE", "1.0"))
+QUERY_RECORDER_FLUSH_EVERY = int(os.getenv("QUERY_RECORDER_FLUSH_EVERY", "50"))
+
+# Per-view query budgets (api/timing.py): views set `query_budget`; this applies to
+# views that don't. Over-budget requests are logged, or raise when QUERY_BUDGET_RAISE.
+QUERY_BUDGET_DEFAULT = int(os.environ["QUERY_BUDGET_DEFAULT"]) if os.getenv("QUERY_BUDGET_DEFAULT") else None
+QUERY_BUDGET_RAISE = os.getenv("QUERY_BUDGET_RAISE", "false").lower() in ("1", "true", "yes")
+
+# Response compression (api/compression.py): gzip, plus zstd / br when the zstandard /
+# brotli packages are installed; bodies smaller than API_COMPRESSION_MIN_SIZE go out as-is.
+API_COMPRESSION = os.getenv("API_COMPRESSION", "true").lower() in ("1", "true", "yes")
+API_COMPRESSION_MIN_SIZE = int(os.getenv("API_COMPRESSION_MIN_SIZE", "1024"))
+API_COMPRESSION_LEVELS = {
+    "gzip": int(os.getenv("API_COMPRESSION_GZIP_LEVEL", "6")),
+    "br": int(os.getenv("API_COMPRESSION_BROTLI_LEVEL", "4")),
+    "zstd": int(os.getenv("API_COMPRESSION_ZSTD_LEVEL", "3")),
+}
+
+# Render ORM list pages from values_list() rows instead of per-instance serializers
+# (api/fastpath.py); the JSON is identical, so this is only a kill switch.
+API_FAST_READS = os.getenv("API_FAST_READS", "true").lower() in ("1", "true", "yes")
+
 # -----------------------
 # URLS & WSGI/ASGI
 # -----------------------
@@ -117,6 +144,98 @@ DATABASES = {
     )
 }
 
+# Postgres connection pools (psycopg_pool): Django's native pool for sync code,
+# one AsyncConnectionPool per event loop for the async views (api/aio.py).
+# Sized per worker process; stats at GET /api/db/pool/ (admin).
+DB_POOL = os.getenv("DB_POOL", "true").lower() in ("1", "true", "yes")
+DB_POOL_OPTIONS = {
+    "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "1")),
+    "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "4")),
+    # seconds a checkout may wait for a free connection before failing
+    "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    # idle connections above min_size are closed after this many seconds
+    "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+    # connections are recycled after this many seconds
+    "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+}
+if DB_POOL and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"].update({
+        # Django's backend + checkout wait metrics (api/dbpool.py)
+        "ENGINE": "api.backends.postgresql",
+        # pooled connections go back to the pool at the end of each request
+        "CONN_MAX_AGE": 0,
+        # ping every connection as it is checked out of the pool
+        "CONN_HEALTH_CHECKS": True,
+    })
+    DATABASES["default"].setdefault("OPTIONS", {})["pool"] = {**DB_POOL_OPTIONS, "name": "sync"}
+
+# Protocol-level prepared statements for the hot per-key lookups (api/statements.py).
+# Transaction-mode poolers track these (PgBouncer >= 1.21 with max_prepared_statements,
+# Neon's -pooler endpoint); turn off behind an older PgBouncer.
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+# statements kept prepared per connection; the least recently used are deallocated
+DB_PREPARED_STATEMENTS_MAX = int(os.getenv("DB_PREPARED_STATEMENTS_MAX", "200"))
+
+# -----------------------
+# CACHES
+# -----------------------
+# "api" holds cached API responses (api/cache.py). locmem evicts least-recently-used
+# entries once API_CACHE_MAX_ENTRIES is reached; "file" shares entries between workers.
+# "api_versions" holds the invalidation counters and must be shared by every worker
+# and by `manage.py invalidate_api_cache`, hence a file-based cache that never culls
+# and increments under a file lock by default.
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "counters": "api.cache.CounterFileCache",
+}
+API_CACHE_TTL = int(os.getenv("API_CACHE_TTL", "300"))
+API_CACHE_ALIAS = "api"
+API_CACHE_VERSION_ALIAS = "api_versions"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "api": {
+        "BACKEND": CACHE_BACKENDS[os.getenv("API_CACHE_BACKEND", "locmem")],
+        "LOCATION": os.getenv("API_CACHE_LOCATION", "lms-api"),
+        "TIMEOUT": API_CACHE_TTL,
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("API_CACHE_MAX_ENTRIES", "5000"))},
+    },
+    "api_versions": {
+        "BACKEND": CACHE_BACKENDS[os.getenv("API_CACHE_VERSION_BACKEND", "counters")],
+        "LOCATION": os.getenv("API_CACHE_VERSION_LOCATION", "/tmp/lms-api-cache-versions"),
+        "TIMEOUT": None,
+    },
+}
+
+# Worker-local grade-boundary index (api/grading.py): rebuilt when the table's
+# cache version is bumped, and at the latest after this many seconds.
+GRADE_BOUNDARY_INDEX_TTL = int(os.getenv("GRADE_BOUNDARY_INDEX_TTL", "300"))
+# max tuples per POST /api/grading/lookup/
+GRADING_LOOKUP_LIMIT = int(os.getenv("GRADING_LOOKUP_LIMIT", "10000"))
+# Worker-local token-blacklist filter (api/blacklist.py): re-read when a token is
+# blacklisted (cache version bump), and at the latest after this many seconds;
+# the Bloom filter's false-positive rate (each one costs a confirming query).
+TOKEN_BLACKLIST_REFRESH = int(os.getenv("TOKEN_BLACKLIST_REFRESH", "30"))
+# how often a worker re-reads the blacklist's cache version, and the longest a
+# token blacklisted elsewhere can still pass (a clean answer from an older
+# filter refreshes it first)
+TOKEN_BLACKLIST_VERSION_CHECK = float(os.getenv("TOKEN_BLACKLIST_VERSION_CHECK", "1"))
+TOKEN_BLACKLIST_MAX_STALENESS = float(os.getenv("TOKEN_BLACKLIST_MAX_STALENESS", "5"))
+TOKEN_BLACKLIST_FALSE_POSITIVE = float(os.getenv("TOKEN_BLACKLIST_FALSE_POSITIVE", "0.001"))
+# Cohort analytics reports (api/analytics.py) are dropped when subjects /
+# enrollments are invalidated, and at the latest after this many seconds.
+API_ANALYTICS_TTL = int(os.getenv("API_ANALYTICS_TTL", "3600"))
+# `manage.py ingest` / POST /api/ingest/<table>/ (api/ingest.py): how long the
+# swap may wait for readers of the old table before retrying, in ms
+INGEST_LOCK_TIMEOUT_MS = int(os.getenv("INGEST_LOCK_TIMEOUT_MS", "5000"))
+
+# Serve the raw tables' GET routes + health with the async views (api/async_views.py);
+# set together with the ASGI worker in entrypoint.sh.
+ASYNC_API = os.getenv("ASYNC_API", "false").lower() in ("1", "true", "yes")
+
 # -----------------------
 # AUTH
 # -----------------------
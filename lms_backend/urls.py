@@ -3,6 +3,7 @@ from django.urls import path, include
 # from LMS_users.views import choose_login
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from api.blacklist import TokenRefreshSerializer
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -14,7 +15,8 @@ urlpatterns = [
 
     # JWT authentication (admin/staff only for writes)
     path("api/token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    # blacklist checks answered from the worker's in-memory filter (api/blacklist.py)
+    path("api/token/refresh/", TokenRefreshView.as_view(serializer_class=TokenRefreshSerializer), name="token_refresh"),
 
     # OpenAPI schema + docs
     path("api/schema/", SpectacularAPIView.as_view(), name="api-schema"),